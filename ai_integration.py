@@ -36,7 +36,7 @@ class AIRecipeGenerator:
                 self.available = True
                 logger.info("✅ AI Recipe Generator initialized successfully")
             except Exception as e:
-                logger.error(f"❌ Error initializing Claude client: {e}")
+                logger.error("❌ Error initializing Claude client: %s", e)
                 self.client = None
                 self.available = False
         else:
@@ -96,7 +96,7 @@ class AIRecipeGenerator:
             validation_result = self.prompt_system.validate_prompt_response(response_text)
             
             if not validation_result["valid"]:
-                logger.error(f"❌ Invalid response format: {validation_result['error']}")
+                logger.error("❌ Invalid response format: %s", validation_result['error'])
                 
                 # Intentar con prompt de fallback
                 return self._generate_fallback_recipe(user_profile, request_data, validation_result["error"])
@@ -130,11 +130,11 @@ class AIRecipeGenerator:
             # Guardar en cache si es exitoso
             self._cache_result(cache_key, result)
             
-            logger.info(f"✅ Recipe generated successfully. Validation score: {recipe_validation['overall_score']}/100")
+            logger.info("✅ Recipe generated successfully. Validation score: %s/100", recipe_validation['overall_score'])
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error generating recipe: {str(e)}")
+            logger.error("❌ Error generating recipe: %s", e)
             return {
                 "success": False,
                 "error": f"API error: {str(e)}",
@@ -165,7 +165,7 @@ class AIRecipeGenerator:
                 return self.recipe_cache[cache_key]
             
             # Llamada a Claude API
-            logger.info(f"🔍 Searching recipes for: '{search_query}'")
+            logger.info("🔍 Searching recipes for: '%s'", search_query)
             response = self.client.messages.create(
                 model=self.model,
                 max_tokens=self.max_tokens,
@@ -218,11 +218,11 @@ class AIRecipeGenerator:
             # Guardar en cache
             self._cache_result(cache_key, final_result)
             
-            logger.info(f"✅ Search completed. Found {len(validated_results)} valid recipes")
+            logger.info("✅ Search completed. Found %s valid recipes", len(validated_results))
             return final_result
             
         except Exception as e:
-            logger.error(f"❌ Error in recipe search: {str(e)}")
+            logger.error("❌ Error in recipe search: %s", e)
             return {
                 "success": False,
                 "error": f"Search error: {str(e)}",
@@ -287,11 +287,11 @@ class AIRecipeGenerator:
             if not menu_validation["valid"]:
                 result["error"] = f"Menu validation failed: {menu_validation['error']}"
             
-            logger.info(f"✅ Weekly menu generated. Valid: {menu_validation['valid']}")
+            logger.info("✅ Weekly menu generated. Valid: %s", menu_validation['valid'])
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error generating weekly menu: {str(e)}")
+            logger.error("❌ Error generating weekly menu: %s", e)
             return {
                 "success": False,
                 "error": f"Menu generation error: {str(e)}",
@@ -338,7 +338,7 @@ class AIRecipeGenerator:
                 return self._create_emergency_recipe(request_data)
                 
         except Exception as e:
-            logger.error(f"❌ Fallback generation error: {str(e)}")
+            logger.error("❌ Fallback generation error: %s", e)
             return self._create_emergency_recipe(request_data)
     
     def _regenerate_with_feedback(self, user_profile: Dict, request_data: Dict, validation_result: Dict) -> Dict:
@@ -392,7 +392,7 @@ GENERA UNA NUEVA RECETA que resuelva estos problemas manteniendo todos los demá
                 return self._create_emergency_recipe(request_data)
                 
         except Exception as e:
-            logger.error(f"❌ Regeneration error: {str(e)}")
+            logger.error("❌ Regeneration error: %s", e)
             return self._create_emergency_recipe(request_data)
     
     def _create_emergency_recipe(self, request_data: Dict) -> Dict:
@@ -571,7 +571,7 @@ GENERA UNA NUEVA RECETA que resuelva estos problemas manteniendo todos los demá
                 cache_key = None
             
             # Llamada a Claude API
-            logger.info(f"🤖 Generating {num_options} recipe options with Claude API...")
+            logger.info("🤖 Generating %s recipe options with Claude API...", num_options)
             response = self.client.messages.create(
                 model=self.model,
                 max_tokens=8000,  # Más tokens para múltiples recetas
@@ -624,15 +624,15 @@ GENERA UNA NUEVA RECETA que resuelva estos problemas manteniendo todos los demá
                                 }
                             })
                         else:
-                            logger.warning(f"⚠️ Option {i+1} failed validation with score {recipe_validation['overall_score']}")
+                            logger.warning("⚠️ Option %s failed validation with score %s", i+1, recipe_validation['overall_score'])
                     
                 except Exception as e:
-                    logger.error(f"❌ Error validating option {i+1}: {str(e)}")
+                    logger.error("❌ Error validating option %s: %s", i+1, e)
                     continue
             
             # Verificar que tenemos suficientes opciones válidas
             if len(validated_options) < 2:
-                logger.warning(f"⚠️ Only {len(validated_options)} valid options generated, trying fallback")
+                logger.warning("⚠️ Only %s valid options generated, trying fallback", len(validated_options))
                 return self._fallback_multiple_recipes(user_profile, request_data, num_options)
             
             result = {
@@ -656,11 +656,11 @@ GENERA UNA NUEVA RECETA que resuelva estos problemas manteniendo todos los demá
             else:
                 logger.info("🔄 Not caching 'more options' result")
             
-            logger.info(f"✅ Generated {len(validated_options)} valid recipe options successfully")
+            logger.info("✅ Generated %s valid recipe options successfully", len(validated_options))
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error generating multiple recipes: {str(e)}")
+            logger.error("❌ Error generating multiple recipes: %s", e)
             return {
                 "success": False,
                 "error": f"API error: {str(e)}",
@@ -672,7 +672,7 @@ GENERA UNA NUEVA RECETA que resuelva estos problemas manteniendo todos los demá
         """
         Generar múltiples recetas usando el método de una sola receta repetidamente
         """
-        logger.info(f"🔄 Attempting fallback generation for {num_options} recipes...")
+        logger.info("🔄 Attempting fallback generation for %s recipes...", num_options)
         
         validated_options = []
         attempts = 0
@@ -704,10 +704,10 @@ GENERA UNA NUEVA RECETA que resuelva estos problemas manteniendo todos los demá
                     recipe_names = [opt["recipe"]["nombre"] for opt in validated_options]
                     if single_result["recipe"]["nombre"] not in recipe_names:
                         validated_options.append(option)
-                        logger.info(f"✅ Fallback option {len(validated_options)} generated")
+                        logger.info("✅ Fallback option %s generated", len(validated_options))
                     
             except Exception as e:
-                logger.error(f"❌ Fallback attempt {attempts} failed: {str(e)}")
+                logger.error("❌ Fallback attempt %s failed: %s", attempts, e)
                 continue
         
         if len(validated_options) == 0:
@@ -809,7 +809,7 @@ def format_recipe_for_display(recipe: Dict, validation: Dict) -> str:
         return formatted
         
     except Exception as e:
-        logger.error(f"Error formatting recipe for display: {e}")
+        logger.error("Error formatting recipe for display: %s", e)
         return f"**Error mostrando receta:** {str(e)}"
 
 def escape_markdown_v2(text: str) -> str:
@@ -931,7 +931,7 @@ def format_multiple_recipes_for_display(multiple_result: Dict, timing_category:
         return formatted
         
     except Exception as e:
-        logger.error(f"Error formatting multiple recipes for display: {e}")
+        logger.error("Error formatting multiple recipes for display: %s", e)
         # Fallback a formato simple sin markdown si hay error
         try:
             options = multiple_result.get("options", [])
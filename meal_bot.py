@@ -7,11 +7,22 @@ Integra todos los sistemas nuevos: categorías duales, Available Energy, generac
 
 import json
 import os
+import re
 import logging
+import itertools
+import threading
+import time
+import shutil
+import signal
 import fcntl
 import atexit
+from bisect import bisect_right
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
+from functools import lru_cache, wraps
+from operator import itemgetter
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator, NamedTuple, Callable
 
 import telebot
 from telebot import types
@@ -19,10 +30,10 @@ from anthropic import Anthropic
 from flask import Flask, request
 
 # Importar nuevos sistemas
-from user_profile_system import UserProfileSystem
+from user_profile_system import UserProfileSystem, recent_generated_recipes, find_recent_generated_recipe
 from claude_prompt_system import ClaudePromptSystem
 from recipe_validator import RecipeValidator
-from ai_integration import AIRecipeGenerator, format_recipe_for_display
+from ai_integration import AIRecipeGenerator, format_recipe_for_display, format_multiple_recipes_for_display
 from menu_display_system import format_menu_for_telegram
 from shopping_list_generator import ShoppingListGenerator
 from weekly_planner import WeeklyPlanner
@@ -31,6 +42,9 @@ from progress_tracker import ProgressTracker
 from meal_prep_scheduler import MealPrepScheduler
 from nutrition_analytics import NutritionAnalytics
 from weekly_menu_system import WeeklyMenuSystem
+from message_dispatcher import (
+    MessageDispatcher, retry_after_seconds, PRIORITY_CALLBACK, PRIORITY_COMMAND, PRIORITY_BULK
+)
 
 from config import (
     TELEGRAM_TOKEN, ANTHROPIC_API_KEY, WEBHOOK_URL, WEBHOOK_PATH, USE_WEBHOOK
@@ -47,14 +61,154 @@ logger = logging.getLogger(__name__)
 bot = telebot.TeleBot(TELEGRAM_TOKEN)
 app = Flask(__name__)
 
+# Envíos a Telegram fuera del hilo del handler (orden preservado por chat)
+dispatcher = MessageDispatcher()
+
+# Trabajos largos (IA, informes) fuera del hilo que procesa las updates
+background_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="bg-work")
+
+def send_dedupe_key(text: str, kwargs: Dict) -> Tuple:
+    """
+    Clave de deduplicación de un envío: el texto y todas sus opciones.
+    Los teclados se comparan por su JSON, así el mismo texto con otros
+    botones (o sin ellos) no se confunde con un envío repetido.
+    """
+    options = tuple(sorted(
+        (name, value.to_json() if hasattr(value, 'to_json') else value)
+        for name, value in kwargs.items()
+    ))
+    return (text, options)
+
+def enqueue_send(chat_id, text: str, priority: int = PRIORITY_COMMAND, dedupe: bool = True, **kwargs):
+    """
+    Encolar bot.send_message; devuelve un Future con el mensaje enviado.
+    Un envío idéntico (texto y opciones) al mismo chat en menos de 500ms se hace una sola vez.
+    Los mensajes 'procesando...' que luego se editan o borran usan dedupe=False:
+    con un Future compartido, dos pulsaciones editarían o borrarían el mismo mensaje.
+    """
+    dedupe_key = send_dedupe_key(text, kwargs) if dedupe else None
+    return dispatcher.submit(
+        chat_id, bot.send_message, chat_id, text,
+        priority=priority, dedupe_key=dedupe_key, **kwargs
+    )
+
+def enqueue_delete(chat_id, sent_message: Future, priority: int = PRIORITY_COMMAND) -> Future:
+    """
+    Encolar el borrado de un mensaje cuyo envío aún puede estar pendiente.
+    La cola del chat es FIFO, así que cuando se ejecuta el envío ya terminó
+    y el handler no tiene que esperar a Telegram para obtener el message_id.
+    Si el mensaje ya no existe (o no llegó a enviarse) se ignora.
+    """
+    def delete():
+        try:
+            bot.delete_message(chat_id, sent_message.result().message_id)
+        except Exception as e:
+            logger.debug("Could not delete message in chat %s: %s", chat_id, e)
+    
+    return dispatcher.submit(chat_id, delete, priority=priority)
+
+def enqueue_edit(chat_id, message_id: int, text: str, priority: int = PRIORITY_COMMAND, **kwargs) -> Future:
+    """
+    Encolar bot.edit_message_text detrás de los envíos pendientes del chat,
+    con el mismo límite global y la misma espera ante 429 que los envíos
+    """
+    return dispatcher.submit(
+        chat_id, bot.edit_message_text, text, chat_id, message_id,
+        priority=priority, **kwargs
+    )
+
+def log_background_error(future: Future):
+    """Registrar excepciones de trabajos en segundo plano (si no, se perderían en el Future)"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Error in background task: %s", future.exception())
+
+def run_in_background(func: Callable, *args, **kwargs) -> Future:
+    """
+    Ejecutar una llamada lenta (IA, informes) en el pool de segundo plano.
+    El handler vuelve enseguida y la actualización siguiente no espera a la IA;
+    la propia tarea envía el resultado con enqueue_send.
+    """
+    future = background_executor.submit(func, *args, **kwargs)
+    future.add_done_callback(log_background_error)
+    return future
+
+def safe_callback(error_text: str = "❌ Error procesando acción"):
+    """
+    Decorador para callbacks: registra cualquier excepción y responde al
+    callback con error_text, en lugar de repetir el try/except en cada handler
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(call, *args, **kwargs):
+            try:
+                return handler(call, *args, **kwargs)
+            except Exception as e:
+                logger.error("Error in %s: %s", handler.__name__, e)
+                bot.answer_callback_query(call.id, error_text)
+        return wrapper
+    return decorator
+
+# Rutas de callbacks: primer segmento de call.data -> [(prefijo o valor exacto, exacto, handler)]
+CALLBACK_ROUTES: Dict[str, List[Tuple[str, bool, Callable]]] = {}
+
+def callback_route(prefix: str, exact: bool = False):
+    """
+    Decorador para registrar un handler de callback cuando call.data empieza
+    por prefix (o es exactamente prefix si exact=True).
+    """
+    def decorator(handler):
+        CALLBACK_ROUTES.setdefault(prefix.partition('_')[0], []).append((prefix, exact, handler))
+        return handler
+    return decorator
+
+@bot.callback_query_handler(func=lambda call: True)
+def dispatch_callback(call):
+    """
+    Único handler de callbacks registrado en telebot: en vez de evaluar un
+    filtro por handler, se buscan solo las rutas del primer segmento de call.data
+    """
+    data = call.data or ""
+    for prefix, exact, handler in CALLBACK_ROUTES.get(data.partition('_')[0], ()):
+        if data == prefix if exact else data.startswith(prefix):
+            return handler(call)
+
+class MockChat(NamedTuple):
+    id: int
+
+class MockUser(NamedTuple):
+    id: int
+
+class MockMessage(NamedTuple):
+    """Mensaje simulado para reutilizar handlers de comandos desde callbacks"""
+    chat: MockChat
+    from_user: MockUser
+    text: str = ""
+
+def mock_message_from_call(call, text: str = "") -> MockMessage:
+    """Construir un MockMessage con el chat y el usuario de un callback"""
+    return MockMessage(MockChat(call.message.chat.id), MockUser(call.from_user.id), text)
+
+@lru_cache(maxsize=None)
+def get_bot_username() -> str:
+    """Username del bot; no cambia en ejecución, así que get_me se llama una sola vez"""
+    return bot.get_me().username
+
 # Inicializar Claude client
 try:
     claude_client = Anthropic(api_key=ANTHROPIC_API_KEY)
     logger.info("✅ Claude client initialized successfully")
 except Exception as e:
-    logger.error(f"❌ Error initializing Claude client: {e}")
+    logger.error("❌ Error initializing Claude client: %s", e)
     claude_client = None
 
+# Vigencia de cronogramas y análisis cacheados (segundos)
+SCHEDULE_CACHE_TTL = 24 * 60 * 60
+ANALYSIS_CACHE_TTL = 6 * 60 * 60
+
+# Intentos de escritura del guardado pendiente al parar el bot (y espera entre ellos, en segundos)
+SHUTDOWN_SAVE_ATTEMPTS = 3
+SHUTDOWN_SAVE_RETRY_DELAY = 1.0
+
 class MealPrepBotV2:
     def __init__(self):
         self.database_file = "recipes_new.json"
@@ -80,6 +234,35 @@ class MealPrepBotV2:
         # Estado de conversación por usuario
         self.user_states = {}
         
+        # Caché de recetas guardadas por usuario (se invalida al guardar su perfil)
+        self.saved_recipes_cache = {}
+        
+        # Textos renderizados por usuario -> {vista: texto} (se invalida al guardar su perfil)
+        self.rendered_text_cache = {}
+        
+        # Cronogramas/análisis por usuario -> {(tipo, parámetros): (instante, resultado)}
+        # Se invalida al guardar el perfil del usuario y caduca tras el TTL de cada tipo
+        self.analysis_cache = {}
+        
+        # Versión de las cachés de cada usuario: un resultado calculado mientras
+        # se guardaba el perfil no se almacena, porque ya estaría obsoleto
+        self.cache_versions = defaultdict(int)
+        self.cache_lock = threading.Lock()
+        
+        # Guardado diferido: las ráfagas de cambios se escriben en un solo save_data
+        self.save_delay = 0.5
+        self.save_timer = None
+        self.save_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        
+        # Protege self.data: toda modificación de un perfil y su serialización
+        # en disco se hacen con este lock (reentrante: save_user_profile lo toma
+        # también dentro de bloques que ya lo tienen)
+        self.data_lock = threading.RLock()
+        
+        # Teclado principal: es igual para todos los usuarios, se construye una vez
+        self.main_menu_keyboard = self._build_main_menu_keyboard()
+        
         logger.info("🚀 MealPrepBot V2.0 initialized with new architecture")
     
     def load_data(self) -> Dict:
@@ -88,10 +271,10 @@ class MealPrepBotV2:
             with open(self.database_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except FileNotFoundError:
-            logger.error(f"No se encontró {self.database_file}")
+            logger.error("No se encontró %s", self.database_file)
             return self.create_default_data()
         except json.JSONDecodeError:
-            logger.error(f"Error al leer {self.database_file}")
+            logger.error("Error al leer %s", self.database_file)
             return self.create_default_data()
     
     def create_default_data(self) -> Dict:
@@ -101,48 +284,159 @@ class MealPrepBotV2:
     
     def save_data(self) -> bool:
         """Guardar datos con backup automático"""
+        with self.write_lock:
+            return self._write_data()
+    
+    def _write_data(self) -> bool:
+        """Escribir backup y base de datos en disco (llamar con write_lock)"""
         try:
             # Crear backup
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_file = f"backup_v2_{timestamp}.json"
             
+            # Copia directa del fichero: no hace falta parsear y volver a serializar
             if os.path.exists(self.database_file):
-                with open(self.database_file, 'r', encoding='utf-8') as f:
-                    backup_data = json.load(f)
-                with open(backup_file, 'w', encoding='utf-8') as f:
-                    json.dump(backup_data, f, ensure_ascii=False, indent=2)
-            
-            # Guardar datos actuales
-            with open(self.database_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
+                shutil.copyfile(self.database_file, backup_file)
+            
+            # Serializar una instantánea bajo data_lock: los perfiles solo se modifican
+            # con ese lock, así que no cambian mientras el encoder los recorre
+            with self.data_lock:
+                content = json.dumps(self.data, ensure_ascii=False, indent=2)
+            
+            # Escribir en un temporal del mismo directorio y sustituir de forma atómica,
+            # para que un fallo a mitad de escritura no deje la base de datos truncada
+            tmp_file = f"{self.database_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.database_file)
             
             return True
         except Exception as e:
-            logger.error(f"Error al guardar datos: {e}")
+            logger.error("Error al guardar datos: %s", e)
             return False
     
+    def schedule_save(self):
+        """Programar un save_data diferido; los cambios dentro de la ventana se escriben juntos"""
+        with self.save_lock:
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(self.save_delay, self.flush_pending_save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+    
+    def flush_pending_save(self) -> bool:
+        """Escribir ahora el guardado pendiente, si lo hay"""
+        with self.save_lock:
+            timer = self.save_timer
+            self.save_timer = None
+        
+        if timer is None:
+            return True
+        
+        timer.cancel()
+        saved = self.save_data()
+        if not saved:
+            # Los cambios siguen solo en memoria: reintentar en la próxima ventana
+            self.schedule_save()
+        return saved
+    
     def get_user_profile(self, telegram_id: str) -> Optional[Dict]:
         """Obtener perfil de usuario por Telegram ID"""
         return self.data["users"].get(telegram_id)
     
-    def save_generated_recipe(self, telegram_id: str, recipe: Dict, timing_category: str, validation: Dict) -> bool:
-        """Guardar receta generada en el perfil del usuario"""
-        try:
-            user_profile = self.get_user_profile(telegram_id)
-            if not user_profile:
-                return False
-            
+    def save_user_profile(self, telegram_id: str, user_profile: Dict):
+        """Actualizar perfil en memoria y programar su guardado en disco"""
+        with self.data_lock:
+            self.data["users"][telegram_id] = user_profile
+        # Las cachés derivadas del perfil se invalidan ya, aunque la escritura se retrase
+        self.invalidate_user_caches(telegram_id)
+        self.schedule_save()
+    
+    def invalidate_user_caches(self, telegram_id: str):
+        """Descartar solo las cachés del usuario; las del resto siguen siendo válidas"""
+        with self.cache_lock:
+            self.cache_versions[telegram_id] += 1
+            self.saved_recipes_cache.pop(telegram_id, None)
+            self.rendered_text_cache.pop(telegram_id, None)
+            self.analysis_cache.pop(telegram_id, None)
+    
+    def get_user_saved_recipes(self, telegram_id: str, user_profile: Dict) -> Dict[str, List[Dict]]:
+        """Obtener recetas guardadas por categoría, cacheadas hasta que cambie el perfil"""
+        with self.cache_lock:
+            recipes_by_category = self.saved_recipes_cache.get(telegram_id)
+            version = self.cache_versions[telegram_id]
+        
+        if recipes_by_category is None:
+            recipes_by_category = self.weekly_menu_system.get_user_saved_recipes(user_profile)
+            with self.cache_lock:
+                if self.cache_versions[telegram_id] == version:
+                    self.saved_recipes_cache[telegram_id] = recipes_by_category
+        return recipes_by_category
+    
+    def get_rendered_text(self, telegram_id: str, view: str, render_func, *args) -> str:
+        """Obtener texto de una vista del usuario, renderizado solo si cambió el perfil"""
+        with self.cache_lock:
+            text = self.rendered_text_cache.get(telegram_id, {}).get(view)
+            version = self.cache_versions[telegram_id]
+        
+        if text is None:
+            text = render_func(*args)
+            with self.cache_lock:
+                if self.cache_versions[telegram_id] == version:
+                    self.rendered_text_cache.setdefault(telegram_id, {})[view] = text
+        return text
+    
+    def get_cache_version(self, telegram_id: str) -> int:
+        """Versión actual de las cachés del usuario (leer antes de calcular un resultado)"""
+        with self.cache_lock:
+            return self.cache_versions[telegram_id]
+    
+    def get_cached_result(self, telegram_id: str, kind: str, params: str, ttl: float) -> Optional[Dict]:
+        """Obtener un cronograma/análisis ya calculado si el perfil no cambió y no ha caducado"""
+        with self.cache_lock:
+            cached = self.analysis_cache.get(telegram_id, {}).get((kind, params))
+        if cached is None or time.monotonic() - cached[0] >= ttl:
+            return None
+        return cached[1]
+    
+    def store_cached_result(self, telegram_id: str, kind: str, params: str, result: Dict, version: int):
+        """
+        Guardar un cronograma/análisis calculado; los resultados con error no se cachean.
+        version es la de get_cache_version antes de calcular: si el perfil se guardó
+        entretanto, el resultado ya está obsoleto y se descarta.
+        """
+        if not result.get("success"):
+            return
+        with self.cache_lock:
+            if self.cache_versions[telegram_id] == version:
+                self.analysis_cache.setdefault(telegram_id, {})[(kind, params)] = (time.monotonic(), result)
+    
+    def save_generated_recipe(self, telegram_id: str, recipe: Dict, timing_category: str, validation: Dict):
+        """
+        Añadir una receta generada al perfil del usuario (que debe existir).
+        La escritura en disco es diferida, así que no hay resultado que devolver:
+        si falla, flush_pending_save la reprograma.
+        """
+        user_profile = self.get_user_profile(telegram_id)
+        
+        with self.data_lock:
             # Inicializar lista de recetas si no existe
             if "generated_recipes" not in user_profile:
                 user_profile["generated_recipes"] = []
             
-            # Crear entrada de receta con metadata
+            # Crear entrada de receta con metadata (ID y fecha del mismo instante).
+            # Con microsegundos, dos recetas guardadas en el mismo segundo no comparten ID;
+            # el callback más largo (rate_recipe_/fav_remove_ + ID de 16 dígitos + 22)
+            # sigue muy por debajo de los 64 bytes de callback_data
+            now = datetime.now()
             recipe_entry = {
-                "id": f"{telegram_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                "generated_date": datetime.now().isoformat(),
+                "id": f"{telegram_id}_{now.strftime('%Y%m%d_%H%M%S_%f')}",
+                "generated_date": now.isoformat(),
                 "timing_category": timing_category,
                 "recipe_data": recipe,
                 "validation_score": validation.get("score", 0),
+                "validation": validation,
                 "user_rating": None  # Para futuras mejoras
             }
             
@@ -150,53 +444,50 @@ class MealPrepBotV2:
             user_profile["generated_recipes"].insert(0, recipe_entry)
             
             # Mantener solo las últimas 20 recetas por usuario
-            if len(user_profile["generated_recipes"]) > 20:
-                user_profile["generated_recipes"] = user_profile["generated_recipes"][:20]
-            
-            # También guardar en recent_generated_recipes para sistema de valoración
-            if "recent_generated_recipes" not in user_profile:
-                user_profile["recent_generated_recipes"] = []
+            del user_profile["generated_recipes"][20:]
             
-            # Agregar receta con ID único para valoración
-            recipe_for_rating = recipe.copy()
-            recipe_for_rating["recipe_id"] = recipe_entry["id"] 
-            recipe_for_rating["generated_at"] = recipe_entry["generated_date"]
-            recipe_for_rating["categoria_timing"] = timing_category  # ¡CRÍTICO: Agregar timing category!
+            # Recetas para valoración: solo IDs, se reconstruyen con recent_generated_recipes()
+            if "recent_ids" not in user_profile:
+                legacy_recent = user_profile.pop("recent_generated_recipes", [])
+                user_profile["recent_ids"] = [
+                    item["recipe"]["recipe_id"] for item in legacy_recent
+                    if isinstance(item, dict) and item.get("recipe", {}).get("recipe_id")
+                ]
             
-            user_profile["recent_generated_recipes"].append({
-                "recipe": recipe_for_rating,
-                "timing_category": timing_category,
-                "validation": validation,
-                "generated_date": recipe_entry["generated_date"]
-            })
+            user_profile["recent_ids"].append(recipe_entry["id"])
             
             # Mantener solo las últimas 10 recetas para valoración
-            if len(user_profile["recent_generated_recipes"]) > 10:
-                user_profile["recent_generated_recipes"] = user_profile["recent_generated_recipes"][-10:]
+            del user_profile["recent_ids"][:-10]
             
-            # Guardar cambios
-            self.data["users"][telegram_id] = user_profile
-            return self.save_data()
-            
-        except Exception as e:
-            logger.error(f"Error saving generated recipe for user {telegram_id}: {e}")
-            return False
+            # Guardar cambios (escritura diferida junto con el resto de la ráfaga)
+            self.save_user_profile(telegram_id, user_profile)
     
     def create_user_if_not_exists(self, telegram_id: str, message) -> bool:
         """Crear usuario si no existe y redirigir a setup de perfil"""
-        if telegram_id not in self.data["users"]:
-            bot.send_message(
+        return self.require_user_profile(telegram_id, message) is not None
+    
+    def require_user_profile(self, telegram_id: str, message) -> Optional[Dict]:
+        """
+        Obtener perfil con una sola búsqueda; si no existe, redirigir a setup
+        de perfil y devolver None
+        """
+        user_profile = self.data["users"].get(telegram_id)
+        if user_profile is None:
+            enqueue_send(
                 message.chat.id,
                 "👋 ¡Bienvenido al Meal Prep Bot V2.0!\n\n"
                 "Para comenzar, necesito configurar tu perfil nutricional personalizado.\n"
                 "Usa el comando /perfil para empezar.",
                 reply_markup=self.create_main_menu_keyboard()
             )
-            return False
-        return True
+        return user_profile
     
     def create_main_menu_keyboard(self) -> types.ReplyKeyboardMarkup:
-        """Crear teclado principal con comandos disponibles"""
+        """Obtener teclado principal con comandos disponibles"""
+        return self.main_menu_keyboard
+    
+    def _build_main_menu_keyboard(self) -> types.ReplyKeyboardMarkup:
+        """Construir teclado principal con comandos disponibles"""
         keyboard = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
         
         buttons = [
@@ -231,41 +522,402 @@ class MealPrepBotV2:
         
         return messages
     
-    def send_long_message(self, chat_id: int, text: str, **kwargs):
-        """Enviar mensaje largo dividiéndolo si es necesario"""
+    def send_long_message(self, chat_id: int, text: str, priority: int = PRIORITY_COMMAND,
+                          final_reply_markup=None, **kwargs):
+        """
+        Enviar mensaje largo dividiéndolo si es necesario.
+        final_reply_markup va en el último fragmento, para no tener que enviar
+        un mensaje aparte solo con los botones de acción.
+        """
         messages = self.split_long_message(text)
+        last_index = len(messages) - 1
+        for i, msg in enumerate(messages):
+            send_kwargs = kwargs if i == 0 else {'parse_mode': kwargs.get('parse_mode')}
+            if i == last_index and final_reply_markup is not None:
+                send_kwargs = dict(send_kwargs, reply_markup=final_reply_markup)
+            enqueue_send(chat_id, msg, priority=priority, **send_kwargs)
+    
+    def pack_message_chunks(self, fragments: Iterable[str], max_length: int = 4000) -> Iterator[str]:
+        """Agrupar fragmentos de texto en mensajes de hasta max_length caracteres"""
+        buffer = []
+        buffer_length = 0
+        
+        for fragment in fragments:
+            if buffer and buffer_length + len(fragment) > max_length:
+                yield "".join(buffer).strip()
+                buffer = []
+                buffer_length = 0
+            
+            if len(fragment) > max_length:
+                # Fragmento demasiado largo por sí solo: dividir por líneas
+                yield from self.split_long_message(fragment, max_length)
+                continue
+            
+            buffer.append(fragment)
+            buffer_length += len(fragment)
+        
+        if buffer:
+            yield "".join(buffer).strip()
+    
+    def send_message_chunks(self, chat_id: int, fragments: Iterable[str],
+                            priority: int = PRIORITY_COMMAND, **kwargs):
+        """
+        Enviar un texto generado por fragmentos sin construirlo entero.
+        Cada mensaje se encola en cuanto se llena; reply_markup va en el primero.
+        """
+        messages = (msg for msg in self.pack_message_chunks(fragments) if msg)
         for i, msg in enumerate(messages):
             if i == 0:
-                bot.send_message(chat_id, msg, **kwargs)
+                enqueue_send(chat_id, msg, priority=priority, **kwargs)
             else:
-                bot.send_message(chat_id, msg, parse_mode=kwargs.get('parse_mode'))
+                enqueue_send(chat_id, msg, priority=priority, parse_mode=kwargs.get('parse_mode'))
+    
+    def replace_processing_message(self, chat_id: int, processing_msg: Optional[Future], text: str,
+                                   priority: int = PRIORITY_COMMAND, final_reply_markup=None, **kwargs):
+        """
+        Mostrar un resultado editando el mensaje 'procesando...' aún pendiente de envío.
+        No bloquea: la edición se encola detrás del envío en la cola FIFO del chat.
+        Si no hay mensaje de procesamiento (resultado cacheado) se envía normalmente.
+        """
+        if processing_msg is None:
+            self.send_long_message(chat_id, text, priority=priority,
+                                   final_reply_markup=final_reply_markup, **kwargs)
+            return
+        
+        messages = self.split_long_message(text)
+        last_index = len(messages) - 1
+        
+        first_kwargs = kwargs
+        if last_index == 0 and final_reply_markup is not None:
+            first_kwargs = dict(kwargs, reply_markup=final_reply_markup)
+        
+        def edit_first():
+            try:
+                return bot.edit_message_text(
+                    messages[0], chat_id, processing_msg.result().message_id, **first_kwargs
+                )
+            except Exception as e:
+                if retry_after_seconds(e) is not None:
+                    raise  # 429: el dispatcher espera y reintenta la edición
+                logger.warning("Could not edit processing message in chat %s: %s", chat_id, e)
+                # Ya estamos en el turno del chat: enviar aquí mantiene el orden de los
+                # fragmentos, con el mismo límite global que el resto de llamadas
+                return dispatcher.call_now(bot.send_message, chat_id, messages[0],
+                                           priority=priority, **first_kwargs)
+        
+        dispatcher.submit(chat_id, edit_first, priority=priority)
+        
+        for i, msg in enumerate(messages[1:], 1):
+            send_kwargs = {'parse_mode': kwargs.get('parse_mode')}
+            if i == last_index and final_reply_markup is not None:
+                send_kwargs['reply_markup'] = final_reply_markup
+            enqueue_send(chat_id, msg, priority=priority, **send_kwargs)
 
 # Crear instancia global del bot
 meal_bot = MealPrepBotV2()
 
+# Se marca al terminar shutdown_bot, para que el respaldo de atexit no la repita
+bot_stopped = threading.Event()
+
+def shutdown_bot():
+    """
+    Parada ordenada, llamada desde main al salir (también tras SIGTERM).
+    Primero se dejan de aceptar updates y terminan los handlers en curso,
+    que pueden encolar trabajos y envíos; después terminan los trabajos en
+    segundo plano, se escribe el guardado pendiente y por último se vacían
+    las colas de envío.
+    """
+    if bot_stopped.is_set():
+        return
+    
+    # Parar el polling y esperar a los hilos de telebot que ejecutan handlers
+    # (en modo webhook también procesan las updates recibidas por Flask)
+    bot.stop_bot()
+    background_executor.shutdown(wait=True)
+    
+    # Un guardado fallido solo se reprograma en un Timer que ya no se ejecutaría:
+    # reintentarlo aquí mismo y, si sigue fallando, dejar constancia de la pérdida
+    for attempt in range(SHUTDOWN_SAVE_ATTEMPTS):
+        if meal_bot.flush_pending_save():
+            break
+        if attempt + 1 < SHUTDOWN_SAVE_ATTEMPTS:
+            time.sleep(SHUTDOWN_SAVE_RETRY_DELAY)
+    else:
+        logger.critical(
+            "Se pierden los cambios pendientes: no se pudo escribir %s tras %s intentos al parar el bot",
+            meal_bot.database_file, SHUTDOWN_SAVE_ATTEMPTS
+        )
+    
+    dispatcher.shutdown()
+    bot_stopped.set()
+
+# Red de seguridad si el proceso sale sin pasar por main. Ojo: concurrent.futures
+# ya ha esperado a sus hilos antes de los callbacks de atexit, así que aquí solo
+# queda escribir el guardado pendiente; el orden real lo garantiza shutdown_bot
+atexit.register(shutdown_bot)
+
 # ========================================
-# COMANDOS PRINCIPALES
+# CONSTANTES DE PRESENTACIÓN
 # ========================================
 
-@bot.message_handler(commands=['start'])
-def start_command(message):
-    """Comando de inicio con personalización visual"""
-    telegram_id = str(message.from_user.id)
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
-    if user_profile:
-        # Usuario existente - bienvenida personalizada
-        preferences = user_profile.get("preferences", {})
-        liked_count = len(preferences.get("liked_foods", []))
-        disliked_count = len(preferences.get("disliked_foods", []))
-        
-        welcome_text = f"""
+FOOD_EMOJIS = {
+    "carnes_rojas": "🥩", "aves": "🐔", "pescados": "🐟", "huevos": "🥚",
+    "lacteos": "🥛", "frutos_secos": "🥜", "legumbres": "🫘", "hojas_verdes": "🥬",
+    "cruciferas": "🥦", "solanaceas": "🍅", "aromaticas": "🌿", "raices": "🥕",
+    "pimientos": "🌶️", "pepinaceas": "🥒", "aceitunas": "🫒", "aguacate": "🥑"
+}
+
+METHOD_EMOJIS = {
+    "horno": "🔥", "sarten": "🍳", "plancha": "🥘", "vapor": "🫕",
+    "crudo": "🥗", "guisado": "🍲", "parrilla": "🔥", "hervido": "🥄"
+}
+
+# Mapeo de complementos a categorías de alimentos
+FOOD_MAPPINGS = {
+    # Frutos secos
+    "almendras": "frutos_secos", "nueces": "frutos_secos", "pistachos": "frutos_secos",
+    "avellanas": "frutos_secos", "anacardos": "frutos_secos",
+    
+    # Lácteos
+    "yogur": "lacteos", "queso": "lacteos", "feta": "lacteos",
+    
+    # Aceitunas y derivados
+    "aceitunas": "aceitunas", "aceite": "aceitunas",
+    
+    # Frutas
+    "higos": "frutas", "dátiles": "frutas", "pasas": "frutas",
+    
+    # Otros
+    "miel": "endulzantes_naturales"
+}
+
+# Una sola pasada regex por nombre; ante varias coincidencias gana la primera del mapeo
+FOOD_MAPPING_PRIORITY = {word: index for index, word in enumerate(FOOD_MAPPINGS)}
+FOOD_MAPPING_RE = re.compile("|".join(re.escape(word) for word in FOOD_MAPPINGS))
+
+# /rating nombre_receta puntuación [comentario] (admite /rating@NombreBot)
+RATING_COMMAND_RE = re.compile(r"^/rating(?:@\w+)?\s+(\S+)\s+(\S+)(?:\s+(.*))?$", re.DOTALL)
+RATING_VALUES = {"1": 1, "2": 2, "3": 3, "4": 4, "5": 5}
+
+# Timing de complementos según horario de entrenamiento
+TIMING_RECOMMENDATIONS = {
+    "mañana": {
+        "pre": "🌅 **Pre-entreno (6:00-6:30):** Miel + almendras",
+        "post": "☀️ **Post-entreno (8:00-9:00):** Yogur griego + nueces",
+        "tarde": "🌆 **Tarde:** Aceitunas + queso feta"
+    },
+    "mediodia": {
+        "pre": "☀️ **Pre-entreno (11:30-12:00):** Dátiles + pistachos",
+        "post": "🌞 **Post-entreno (14:00-15:00):** Yogur + miel",
+        "tarde": "🌆 **Tarde:** Frutos secos mixtos"
+    },
+    "tarde": {
+        "pre": "🌆 **Pre-entreno (15:30-16:00):** Miel + frutos secos",
+        "post": "🌙 **Post-entreno (20:30-21:00):** Yogur + aceitunas",
+        "noche": "🌃 **Noche:** Complementos según macros faltantes"
+    },
+    "noche": {
+        "pre": "🌙 **Pre-entreno (19:30-20:00):** Almendras + miel (ligero)",
+        "post": "🌃 **Post-entreno (22:00-22:30):** Yogur (evitar exceso)",
+        "descanso": "😴 **Antes de dormir:** Solo si faltan macros"
+    },
+    "variable": {
+        "general": "🔄 **Timing flexible:** Adapta según tu horario de entrenamiento",
+        "regla": "📋 **Regla general:** Pre-entreno ligero, post-entreno proteico"
+    }
+}
+
+# Recomendaciones de complementos por objetivo
+OBJECTIVE_RECOMMENDATIONS = {
+    "bajar_peso": (
+        "• Prioriza complementos altos en proteína (yogur griego)",
+        "• Controla porciones de frutos secos (máximo 30g/día)",
+        "• Evita miel en exceso (máximo 15g/día)"
+    ),
+    "subir_masa": (
+        "• Aumenta frecuencia de frutos secos y aceitunas",
+        "• Combina complementos para maximizar calorías",
+        "• Miel post-entreno para reponer glucógeno"
+    ),
+    "recomposicion": (
+        "• Timing preciso: proteínas post-entreno",
+        "• Carbohidratos (miel, frutas) solo peri-entreno",
+        "• Grasas saludables en comidas principales"
+    ),
+    "mantener": (
+        "• Distribución equilibrada durante el día",
+        "• Usa complementos para completar macros faltantes",
+        "• Flexibilidad según apetito y actividad"
+    )
+}
+
+# Categorías del menú semanal, en orden de configuración
+MENU_CATEGORIES = ("desayuno", "almuerzo", "merienda", "cena")
+NEXT_MENU_CATEGORY = dict(zip(MENU_CATEGORIES, MENU_CATEGORIES[1:] + (None,)))
+
+MENU_CATEGORY_ICONS = {
+    "desayuno": "🌅",
+    "almuerzo": "🍽️",
+    "merienda": "🥜",
+    "cena": "🌙"
+}
+
+# /timing: iconos por comida y nombres de las categorías de timing dinámico
+TIMING_MEAL_ICONS = {
+    "desayuno": "🌅",
+    "almuerzo": "🌞",
+    "merienda": "🌇",
+    "cena": "🌙"
+}
+
+TIMING_CATEGORY_NAMES = {
+    "pre_entreno": "⚡ PRE-ENTRENO",
+    "post_entreno": "💪 POST-ENTRENO",
+    "comida_principal": "🍽️ COMIDA PRINCIPAL",
+    "snack_complemento": "🥜 SNACK/COMPLEMENTO"
+}
+
+# Consejos de /timing cuando no hay horario de entrenamiento configurado
+TIMING_GENERIC_TIPS_TEXT = """
+
+💡 **CÓMO USARLO:**
+• Usa /generar para crear recetas específicas por timing
+• /recetas te mostrará todas tus recetas generadas
+• Cada receta está optimizada para el momento del día
+
+🔄 **¿Quieres optimizar más?**
+Usa /perfil para configurar tu horario de entrenamiento específico.
+"""
+
+# Secciones editables desde /editar_perfil: callback -> sección, título y paso de setup
+PROFILE_EDIT_SECTIONS = {
+    "edit_liked_foods": {
+        "section": "liked_foods",
+        "title": "🍽️ ALIMENTOS PREFERIDOS",
+        "step": "9C",
+        "description": "Selecciona los alimentos que más te gustan. Puedes elegir múltiples opciones:"
+    },
+    "edit_disliked_foods": {
+        "section": "disliked_foods", 
+        "title": "🚫 ALIMENTOS A EVITAR",
+        "step": "9D",
+        "description": "Selecciona alimentos que prefieres evitar. Puedes elegir múltiples opciones:"
+    },
+    "edit_cooking_methods": {
+        "section": "cooking_methods",
+        "title": "👨‍🍳 MÉTODOS DE COCCIÓN",
+        "step": "9F", 
+        "description": "Selecciona tus métodos de cocción preferidos. Puedes elegir múltiples opciones:"
+    },
+    "edit_training_schedule": {
+        "section": "training_schedule",
+        "title": "⏰ HORARIO DE ENTRENAMIENTO",
+        "step": "7",
+        "description": "Selecciona tu horario habitual de entrenamiento:"
+    }
+}
+
+# Temas semanales de /nueva_semana
+WEEK_THEME_NAMES = {
+    "mediterranea": "🌊 Mediterránea",
+    "alta_proteina": "💪 Alta Proteína",
+    "detox_natural": "🌿 Detox Natural",
+    "energia_sostenida": "⚡ Energía Sostenida",
+    "variedad_maxima": "🌈 Variedad Máxima",
+    "auto": "🎯 Auto-selección IA"
+}
+
+# Temas que se pueden pedir directamente con /nueva_semana <tema>
+VALID_WEEK_THEMES = frozenset(WEEK_THEME_NAMES) - {"auto"}
+
+# Períodos de /analisis_nutricional: palabra clave del argumento -> período
+# (en orden: "trimestre" contiene "mes" y debe comprobarse antes)
+ANALYSIS_PERIOD_KEYWORDS = (
+    ("semana", "week"), ("week", "week"),
+    ("trimestre", "quarter"), ("quarter", "quarter"),
+    ("mes", "month"), ("month", "month")
+)
+
+ANALYSIS_PERIOD_NAMES = {"week": "semanal", "month": "mensual", "quarter": "trimestral"}
+
+# Preferencias base de /planificar_semana (se copian antes de personalizar)
+SCHEDULE_BASE_PREFERENCES = {
+    "max_prep_time_hours": 6,
+    "preferred_prep_days": ["domingo"],
+    "max_session_hours": 4,
+    "cooking_experience": "intermedio",
+    "freshness_priority": 7,
+    "time_efficiency_priority": 8,
+    "storage_capacity": "medio",
+    "kitchen_equipment": ["basico"]
+}
+
+# Argumentos de /planificar_semana -> preferencias que sobrescriben
+SCHEDULE_PREFERENCE_PRESETS = {
+    "rapido": {"time_efficiency_priority": 10, "max_prep_time_hours": 4},
+    "fresco": {"freshness_priority": 10, "preferred_prep_days": ["domingo", "miercoles"]},
+    "simple": {"cooking_experience": "principiante", "max_session_hours": 2}
+}
+
+# Iconos por timing de receta (comidas del menú + entreno)
+TIMING_EMOJIS = {
+    **MENU_CATEGORY_ICONS,
+    "pre_entreno": "⚡",
+    "post_entreno": "💪"
+}
+
+# Botones de /generar: callback -> parámetros de la petición a la IA (no se modifican)
+GENERATION_REQUESTS = {
+    "gen_pre_entreno": {
+        "timing_category": "pre_entreno",
+        "function_category": "energia_rapida",
+        "target_macros": {"protein": 10, "carbs": 35, "fat": 5, "calories": 210}
+    },
+    "gen_post_entreno": {
+        "timing_category": "post_entreno", 
+        "function_category": "sintesis_proteica",
+        "target_macros": {"protein": 35, "carbs": 30, "fat": 8, "calories": 320}
+    },
+    "gen_desayuno": {
+        "timing_category": "desayuno",
+        "function_category": "equilibrio_nutricional",
+        "target_macros": {"protein": 25, "carbs": 45, "fat": 15, "calories": 380}
+    },
+    "gen_almuerzo": {
+        "timing_category": "almuerzo",
+        "function_category": "equilibrio_nutricional",
+        "target_macros": {"protein": 40, "carbs": 50, "fat": 20, "calories": 480}
+    },
+    "gen_merienda": {
+        "timing_category": "merienda",
+        "function_category": "micronutrientes", 
+        "target_macros": {"protein": 15, "carbs": 20, "fat": 12, "calories": 220}
+    },
+    "gen_cena": {
+        "timing_category": "cena",
+        "function_category": "equilibrio_nutricional",
+        "target_macros": {"protein": 35, "carbs": 25, "fat": 18, "calories": 360}
+    }
+}
+
+# Nombres de timing en el mensaje de "generando opciones"
+GENERATION_TIMING_NAMES = {
+    "pre_entreno": "⚡ PRE-ENTRENO",
+    "post_entreno": "💪 POST-ENTRENO",
+    "desayuno": "🌅 DESAYUNO",
+    "almuerzo": "🍽️ ALMUERZO",
+    "merienda": "🥜 MERIENDA",
+    "cena": "🌙 CENA"
+}
+
+# Plantillas de texto de los comandos principales (se rellenan con format_map)
+WELCOME_BACK_TEMPLATE = """
 ✨ **¡Bienvenido de vuelta!** Meal Prep Bot V2.0
 
-👤 **Tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}
+👤 **Tu perfil:** {objetivo}
 🎯 **Personalización:** {liked_count} preferencias, {disliked_count} exclusiones
-🔥 **Calorías objetivo:** {user_profile['macros']['calories']} kcal/día
-⚡ **Available Energy:** {user_profile['energy_data']['available_energy']} kcal/kg FFM/día
+🔥 **Calorías objetivo:** {calories} kcal/día
+⚡ **Available Energy:** {available_energy} kcal/kg FFM/día
 
 🚀 **SISTEMA COMPLETAMENTE PERSONALIZADO:**
 
@@ -290,9 +942,8 @@ def start_command(message):
 
 💡 **Todo se adapta automáticamente a tu perfil nutricional**
 """
-    else:
-        # Nuevo usuario
-        welcome_text = """
+
+WELCOME_NEW_USER_TEXT = """
 🍽️ **¡Bienvenido al Meal Prep Bot V2.0!**
 
 🤖 **Sistema de meal prep con IA completamente personalizado**
@@ -318,243 +969,62 @@ def start_command(message):
 
 💡 **¡Configura tu perfil para experiencia personalizada al 100%!**
 """
-    
-    meal_bot.send_long_message(message.chat.id, welcome_text, parse_mode='Markdown')
-
-@bot.message_handler(commands=['perfil'])
-def perfil_command(message):
-    """Comando para configurar perfil de usuario"""
-    telegram_id = str(message.from_user.id)
-    
-    # Iniciar proceso de configuración de perfil
-    meal_bot.user_states[telegram_id] = {
-        "state": "profile_setup",
-        "step": "enfoque_dietetico",
-        "data": {}
-    }
-    
-    # Crear teclado para enfoque dietético
-    keyboard = types.InlineKeyboardMarkup(row_width=1)
-    keyboard.add(
-        types.InlineKeyboardButton("🇪🇸 Tradicional Español - Platos equilibrados, ingredientes mediterráneos", callback_data="approach_tradicional"),
-        types.InlineKeyboardButton("💪 Fitness Orientado - Optimización nutricional, macros precisos", callback_data="approach_fitness")
-    )
-    
-    bot.send_message(
-        message.chat.id,
-        "👤 **CONFIGURACIÓN DE PERFIL NUTRICIONAL**\n\n"
-        "Antes de calcular tus macros personalizados, necesito conocer tu enfoque preferido:\n\n"
-        "🍽️ **¿Qué enfoque nutricional prefieres?**\n\n"
-        "**🇪🇸 Tradicional Español:**\n"
-        "• Platos mediterráneos equilibrados\n"
-        "• Ingredientes locales y de temporada\n"
-        "• Recetas familiares y culturales\n"
-        "• Enfoque en sabor y tradición\n\n"
-        "**💪 Fitness Orientado:**\n"
-        "• Optimización de macronutrientes\n"
-        "• Timing nutricional preciso\n"
-        "• Maximización de resultados deportivos\n"
-        "• Enfoque científico y medible\n\n"
-        "📍 _Esta elección influirá en el tipo de recetas y recomendaciones que recibirás_",
-        parse_mode='Markdown',
-        reply_markup=keyboard
-    )
 
-@bot.message_handler(commands=['mis_macros'])
-def mis_macros_command(message):
-    """Mostrar macros calculados del usuario"""
-    telegram_id = str(message.from_user.id)
-    
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
-        return
-    
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
-    # Datos del perfil
-    basic_data = user_profile["basic_data"]
-    body_comp = user_profile["body_composition"]
-    energy_data = user_profile["energy_data"]
-    macros = user_profile["macros"]
-    preferences = user_profile.get("preferences", {})
-    exercise_profile = user_profile.get("exercise_profile", {})
-    
-    # Formatear preferencias alimentarias
-    liked_foods = preferences.get("liked_foods", [])
-    disliked_foods = preferences.get("disliked_foods", [])
-    cooking_methods = preferences.get("cooking_methods", [])
-    
-    # Formatear listas de preferencias con emojis
-    def format_food_list(food_list):
-        if not food_list:
-            return "Ninguna especificada"
-        
-        food_emojis = {
-            "carnes_rojas": "🥩", "aves": "🐔", "pescados": "🐟", "huevos": "🥚",
-            "lacteos": "🥛", "frutos_secos": "🥜", "legumbres": "🫘", "hojas_verdes": "🥬",
-            "cruciferas": "🥦", "solanaceas": "🍅", "aromaticas": "🌿", "raices": "🥕",
-            "pimientos": "🌶️", "pepinaceas": "🥒", "aceitunas": "🫒", "aguacate": "🥑"
-        }
-        
-        formatted = []
-        for food in food_list:
-            emoji = food_emojis.get(food, "🍽️")
-            name = food.replace("_", " ").title()
-            formatted.append(f"{emoji} {name}")
-        
-        return ", ".join(formatted)
-    
-    def format_cooking_methods(methods_list):
-        if not methods_list:
-            return "Ninguno especificado"
-            
-        method_emojis = {
-            "horno": "🔥", "sarten": "🍳", "plancha": "🥘", "vapor": "🫕",
-            "crudo": "🥗", "guisado": "🍲", "parrilla": "🔥", "hervido": "🥄"
-        }
-        
-        formatted = []
-        for method in methods_list:
-            emoji = method_emojis.get(method, "👨‍🍳")
-            name = method.replace("_", " ").title()
-            formatted.append(f"{emoji} {name}")
-        
-        return ", ".join(formatted)
-    
-    response_text = f"""
+MIS_MACROS_TEMPLATE = """
 👤 **TU PERFIL NUTRICIONAL COMPLETO**
 
 **DATOS BÁSICOS:**
-• Peso: {basic_data['peso']} kg
-• Altura: {basic_data['altura']} cm
-• Edad: {basic_data['edad']} años
-• Objetivo: {basic_data['objetivo_descripcion']}
+• Peso: {peso} kg
+• Altura: {altura} cm
+• Edad: {edad} años
+• Objetivo: {objetivo}
 
 **COMPOSICIÓN CORPORAL:**
-• BMR: {body_comp['bmr']} kcal/día
-• Grasa corporal: {body_comp['body_fat_percentage']}%
-• Masa magra: {body_comp['lean_mass_kg']} kg
-• IMC: {body_comp['bmi']}
+• BMR: {bmr} kcal/día
+• Grasa corporal: {body_fat_percentage}%
+• Masa magra: {lean_mass_kg} kg
+• IMC: {bmi}
 
 **ENERGÍA DISPONIBLE:**
-• Available Energy: {energy_data['available_energy']} kcal/kg FFM/día
-• Estado: {energy_data['ea_status']['color']} {energy_data['ea_status']['description']}
-• TDEE: {energy_data['tdee']} kcal/día
-• Ejercicio diario: {energy_data['daily_exercise_calories']} kcal
+• Available Energy: {available_energy} kcal/kg FFM/día
+• Estado: {ea_color} {ea_description}
+• TDEE: {tdee} kcal/día
+• Ejercicio diario: {daily_exercise_calories} kcal
 
 **MACROS DIARIOS OBJETIVO:**
-🥩 Proteína: {macros['protein_g']}g ({macros['protein_g']*4} kcal)
-🍞 Carbohidratos: {macros['carbs_g']}g ({macros['carbs_g']*4} kcal)
-🥑 Grasas: {macros['fat_g']}g ({macros['fat_g']*9} kcal)
-🔥 **TOTAL: {macros['calories']} kcal/día**
+🥩 Proteína: {protein_g}g ({protein_kcal} kcal)
+🍞 Carbohidratos: {carbs_g}g ({carbs_kcal} kcal)
+🥑 Grasas: {fat_g}g ({fat_kcal} kcal)
+🔥 **TOTAL: {calories} kcal/día**
 
 **TUS PREFERENCIAS PERSONALES:**
 🍽️ **Alimentos preferidos:**
-{format_food_list(liked_foods)}
+{liked_foods}
 
 🚫 **Alimentos a evitar:**
-{format_food_list(disliked_foods)}
+{disliked_foods}
 
 👨‍🍳 **Métodos de cocción preferidos:**
-{format_cooking_methods(cooking_methods)}
+{cooking_methods}
 
 ⏰ **Horario de entrenamiento:**
-{exercise_profile.get('training_schedule_desc', 'No especificado')}
+{training_schedule}
 
 **RECOMENDACIÓN PERSONALIZADA:**
-{energy_data['ea_status']['recommendation']}
+{ea_recommendation}
 
 💡 **Personalización activa:**
 ✅ Tus preferencias se aplican en `/buscar` y `/generar`
 ✅ Usa `/editar_perfil` para modificar tus preferencias
 ✅ Comandos personalizados: `/menu`, `/complementos`
 """
-    
-    meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown')
-
-@bot.message_handler(commands=['editar_perfil'])
-def editar_perfil_command(message):
-    """Comando para editar preferencias del perfil existente"""
-    telegram_id = str(message.from_user.id)
-    
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
-        return
-    
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    if not user_profile:
-        bot.send_message(
-            message.chat.id,
-            "❌ No tienes un perfil configurado.\n\n"
-            "Usa `/perfil` para crear tu perfil primero.",
-            parse_mode='Markdown'
-        )
-        return
-    
-    # Crear teclado de opciones de edición
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    
-    # Botones para cada sección editable
-    markup.add(
-        types.InlineKeyboardButton("🍽️ Alimentos Preferidos", callback_data="edit_liked_foods"),
-        types.InlineKeyboardButton("🚫 Alimentos a Evitar", callback_data="edit_disliked_foods"),
-        types.InlineKeyboardButton("👨‍🍳 Métodos de Cocción", callback_data="edit_cooking_methods"),
-        types.InlineKeyboardButton("⏰ Horario de Entrenamiento", callback_data="edit_training_schedule"),
-        types.InlineKeyboardButton("❌ Cancelar", callback_data="cancel_edit")
-    )
-    
-    # Obtener preferencias actuales
-    preferences = user_profile.get("preferences", {})
-    exercise_profile = user_profile.get("exercise_profile", {})
-    
-    current_preferences = f"""
-📝 **TUS PREFERENCIAS ACTUALES:**
-
-🍽️ **Alimentos preferidos:**
-{', '.join(preferences.get('liked_foods', [])) if preferences.get('liked_foods') else 'Ninguno seleccionado'}
-
-🚫 **Alimentos a evitar:**
-{', '.join(preferences.get('disliked_foods', [])) if preferences.get('disliked_foods') else 'Ninguno seleccionado'}
-
-👨‍🍳 **Métodos de cocción:**
-{', '.join(preferences.get('cooking_methods', [])) if preferences.get('cooking_methods') else 'Ninguno seleccionado'}
-
-⏰ **Horario de entrenamiento:**
-{exercise_profile.get('training_schedule_desc', 'No especificado')}
-
-**¿Qué quieres modificar?**
-"""
-    
-    bot.send_message(
-        message.chat.id,
-        current_preferences,
-        parse_mode='Markdown',
-        reply_markup=markup
-    )
 
-@bot.message_handler(commands=['menu'])
-def menu_command(message):
-    """Mostrar menú semanal con timing nutricional"""
-    telegram_id = str(message.from_user.id)
-    
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
-        return
-    
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
-    # Generar menú con timing nutricional
-    try:
-        menu_text = format_menu_for_telegram(user_profile)
-        meal_bot.send_long_message(message.chat.id, menu_text, parse_mode='Markdown')
-        
-    except Exception as e:
-        logger.error(f"Error generating menu: {e}")
-        
-        # Fallback a menú básico
-        fallback_text = f"""
+MENU_FALLBACK_TEMPLATE = """
 📅 **MENÚ SEMANAL PERSONALIZADO**
 
-🎯 **Objetivo:** {user_profile['basic_data']['objetivo_descripcion']}
-🔥 **Calorías diarias:** {user_profile['macros']['calories']} kcal
-⚡ **Available Energy:** {user_profile['energy_data']['available_energy']} kcal/kg FFM/día
+🎯 **Objetivo:** {objetivo}
+🔥 **Calorías diarias:** {calories} kcal
+⚡ **Available Energy:** {available_energy} kcal/kg FFM/día
 
 **TIMING NUTRICIONAL OPTIMIZADO:**
 
@@ -581,7 +1051,915 @@ def menu_command(message):
 • /valorar - Valorar recetas con 1-5 estrellas  
 • /valorar_receta - Entrenar IA con tus preferencias
 """
-        
+
+# Orden y cabeceras de categorías en /favoritas
+FAVORITE_TIMING_CATEGORIES = (
+    ("pre_entreno", "⚡ **PRE-ENTRENO**"),
+    ("post_entreno", "💪 **POST-ENTRENO**"),
+    ("comida_principal", "🍽️ **COMIDA PRINCIPAL**"),
+    ("snack_complemento", "🥜 **SNACK/COMPLEMENTO**")
+)
+
+RECETAS_EMPTY_TEXT = """
+📚 **TUS RECETAS GENERADAS**
+
+❌ **No tienes recetas generadas aún**
+
+Para generar recetas personalizadas:
+• Usa /generar para crear recetas específicas por timing
+• Usa /buscar [consulta] para recetas con IA
+
+**CATEGORÍAS DISPONIBLES:**
+
+⚡ **PRE-ENTRENO** (15-30 min antes)
+💪 **POST-ENTRENO** (0-30 min después)  
+🌅 **DESAYUNO** - Primera comida del día
+🍽️ **ALMUERZO** - Comida principal del mediodía
+🥜 **MERIENDA** - Snack de la tarde
+🌙 **CENA** - Última comida del día
+
+¡Genera tu primera receta con /generar!
+"""
+
+NO_FAVORITES_TEXT = """
+⭐ **TUS RECETAS FAVORITAS**
+
+❌ **No tienes recetas favoritas aún**
+
+Para añadir recetas a favoritos:
+• Genera recetas con `/generar`
+• Busca recetas con `/buscar [consulta]`
+• Marca las que te gusten con ⭐
+
+**¡Empieza a generar recetas personalizadas!**
+"""
+
+FAVORITES_NOT_FOUND_TEXT = """
+⭐ **TUS RECETAS FAVORITAS**
+
+⚠️ **Recetas favoritas no encontradas**
+
+Puede que algunas recetas favoritas ya no estén disponibles.
+Genera nuevas recetas con `/generar` y márcalas como favoritas.
+"""
+
+NO_RECIPES_TO_RATE_TEXT = """
+⭐ **SISTEMA DE VALORACIÓN 1-5 ESTRELLAS**
+
+❌ **No hay recetas para valorar**
+
+Para valorar recetas necesitas:
+1. 🤖 Generar recetas con `/generar`
+2. 🔍 Buscar recetas con `/buscar [consulta]`
+3. ✅ Seleccionar recetas de las opciones
+
+💡 **¿Para qué sirven las valoraciones?**
+• Mejorar recomendaciones futuras personalizadas
+• Entrenar la IA con tus preferencias específicas
+• Optimizar el algoritmo según tu feedback
+
+🎯 **Genera algunas recetas primero y luego regresa aquí**
+"""
+
+NO_RECIPES_TO_LEARN_TEXT = """
+⭐ **VALORAR RECETAS - SISTEMA DE APRENDIZAJE IA**
+
+❌ **No hay recetas recientes para valorar**
+
+Para poder valorar recetas necesitas:
+1. 🤖 Generar recetas con `/generar`
+2. 🔍 Buscar recetas con `/buscar [consulta]`
+3. 📅 Crear plan semanal con `/nueva_semana`
+
+💡 **¿Por qué valorar recetas?**
+• La IA aprende tus preferencias automáticamente
+• Mejoran las recomendaciones personalizadas
+• El sistema se adapta a tu gusto específico
+• Planes semanales más precisos
+
+🚀 **Genera tu primera receta:**
+"""
+
+INSIGHTS_UNAVAILABLE_TEXT = """
+🧠 **ANÁLISIS DE PREFERENCIAS IA**
+
+❌ **Sin datos suficientes para análisis**
+
+Para activar el análisis avanzado necesitas:
+• 🤖 Generar recetas con `/generar`
+• ⭐ Valorar recetas con `/valorar_receta`
+• 🔄 Seleccionar opciones del sistema múltiple
+
+💡 **¿Qué incluye el análisis IA?**
+• Patrones de ingredientes preferidos/evitados
+• Métodos de cocción que más te gustan
+• Análisis nutricional personalizado
+• Preferencias de timing (desayuno, almuerzo, etc.)
+• Tendencias dietéticas identificadas
+• Fuerza de las recomendaciones
+
+🚀 **Comienza generando tu primera receta:**
+"""
+
+NUEVA_SEMANA_TEMPLATE = """
+🗓️ **PLANIFICACIÓN SEMANAL INTELIGENTE**
+
+👤 **Tu perfil:** {objetivo}
+🔥 **Calorías diarias:** {calories} kcal
+⚡ **Available Energy:** {available_energy} kcal/kg FFM
+
+🎨 **TEMAS SEMANALES DISPONIBLES:**
+
+🌊 **Mediterránea** - Ingredientes tradicionales mediterráneos
+💪 **Alta Proteína** - Maximizar síntesis proteica y recuperación  
+🌿 **Detox Natural** - Alimentos depurativos y antioxidantes
+⚡ **Energía Sostenida** - Carbohidratos complejos y grasas saludables
+🌈 **Variedad Máxima** - Máxima diversidad de ingredientes
+
+🎯 **Auto-selección IA** - Deja que la IA elija el tema óptimo para ti
+
+**Selecciona un tema para generar tu plan semanal inteligente:**
+"""
+
+LISTA_COMPRAS_TEMPLATE = """
+🛒 **LISTA DE COMPRAS PERSONALIZADA**
+
+👤 **Tu perfil:** {objetivo}
+🔥 **Calorías diarias:** {calories} kcal
+
+📅 **¿Para cuántos días quieres la lista?**
+
+🅰️ **3 días** - Lista compacta para meal prep corto
+🅱️ **5 días** - Lista estándar para semana laboral
+🅲️ **7 días** - Lista completa para toda la semana
+🅳️ **10 días** - Lista extendida para compra quincenal
+
+**Responde con la letra de tu opción (A, B, C, D)**
+
+✨ **La lista se adapta automáticamente a:**
+• Tus alimentos preferidos (cantidades aumentadas)
+• Alimentos que evitas (excluidos automáticamente)
+• Tu objetivo nutricional específico
+• Complementos mediterráneos optimizados
+• Distribución inteligente por frescura
+"""
+
+VALORAR_HEADER_TEXT = """
+⭐ **VALORAR RECETAS - ESCALA 1-5 ESTRELLAS**
+
+📋 **Selecciona la receta que quieres valorar:**
+
+"""
+
+VALORAR_FOOTER_TEXT = (
+    "\n🌟 **Escala de valoración:**\n"
+    "⭐ = No me gustó\n"
+    "⭐⭐ = Regular\n"
+    "⭐⭐⭐ = Buena\n"
+    "⭐⭐⭐⭐ = Muy buena\n"
+    "⭐⭐⭐⭐⭐ = Excelente\n\n"
+    "🤖 **Tus valoraciones ayudan a la IA a generar mejores recomendaciones**"
+)
+
+VALORAR_RECETA_HEADER_TEMPLATE = """
+⭐ **VALORAR RECETAS - APRENDER PREFERENCIAS**
+
+👤 **Tu perfil:** {objetivo}
+🧠 **IA Score:** {intelligence_score} /100
+
+📋 **RECETAS DISPONIBLES PARA VALORAR:**
+
+"""
+
+VALORAR_RECETA_FOOTER_TEXT = """
+💡 **ESCALA DE VALORACIÓN:**
+⭐ = Muy malo (la IA evitará ingredientes/estilos similares)
+⭐⭐ = Malo (reduce recomendaciones similares)  
+⭐⭐⭐ = Neutro (sin cambios en preferencias)
+⭐⭐⭐⭐ = Bueno (aumenta recomendaciones similares)
+⭐⭐⭐⭐⭐ = Excelente (prioriza ingredientes/estilos similares)
+
+**¡Cada valoración mejora automáticamente tus recomendaciones futuras!**
+"""
+
+PROGRESO_TEMPLATE = """
+📊 **SEGUIMIENTO DE PROGRESO**
+
+👤 **Tu perfil:** {objetivo_descripcion}
+🎯 **Objetivo:** {objetivo}
+
+📈 **ESTADÍSTICAS DE TRACKING:**
+• Métricas registradas: {total_metrics} tipos
+• Total de registros: {total_records}
+• Último registro: {last_record_date}
+
+**¿Qué quieres hacer?**
+"""
+
+PROGRESO_INTRO_TEMPLATE = """
+📊 **SISTEMA DE SEGUIMIENTO DE PROGRESO**
+
+👤 **Tu objetivo:** {objetivo}
+
+🎯 **¿QUÉ PUEDES TRACKEAR?**
+⚖️ Peso corporal
+📊 Porcentaje de grasa
+💪 Masa muscular  
+📏 Circunferencia de cintura
+⚡ Nivel de energía
+💤 Calidad de sueño
+🔄 Recuperación post-entreno
+🍽️ Control del apetito
+
+💡 **BENEFICIOS DEL TRACKING:**
+• Análisis automático de tendencias
+• Insights personalizados con IA
+• Recomendaciones adaptativas
+• Detección de patrones
+• Ajustes automáticos del plan
+
+🚀 **COMIENZA AHORA:**
+**Registra tu primera métrica para activar el sistema inteligente de seguimiento.**
+"""
+
+# Mensaje libre de un usuario sin perfil
+NO_PROFILE_HELP_TEXT = """
+❓ **COMANDOS DISPONIBLES:**
+
+⚠️ **Primero configura tu perfil para personalización completa:**
+🆕 /perfil - Configurar perfil nutricional
+
+**COMANDOS BÁSICOS:**
+/menu - Menú semanal genérico
+/recetas - Explorar recetas
+/complementos - Ver complementos
+/buscar [consulta] - Buscar recetas con IA
+/generar - Generar receta específica
+
+💡 **¡Configura tu perfil para experiencia 100% personalizada!**
+"""
+
+# /compras: lista fija, solo cambian objetivo y calorías
+COMPRAS_TEMPLATE = """
+🛒 **LISTA DE COMPRAS SEMANAL**
+
+👤 **Tu perfil:** {objetivo}
+🔥 **Calorías objetivo:** {calories} kcal/día
+
+**PROTEÍNAS:**
+• Pechuga de pollo: 2.5 kg
+• Carne de res magra: 1.5 kg
+• Huevos frescos: 2 docenas
+• Salmón fresco: 800g
+
+**LEGUMBRES Y CEREALES:**
+• Quinoa: 500g
+• Arroz integral: 1 kg
+• Lentejas rojas: 400g
+• Garbanzos secos: 500g
+
+**VEGETALES FRESCOS:**
+• Brócoli: 1 kg
+• Espinacas: 500g
+• Tomates: 1.5 kg
+• Pimientos: 800g
+• Cebolla: 1 kg
+
+🥜 **COMPLEMENTOS MEDITERRÁNEOS:**
+• Almendras crudas: 250g
+• Nueces: 200g
+• Yogur griego natural: 1 kg
+• Queso feta: 300g
+• Aceitunas kalamata: 200g
+• Miel cruda: 1 bote
+• Aceite oliva virgen extra: 500ml
+
+**ESPECIAS Y HIERBAS:**
+• Oregano seco
+• Tomillo fresco
+• Ajo fresco
+• Jengibre
+• Comino molido
+
+💡 **Tip:** Esta lista está optimizada para meal prep semanal según tu perfil nutricional.
+
+**Comandos relacionados:**
+• /cronograma - Ver cuándo cocinar cada cosa
+• /menu - Ver cómo se distribuye todo
+"""
+
+# Texto de un cronograma de cocción: cabecera, una sección por sesión y cierre
+CRONOGRAMA_HEADER_TEMPLATE = """
+⏰ **CRONOGRAMA DE COCCIÓN SEMANAL**
+
+🎯 **Tu cronograma:** {name}
+📝 **Descripción:** {description}
+⏱️ **Tiempo estimado:** {estimated_time}
+
+**SESIONES PLANIFICADAS:**
+"""
+
+CRONOGRAMA_SESSION_TEMPLATE = """
+**SESIÓN {number} - {day}**
+🕐 Horario: {start_time}
+⏰ Duración: {duration}
+📋 Tareas:
+"""
+
+CRONOGRAMA_PROFILE_TEMPLATE = """
+
+💡 **OPTIMIZACIÓN SEGÚN TU PERFIL:**
+• Objetivo: {objetivo}
+• Available Energy: {available_energy} kcal/kg FFM/día
+• Macros diarios: {calories} kcal
+
+"""
+
+CRONOGRAMA_CALLBACK_FOOTER_TEXT = """**Comandos relacionados:**
+• /compras - Lista de compras para este cronograma
+• /menu - Ver distribución nutricional semanal
+• /planificar_semana - Optimización avanzada
+"""
+
+CRONOGRAMA_COMMAND_FOOTER_TEXT = """**¿Quieres cambiar tu cronograma?**
+Usa /nueva_semana para explorar otras opciones.
+"""
+
+PROGRESO_HELP_TEXT = """
+📊 **CÓMO FUNCIONA EL SISTEMA DE PROGRESO**
+
+🎯 **OBJETIVO:**
+Trackear automáticamente tu progreso hacia tus objetivos nutricionales y de fitness.
+
+📈 **PROCESO:**
+1️⃣ **Registras métricas** (peso, energía, etc.)
+2️⃣ **El sistema analiza** tendencias automáticamente
+3️⃣ **Recibes insights** personalizados con IA
+4️⃣ **Se ajusta tu plan** según el progreso
+
+💡 **BENEFICIOS:**
+• **Análisis automático** de tendencias
+• **Detección de patrones** en tu progreso
+• **Recomendaciones adaptativas** según datos
+• **Ajustes automáticos** del Available Energy
+• **Insights personalizados** con IA
+
+📊 **MÉTRICAS DISPONIBLES:**
+⚖️ **Físicas:** Peso, grasa, masa muscular, cintura
+⚡ **Bienestar:** Energía, sueño, recuperación, apetito
+
+🔬 **ANÁLISIS INCLUIDO:**
+• Tendencias semanales/mensuales
+• Comparaciones con objetivos
+• Detección de correlaciones
+• Predicciones de progreso
+
+🚀 **PRÓXIMOS PASOS:**
+• Registra tu primera métrica
+• Usa `/progreso` regularmente
+• Sigue las recomendaciones automáticas
+"""
+
+ANALISIS_INTRO_TEMPLATE = """
+🧬 **ANÁLISIS NUTRICIONAL PROFUNDO CON IA**
+
+👤 **Tu perfil:** {objetivo}
+
+❌ **DATOS INSUFICIENTES PARA ANÁLISIS COMPLETO**
+
+🎯 **PARA DESBLOQUEAR ANÁLISIS PROFUNDO NECESITAS:**
+
+📊 **DATOS DE PROGRESO:**
+• Registra métricas con `/progreso`
+• Mínimo: peso, energía, sueño (1 semana)
+• Recomendado: 4+ métricas (2+ semanas)
+
+⭐ **DATOS DE PREFERENCIAS:**
+• Valora recetas con `/valorar_receta`
+• Mínimo: 3 valoraciones
+• Recomendado: 10+ valoraciones variadas
+
+🔬 **EL ANÁLISIS INCLUIRÁ:**
+• **Distribución de macronutrientes** - Adherencia vs objetivo
+• **Estado de micronutrientes** - Deficiencias y fortalezas
+• **Patrones de adherencia** - Consistencia y factores
+• **Timing nutricional** - Optimización per objetivos
+• **Variedad alimentaria** - Diversidad y monotonía
+• **Correlaciones con progreso** - Qué funciona para ti
+• **Puntuación nutricional global** - Score 0-100
+• **Recomendaciones personalizadas** - IA adaptada
+
+🚀 **PASOS PARA ACTIVAR:**
+1. Usa `/progreso` para registrar primera métrica
+2. Usa `/valorar_receta` para entrenar IA
+3. Regresa en 3-7 días para análisis completo
+
+💡 **ANÁLISIS DISPONIBLES:**
+• `/analisis_nutricional semana` - Análisis semanal
+• `/analisis_nutricional mes` - Análisis mensual (recomendado)
+• `/analisis_nutricional trimestre` - Análisis de tendencias
+
+**¡El análisis más avanzado se desbloquea con más datos!**
+"""
+
+CRONOGRAMA_PROCESSING_TEXT = (
+    "🗓️ **GENERANDO CRONOGRAMA OPTIMIZADO...**\n\n"
+    "⚙️ Analizando tu perfil y restricciones\n"
+    "📊 Calculando carga de trabajo total\n"
+    "🎯 Optimizando distribución temporal\n"
+    "📈 Aplicando algoritmos de eficiencia\n\n"
+    "*Esto puede tomar unos segundos...*"
+)
+
+PLAN_METRICS_TEMPLATE = """
+📊 **MÉTRICAS DETALLADAS DEL PLAN**
+
+🎯 **Puntuación General:** {quality_metrics[overall_score]}/100
+
+📈 **Análisis de Variedad:**
+• Puntuación variedad: {quality_metrics[variety_score]}/5.0
+• Diversidad ingredientes: {quality_metrics[ingredient_diversity]} tipos únicos
+• Métodos de cocción: {quality_metrics[method_diversity]} diferentes
+
+🌊 **Integración Temática:**
+• Tema aplicado: {quality_metrics[theme_consistency]}
+• Comidas estacionales: {quality_metrics[seasonal_integration]}
+
+⭐ **Evaluación:**
+{evaluation}
+
+💡 **Generado:** {generated_at}"""
+
+GENERAR_TEXT = (
+    "🤖 **GENERACIÓN ESPECÍFICA DE RECETAS**\n\n"
+    "Selecciona el tipo de receta que quieres generar según tu comida del día:\n\n"
+    "🌅 **Desayuno:** Primera comida del día - energética y nutritiva\n"
+    "🍽️ **Almuerzo:** Comida principal del mediodía - completa y saciante\n"
+    "🥜 **Merienda:** Snack de la tarde - rico en micronutrientes\n"
+    "🌙 **Cena:** Última comida del día - ligera y digestiva\n\n"
+    "**Cada receta se adaptará automáticamente a tu perfil nutricional y enfoque dietético.**"
+)
+
+# ========================================
+# TECLADOS ESTÁTICOS (se construyen una vez al importar)
+# ========================================
+
+# Enfoque dietético en /perfil
+PERFIL_KEYBOARD = types.InlineKeyboardMarkup(row_width=1)
+PERFIL_KEYBOARD.add(
+    types.InlineKeyboardButton("🇪🇸 Tradicional Español - Platos equilibrados, ingredientes mediterráneos", callback_data="approach_tradicional"),
+    types.InlineKeyboardButton("💪 Fitness Orientado - Optimización nutricional, macros precisos", callback_data="approach_fitness")
+)
+
+# Secciones editables en /editar_perfil
+EDITAR_PERFIL_KEYBOARD = types.InlineKeyboardMarkup(row_width=1)
+EDITAR_PERFIL_KEYBOARD.add(
+    types.InlineKeyboardButton("🍽️ Alimentos Preferidos", callback_data="edit_liked_foods"),
+    types.InlineKeyboardButton("🚫 Alimentos a Evitar", callback_data="edit_disliked_foods"),
+    types.InlineKeyboardButton("👨‍🍳 Métodos de Cocción", callback_data="edit_cooking_methods"),
+    types.InlineKeyboardButton("⏰ Horario de Entrenamiento", callback_data="edit_training_schedule"),
+    types.InlineKeyboardButton("❌ Cancelar", callback_data="cancel_edit")
+)
+
+# Confirmación del preview de /configurar_menu
+MENU_CONFIRM_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+MENU_CONFIRM_KEYBOARD.add(
+    types.InlineKeyboardButton("✅ Confirmar menú", callback_data="menu_confirm"),
+    types.InlineKeyboardButton("✏️ Editar recetas", callback_data="menu_edit")
+)
+MENU_CONFIRM_KEYBOARD.add(
+    types.InlineKeyboardButton("💾 Guardar configuración", callback_data="menu_save_config")
+)
+
+def shorten_label(text: str, max_length: int = 30) -> str:
+    """Acortar texto para botones, terminando en '...' si supera max_length"""
+    if len(text) <= max_length:
+        return text
+    return text[:max_length - 3] + "..."
+
+# Temas de /nueva_semana
+NUEVA_SEMANA_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+NUEVA_SEMANA_KEYBOARD.add(
+    types.InlineKeyboardButton("🌊 Mediterránea", callback_data="theme_mediterranea"),
+    types.InlineKeyboardButton("💪 Alta Proteína", callback_data="theme_alta_proteina")
+)
+NUEVA_SEMANA_KEYBOARD.add(
+    types.InlineKeyboardButton("🌿 Detox Natural", callback_data="theme_detox_natural"),
+    types.InlineKeyboardButton("⚡ Energía Sostenida", callback_data="theme_energia_sostenida")
+)
+NUEVA_SEMANA_KEYBOARD.add(
+    types.InlineKeyboardButton("🌈 Variedad Máxima", callback_data="theme_variedad_maxima")
+)
+NUEVA_SEMANA_KEYBOARD.add(
+    types.InlineKeyboardButton("🎯 Auto-selección IA", callback_data="theme_auto")
+)
+
+# Timings de /generar (ocultando pre/post entreno según solicitud)
+GENERAR_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+GENERAR_KEYBOARD.add(
+    types.InlineKeyboardButton("🌅 Desayuno", callback_data="gen_desayuno"),
+    types.InlineKeyboardButton("🍽️ Almuerzo", callback_data="gen_almuerzo")
+)
+GENERAR_KEYBOARD.add(
+    types.InlineKeyboardButton("🥜 Merienda", callback_data="gen_merienda"),
+    types.InlineKeyboardButton("🌙 Cena", callback_data="gen_cena")
+)
+
+# /valorar sin recetas recientes
+VALORAR_EMPTY_KEYBOARD = types.InlineKeyboardMarkup()
+VALORAR_EMPTY_KEYBOARD.add(
+    types.InlineKeyboardButton("🤖 Generar Recetas", callback_data="gen_comida_principal")
+)
+
+# /progreso con métricas registradas
+PROGRESO_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+PROGRESO_KEYBOARD.add(
+    types.InlineKeyboardButton("📊 Ver Reporte", callback_data="progress_report"),
+    types.InlineKeyboardButton("📈 Registrar Métrica", callback_data="progress_record")
+)
+PROGRESO_KEYBOARD.add(
+    types.InlineKeyboardButton("📅 Reporte Semanal", callback_data="progress_week"),
+    types.InlineKeyboardButton("📆 Reporte Mensual", callback_data="progress_month")
+)
+PROGRESO_KEYBOARD.add(
+    types.InlineKeyboardButton("🎯 Configurar Objetivos", callback_data="progress_goals")
+)
+
+# /progreso sin métricas (primera vez)
+PROGRESO_INTRO_KEYBOARD = types.InlineKeyboardMarkup(row_width=1)
+PROGRESO_INTRO_KEYBOARD.add(
+    types.InlineKeyboardButton("📈 Registrar Primera Métrica", callback_data="progress_record"),
+    types.InlineKeyboardButton("❓ ¿Cómo Funciona?", callback_data="progress_help")
+)
+
+# /progreso > Registrar métrica
+METRIC_SELECTION_TEXT = (
+    "📈 **REGISTRAR MÉTRICA**\n\n"
+    "**Selecciona la métrica que quieres registrar:**\n\n"
+    "⚖️ **Peso** - Peso corporal en kg\n"
+    "📊 **% Grasa** - Porcentaje de grasa corporal\n"
+    "💪 **Masa Muscular** - Masa muscular en kg\n"
+    "📏 **Cintura** - Circunferencia de cintura en cm\n"
+    "⚡ **Energía** - Nivel de energía (1-10)\n"
+    "💤 **Sueño** - Calidad de sueño (1-10)\n"
+    "🔄 **Recuperación** - Recuperación post-entreno (1-10)\n"
+    "🍽️ **Apetito** - Control del apetito (1-10)"
+)
+
+METRIC_SELECTION_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+METRIC_SELECTION_KEYBOARD.add(
+    types.InlineKeyboardButton("⚖️ Peso", callback_data="metric_weight"),
+    types.InlineKeyboardButton("📊 % Grasa", callback_data="metric_body_fat")
+)
+METRIC_SELECTION_KEYBOARD.add(
+    types.InlineKeyboardButton("💪 Masa Muscular", callback_data="metric_muscle_mass"),
+    types.InlineKeyboardButton("📏 Cintura", callback_data="metric_waist_circumference")
+)
+METRIC_SELECTION_KEYBOARD.add(
+    types.InlineKeyboardButton("⚡ Energía", callback_data="metric_energy_level"),
+    types.InlineKeyboardButton("💤 Sueño", callback_data="metric_sleep_quality")
+)
+METRIC_SELECTION_KEYBOARD.add(
+    types.InlineKeyboardButton("🔄 Recuperación", callback_data="metric_recovery_rate"),
+    types.InlineKeyboardButton("🍽️ Apetito", callback_data="metric_appetite")
+)
+
+# /editar_perfil: alimentos preferidos y a evitar comparten opciones
+EDIT_FOODS_KEYBOARD = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
+EDIT_FOODS_KEYBOARD.add(*(types.KeyboardButton(option) for option in (
+    "🥩 Carnes rojas", "🐔 Aves", "🐟 Pescados", "🥚 Huevos",
+    "🥛 Lácteos", "🥜 Frutos secos", "🫘 Legumbres", "🥬 Hojas verdes",
+    "🥦 Crucíferas", "🍅 Solanáceas", "🌿 Aromáticas", "🥕 Raíces",
+    "🌶️ Pimientos", "🥒 Pepináceas", "🫒 Aceitunas", "🥑 Aguacate",
+    "➡️ Continuar"
+)))
+
+EDIT_COOKING_METHODS_KEYBOARD = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
+EDIT_COOKING_METHODS_KEYBOARD.add(*(types.KeyboardButton(option) for option in (
+    "🔥 Horno", "🍳 Sartén", "🥘 Plancha", "🫕 Vapor",
+    "🥗 Crudo/Ensaladas", "🍲 Guisado", "🔥 Parrilla", "🥄 Hervido",
+    "➡️ Continuar"
+)))
+
+EDIT_TRAINING_SCHEDULE_KEYBOARD = types.ReplyKeyboardMarkup(row_width=1, resize_keyboard=True)
+EDIT_TRAINING_SCHEDULE_KEYBOARD.add(*(types.KeyboardButton(option) for option in (
+    "🌅 Mañana (6:00-12:00)",
+    "☀️ Mediodía (12:00-16:00)",
+    "🌆 Tarde (16:00-20:00)",
+    "🌙 Noche (20:00-24:00)",
+    "🔄 Variable/Cambia"
+)))
+
+# Preferencias de selección múltiple en /editar_perfil:
+# sección -> (título, descripción, etiqueta de lo seleccionado, teclado)
+EDIT_MULTISELECT_SECTIONS = {
+    "liked_foods": (
+        "🍽️ **EDITANDO ALIMENTOS PREFERIDOS**",
+        "Selecciona los alimentos que más te gustan. Puedes elegir múltiples opciones.",
+        "Actualmente seleccionados",
+        EDIT_FOODS_KEYBOARD
+    ),
+    "disliked_foods": (
+        "🚫 **EDITANDO ALIMENTOS A EVITAR**",
+        "Selecciona alimentos que prefieres evitar. Puedes elegir múltiples opciones.",
+        "Actualmente evitados",
+        EDIT_FOODS_KEYBOARD
+    ),
+    "cooking_methods": (
+        "👨‍🍳 **EDITANDO MÉTODOS DE COCCIÓN**",
+        "Selecciona tus métodos de cocción preferidos. Puedes elegir múltiples opciones.",
+        "Actualmente seleccionados",
+        EDIT_COOKING_METHODS_KEYBOARD
+    )
+}
+
+# Acciones tras /planificar_semana
+CRONOGRAMA_ACTIONS_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+CRONOGRAMA_ACTIONS_KEYBOARD.add(
+    types.InlineKeyboardButton("📋 Lista de Compras", callback_data="generate_shopping_list"),
+    types.InlineKeyboardButton("🗓️ Nuevo Cronograma", callback_data="new_schedule")
+)
+CRONOGRAMA_ACTIONS_KEYBOARD.add(
+    types.InlineKeyboardButton("⚙️ Personalizar", callback_data="customize_schedule"),
+    types.InlineKeyboardButton("📊 Ver Eficiencia", callback_data="schedule_metrics")
+)
+
+# Acciones tras /analisis_nutricional: puntuación < 70 (mejora) o >= 70 (avanzado)
+ANALISIS_MEJORA_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+ANALISIS_MEJORA_KEYBOARD.add(
+    types.InlineKeyboardButton("🎯 Plan de Mejora", callback_data="create_improvement_plan"),
+    types.InlineKeyboardButton("📋 Lista Optimizada", callback_data="generate_shopping_list")
+)
+ANALISIS_MEJORA_KEYBOARD.add(
+    types.InlineKeyboardButton("🆕 Nuevo Análisis", callback_data="new_nutrition_analysis"),
+    types.InlineKeyboardButton("📈 Ver Progreso", callback_data="progress_report")
+)
+
+ANALISIS_AVANZADO_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+ANALISIS_AVANZADO_KEYBOARD.add(
+    types.InlineKeyboardButton("🔬 Análisis Avanzado", callback_data="advanced_analytics"),
+    types.InlineKeyboardButton("📊 Exportar Datos", callback_data="export_analytics")
+)
+ANALISIS_AVANZADO_KEYBOARD.add(
+    types.InlineKeyboardButton("🆕 Nuevo Análisis", callback_data="new_nutrition_analysis"),
+    types.InlineKeyboardButton("📈 Ver Progreso", callback_data="progress_report")
+)
+
+# /analisis_nutricional sin datos suficientes
+ANALISIS_NO_DATA_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+ANALISIS_NO_DATA_KEYBOARD.add(
+    types.InlineKeyboardButton("📊 Registrar Métrica", callback_data="progress_record"),
+    types.InlineKeyboardButton("⭐ Valorar Recetas", callback_data="start_rating")
+)
+ANALISIS_NO_DATA_KEYBOARD.add(
+    types.InlineKeyboardButton("❓ ¿Cómo Funciona?", callback_data="analytics_help")
+)
+
+# Tras registrar una valoración
+RATING_DONE_KEYBOARD = types.InlineKeyboardMarkup(row_width=1)
+RATING_DONE_KEYBOARD.add(
+    types.InlineKeyboardButton("🧠 Ver Reporte Completo IA", callback_data="show_intelligence_report"),
+    types.InlineKeyboardButton("⭐ Valorar Otra Receta", callback_data="back_to_rating")
+)
+
+# /valorar_receta sin recetas recientes
+VALORAR_RECETA_EMPTY_KEYBOARD = types.InlineKeyboardMarkup(row_width=2)
+VALORAR_RECETA_EMPTY_KEYBOARD.add(
+    types.InlineKeyboardButton("🤖 Generar Receta", callback_data="gen_comida_principal"),
+    types.InlineKeyboardButton("📅 Plan Semanal", callback_data="theme_auto")
+)
+
+# Acceso al reporte de IA desde /valorar_receta
+INTELLIGENCE_REPORT_BUTTON = types.InlineKeyboardButton("🧠 Ver Reporte de IA", callback_data="show_intelligence_report")
+
+# ========================================
+# TEXTOS DERIVADOS DEL PERFIL
+# ========================================
+
+def format_food_list(food_list: List[str]) -> str:
+    """Formatear lista de alimentos con emojis"""
+    if not food_list:
+        return "Ninguna especificada"
+    
+    formatted = []
+    for food in food_list:
+        emoji = FOOD_EMOJIS.get(food, "🍽️")
+        name = food.replace("_", " ").title()
+        formatted.append(f"{emoji} {name}")
+    
+    return ", ".join(formatted)
+
+def format_cooking_methods(methods_list: List[str]) -> str:
+    """Formatear lista de métodos de cocción con emojis"""
+    if not methods_list:
+        return "Ninguno especificado"
+    
+    formatted = []
+    for method in methods_list:
+        emoji = METHOD_EMOJIS.get(method, "👨‍🍳")
+        name = method.replace("_", " ").title()
+        formatted.append(f"{emoji} {name}")
+    
+    return ", ".join(formatted)
+
+def build_preferences_display(user_profile: Dict) -> Dict[str, str]:
+    """Precalcular los textos de preferencias que muestra /mis_macros"""
+    preferences = user_profile.get("preferences", {})
+    exercise_profile = user_profile.get("exercise_profile", {})
+    
+    return {
+        "liked_foods": format_food_list(preferences.get("liked_foods", [])),
+        "disliked_foods": format_food_list(preferences.get("disliked_foods", [])),
+        "cooking_methods": format_cooking_methods(preferences.get("cooking_methods", [])),
+        "training_schedule": exercise_profile.get('training_schedule_desc', 'No especificado')
+    }
+
+def get_preferences_display(user_profile: Dict) -> Dict[str, str]:
+    """
+    Obtener los textos de preferencias guardados en el perfil.
+    Se recalculan al crear/editar el perfil; los perfiles antiguos los generan aquí.
+    """
+    display = user_profile.get("preferences_display")
+    if display is None:
+        with meal_bot.data_lock:
+            display = build_preferences_display(user_profile)
+            user_profile["preferences_display"] = display
+    return display
+
+# ========================================
+# COMANDOS PRINCIPALES
+# ========================================
+
+@bot.message_handler(commands=['start'])
+def start_command(message):
+    """Comando de inicio con personalización visual"""
+    telegram_id = str(message.from_user.id)
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    
+    if user_profile:
+        # Usuario existente - bienvenida personalizada
+        preferences = user_profile.get("preferences", {})
+        liked_count = len(preferences.get("liked_foods", []))
+        disliked_count = len(preferences.get("disliked_foods", []))
+        
+        welcome_text = WELCOME_BACK_TEMPLATE.format_map({
+            "objetivo": user_profile['basic_data']['objetivo_descripcion'],
+            "liked_count": liked_count,
+            "disliked_count": disliked_count,
+            "calories": user_profile['macros']['calories'],
+            "available_energy": user_profile['energy_data']['available_energy']
+        })
+    else:
+        # Nuevo usuario
+        welcome_text = WELCOME_NEW_USER_TEXT
+    
+    meal_bot.send_long_message(message.chat.id, welcome_text, parse_mode='Markdown')
+
+@bot.message_handler(commands=['perfil'])
+def perfil_command(message):
+    """Comando para configurar perfil de usuario"""
+    telegram_id = str(message.from_user.id)
+    
+    # Iniciar proceso de configuración de perfil
+    meal_bot.user_states[telegram_id] = {
+        "state": "profile_setup",
+        "step": "enfoque_dietetico",
+        "data": {}
+    }
+    
+    enqueue_send(
+        message.chat.id,
+        "👤 **CONFIGURACIÓN DE PERFIL NUTRICIONAL**\n\n"
+        "Antes de calcular tus macros personalizados, necesito conocer tu enfoque preferido:\n\n"
+        "🍽️ **¿Qué enfoque nutricional prefieres?**\n\n"
+        "**🇪🇸 Tradicional Español:**\n"
+        "• Platos mediterráneos equilibrados\n"
+        "• Ingredientes locales y de temporada\n"
+        "• Recetas familiares y culturales\n"
+        "• Enfoque en sabor y tradición\n\n"
+        "**💪 Fitness Orientado:**\n"
+        "• Optimización de macronutrientes\n"
+        "• Timing nutricional preciso\n"
+        "• Maximización de resultados deportivos\n"
+        "• Enfoque científico y medible\n\n"
+        "📍 _Esta elección influirá en el tipo de recetas y recomendaciones que recibirás_",
+        parse_mode='Markdown',
+        reply_markup=PERFIL_KEYBOARD
+    )
+
+@bot.message_handler(commands=['mis_macros'])
+def mis_macros_command(message):
+    """Mostrar macros calculados del usuario"""
+    telegram_id = str(message.from_user.id)
+    
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
+        return
+    response_text = meal_bot.get_rendered_text(telegram_id, "mis_macros", render_mis_macros, user_profile)
+    
+    meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown')
+
+def render_mis_macros(user_profile: Dict) -> str:
+    """Renderizar el texto de /mis_macros a partir del perfil"""
+    # Datos del perfil
+    basic_data = user_profile["basic_data"]
+    body_comp = user_profile["body_composition"]
+    energy_data = user_profile["energy_data"]
+    macros = user_profile["macros"]
+    
+    # Textos de preferencias precalculados en el perfil
+    preferences_display = get_preferences_display(user_profile)
+    
+    return MIS_MACROS_TEMPLATE.format_map({
+        "peso": basic_data['peso'],
+        "altura": basic_data['altura'],
+        "edad": basic_data['edad'],
+        "objetivo": basic_data['objetivo_descripcion'],
+        "bmr": body_comp['bmr'],
+        "body_fat_percentage": body_comp['body_fat_percentage'],
+        "lean_mass_kg": body_comp['lean_mass_kg'],
+        "bmi": body_comp['bmi'],
+        "available_energy": energy_data['available_energy'],
+        "ea_color": energy_data['ea_status']['color'],
+        "ea_description": energy_data['ea_status']['description'],
+        "tdee": energy_data['tdee'],
+        "daily_exercise_calories": energy_data['daily_exercise_calories'],
+        "protein_g": macros['protein_g'],
+        "protein_kcal": macros['protein_g'] * 4,
+        "carbs_g": macros['carbs_g'],
+        "carbs_kcal": macros['carbs_g'] * 4,
+        "fat_g": macros['fat_g'],
+        "fat_kcal": macros['fat_g'] * 9,
+        "calories": macros['calories'],
+        "liked_foods": preferences_display["liked_foods"],
+        "disliked_foods": preferences_display["disliked_foods"],
+        "cooking_methods": preferences_display["cooking_methods"],
+        "training_schedule": preferences_display["training_schedule"],
+        "ea_recommendation": energy_data['ea_status']['recommendation']
+    })
+
+@bot.message_handler(commands=['editar_perfil'])
+def editar_perfil_command(message):
+    """Comando para editar preferencias del perfil existente"""
+    telegram_id = str(message.from_user.id)
+    
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
+        return
+    
+    # Obtener preferencias actuales
+    preferences = user_profile.get("preferences", {})
+    exercise_profile = user_profile.get("exercise_profile", {})
+    
+    current_preferences = f"""
+📝 **TUS PREFERENCIAS ACTUALES:**
+
+🍽️ **Alimentos preferidos:**
+{', '.join(preferences.get('liked_foods', [])) if preferences.get('liked_foods') else 'Ninguno seleccionado'}
+
+🚫 **Alimentos a evitar:**
+{', '.join(preferences.get('disliked_foods', [])) if preferences.get('disliked_foods') else 'Ninguno seleccionado'}
+
+👨‍🍳 **Métodos de cocción:**
+{', '.join(preferences.get('cooking_methods', [])) if preferences.get('cooking_methods') else 'Ninguno seleccionado'}
+
+⏰ **Horario de entrenamiento:**
+{exercise_profile.get('training_schedule_desc', 'No especificado')}
+
+**¿Qué quieres modificar?**
+"""
+    
+    enqueue_send(
+        message.chat.id,
+        current_preferences,
+        parse_mode='Markdown',
+        reply_markup=EDITAR_PERFIL_KEYBOARD
+    )
+
+@bot.message_handler(commands=['menu'])
+def menu_command(message):
+    """Mostrar menú semanal con timing nutricional"""
+    telegram_id = str(message.from_user.id)
+    
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
+        return
+    
+    # Generar menú con timing nutricional
+    try:
+        menu_text = format_menu_for_telegram(user_profile)
+        meal_bot.send_long_message(message.chat.id, menu_text, parse_mode='Markdown')
+        
+    except Exception as e:
+        logger.error("Error generating menu: %s", e)
+        
+        # Fallback a menú básico
+        fallback_text = MENU_FALLBACK_TEMPLATE.format_map({
+            "objetivo": user_profile['basic_data']['objetivo_descripcion'],
+            "calories": user_profile['macros']['calories'],
+            "available_energy": user_profile['energy_data']['available_energy']
+        })
+        
         meal_bot.send_long_message(message.chat.id, fallback_text, parse_mode='Markdown')
 
 @bot.message_handler(commands=['configurar_menu'])
@@ -589,19 +1967,18 @@ def configurar_menu_command(message):
     """Configurar menú semanal personalizado con recetas guardadas"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
     # Obtener recetas guardadas por categoría
-    recipes_by_category = meal_bot.weekly_menu_system.get_user_saved_recipes(user_profile)
+    recipes_by_category = meal_bot.get_user_saved_recipes(telegram_id, user_profile)
     
     # Verificar si tiene recetas guardadas
     total_recipes = sum(len(recipes) for recipes in recipes_by_category.values())
     
     if total_recipes == 0:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "🤖 **CONFIGURAR MENÚ SEMANAL**\n\n"
             "❌ **No tienes recetas guardadas aún.**\n\n"
@@ -620,8 +1997,9 @@ def configurar_menu_command(message):
         "state": "menu_configuration",
         "step": "category_selection",
         "data": {
-            "selected_recipes": {"desayuno": [], "almuerzo": [], "merienda": [], "cena": []},
-            "current_category": "desayuno"
+            "selected_recipes": {"desayuno": set(), "almuerzo": set(), "merienda": set(), "cena": set()},
+            "current_category": "desayuno",
+            "recipes_cache": recipes_by_category
         }
     }
     
@@ -648,14 +2026,23 @@ def configurar_menu_command(message):
 ➡️ **Comenzaremos con el DESAYUNO**
 """
     
-    bot.send_message(message.chat.id, summary_text, parse_mode='Markdown')
-    
-    # Mostrar recetas de desayuno para selección
-    show_category_recipe_selection(telegram_id, "desayuno", user_profile)
+    # Resumen y recetas de desayuno en un único mensaje
+    show_category_recipe_selection(telegram_id, "desayuno", user_profile, recipes_by_category,
+                                   prefix_text=summary_text)
 
-def show_category_recipe_selection(telegram_id: str, category: str, user_profile: Dict):
-    """Mostrar interface de selección de recetas para una categoría"""
-    recipes_by_category = meal_bot.weekly_menu_system.get_user_saved_recipes(user_profile)
+def show_category_recipe_selection(telegram_id: str, category: str, user_profile: Dict,
+                                   recipes_by_category: Optional[Dict[str, List[Dict]]] = None,
+                                   prefix_text: str = ""):
+    """
+    Mostrar interface de selección de recetas para una categoría.
+    prefix_text se antepone al mensaje para no enviarlo por separado.
+    """
+    if recipes_by_category is None:
+        # Reutilizar las recetas cargadas al iniciar /configurar_menu
+        state_data = meal_bot.user_states.get(telegram_id, {}).get("data", {})
+        recipes_by_category = state_data.get("recipes_cache")
+        if recipes_by_category is None:
+            recipes_by_category = meal_bot.get_user_saved_recipes(telegram_id, user_profile)
     recipes = recipes_by_category.get(category, [])
     
     if not recipes:
@@ -663,24 +2050,27 @@ def show_category_recipe_selection(telegram_id: str, category: str, user_profile
         next_category = get_next_category(category)
         if next_category:
             meal_bot.user_states[telegram_id]["data"]["current_category"] = next_category
-            show_category_recipe_selection(telegram_id, next_category, user_profile)
+            show_category_recipe_selection(telegram_id, next_category, user_profile, recipes_by_category,
+                                           prefix_text=prefix_text)
         else:
             # Todas las categorías procesadas, generar preview
-            generate_menu_preview_step(telegram_id, user_profile)
+            generate_menu_preview_step(telegram_id, user_profile, prefix_text=prefix_text)
         return
     
     # Crear keyboard con recetas disponibles
     keyboard = types.InlineKeyboardMarkup(row_width=1)
     
+    # Recetas ya seleccionadas (set en el estado de conversación)
+    selected_set = meal_bot.user_states[telegram_id]["data"]["selected_recipes"][category]
+    
     # Botones para cada receta
-    for recipe in recipes[:7]:  # Máximo 7 recetas por categoría
+    for recipe in itertools.islice(recipes, 7):  # Máximo 7 recetas por categoría
         # Verificar si ya está seleccionada
-        is_selected = recipe["id"] in meal_bot.user_states[telegram_id]["data"]["selected_recipes"][category]
+        is_selected = recipe["id"] in selected_set
         checkbox = "✅" if is_selected else "☐"
         
         # Mostrar nombre y calorías
-        display_name = recipe["name"] if len(recipe["name"]) <= 30 else f"{recipe['name'][:27]}..."
-        button_text = f"{checkbox} {display_name} ({recipe['calories']} kcal)"
+        button_text = f"{checkbox} {shorten_label(recipe['name'])} ({recipe['calories']} kcal)"
         
         keyboard.add(
             types.InlineKeyboardButton(
@@ -694,18 +2084,10 @@ def show_category_recipe_selection(telegram_id: str, category: str, user_profile
         types.InlineKeyboardButton("➡️ Continuar con siguiente categoría", callback_data=f"menu_next_{category}")
     )
     
-    # Mapear categorías a emojis
-    category_icons = {
-        "desayuno": "🌅",
-        "almuerzo": "🍽️", 
-        "merienda": "🥜",
-        "cena": "🌙"
-    }
-    
-    selected_count = len(meal_bot.user_states[telegram_id]["data"]["selected_recipes"][category])
+    selected_count = len(selected_set)
     
     category_text = f"""
-{category_icons.get(category, "🍽️")} **SELECCIONAR RECETAS DE {category.upper()}**
+{MENU_CATEGORY_ICONS.get(category, "🍽️")} **SELECCIONAR RECETAS DE {category.upper()}**
 
 **Recetas seleccionadas:** {selected_count}/{len(recipes)}
 
@@ -721,28 +2103,26 @@ def show_category_recipe_selection(telegram_id: str, category: str, user_profile
 👆 **Toca las recetas que quieres incluir:**
 """
     
-    bot.send_message(
+    enqueue_send(
         telegram_id, 
-        category_text, 
+        prefix_text + category_text, 
         parse_mode='Markdown',
         reply_markup=keyboard
     )
 
 def get_next_category(current_category: str) -> Optional[str]:
     """Obtener la siguiente categoría en el flujo"""
-    categories = ["desayuno", "almuerzo", "merienda", "cena"]
-    try:
-        current_index = categories.index(current_category)
-        if current_index < len(categories) - 1:
-            return categories[current_index + 1]
-    except ValueError:
-        pass
-    return None
+    return NEXT_MENU_CATEGORY.get(current_category)
 
-def generate_menu_preview_step(telegram_id: str, user_profile: Dict):
+def generate_menu_preview_step(telegram_id: str, user_profile: Dict, prefix_text: str = ""):
     """Generar preview del menú y mostrar opciones finales"""
     user_state = meal_bot.user_states[telegram_id]
-    selected_recipes = user_state["data"]["selected_recipes"]
+    
+    # Los sets del estado se pasan como listas (orden estable) al sistema de menús
+    selected_recipes = {
+        category: sorted(recipe_ids)
+        for category, recipe_ids in user_state["data"]["selected_recipes"].items()
+    }
     
     # Crear distribución semanal
     weekly_menu = meal_bot.weekly_menu_system.create_weekly_distribution(selected_recipes, user_profile)
@@ -750,26 +2130,16 @@ def generate_menu_preview_step(telegram_id: str, user_profile: Dict):
     # Generar preview
     preview_text = meal_bot.weekly_menu_system.generate_menu_preview(weekly_menu, user_profile)
     
-    # Guardar en estado temporal
-    user_state["data"]["weekly_menu"] = weekly_menu
-    user_state["step"] = "preview_confirmation"
-    
-    # Botones de confirmación
-    keyboard = types.InlineKeyboardMarkup(row_width=2)
-    keyboard.add(
-        types.InlineKeyboardButton("✅ Confirmar menú", callback_data="menu_confirm"),
-        types.InlineKeyboardButton("✏️ Editar recetas", callback_data="menu_edit")
-    )
-    keyboard.add(
-        types.InlineKeyboardButton("💾 Guardar configuración", callback_data="menu_save_config")
-    )
-    
-    # Enviar preview
+    # Guardar en estado temporal
+    user_state["data"]["weekly_menu"] = weekly_menu
+    user_state["step"] = "preview_confirmation"
+    
+    # Enviar preview con botones de confirmación
     meal_bot.send_long_message(
         telegram_id, 
-        preview_text, 
+        prefix_text + preview_text, 
         parse_mode='Markdown',
-        reply_markup=keyboard
+        reply_markup=MENU_CONFIRM_KEYBOARD
     )
 
 @bot.message_handler(commands=['recetas'])
@@ -777,35 +2147,15 @@ def recetas_command(message):
     """Mostrar recetas generadas por el usuario"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
-    
-    user_profile = meal_bot.get_user_profile(telegram_id)
     generated_recipes = user_profile.get("generated_recipes", [])
     
     if not generated_recipes:
-        response_text = """
-📚 **TUS RECETAS GENERADAS**
-
-❌ **No tienes recetas generadas aún**
-
-Para generar recetas personalizadas:
-• Usa /generar para crear recetas específicas por timing
-• Usa /buscar [consulta] para recetas con IA
-
-**CATEGORÍAS DISPONIBLES:**
-
-⚡ **PRE-ENTRENO** (15-30 min antes)
-💪 **POST-ENTRENO** (0-30 min después)  
-🌅 **DESAYUNO** - Primera comida del día
-🍽️ **ALMUERZO** - Comida principal del mediodía
-🥜 **MERIENDA** - Snack de la tarde
-🌙 **CENA** - Última comida del día
-
-¡Genera tu primera receta con /generar!
-"""
+        response_text = RECETAS_EMPTY_TEXT
     else:
-        response_text = "📚 **TUS RECETAS GENERADAS**\n\n"
+        parts = ["📚 **TUS RECETAS GENERADAS**\n\n"]
         
         # Agrupar por categoría de timing
         categories = {
@@ -826,7 +2176,7 @@ Para generar recetas personalizadas:
         
         for category, category_name in categories.items():
             if category in recipes_by_category:
-                response_text += f"\n{category_name}\n"
+                parts.append(f"\n{category_name}\n")
                 for i, recipe in enumerate(recipes_by_category[category][:3], 1):  # Máximo 3 por categoría
                     recipe_data = recipe["recipe_data"]
                     name = recipe_data.get("nombre", "Receta sin nombre")
@@ -834,15 +2184,20 @@ Para generar recetas personalizadas:
                     score = recipe["validation_score"]
                     date = recipe["generated_date"][:10]  # Solo fecha
                     
-                    response_text += f"• {name}\n"
-                    response_text += f"  {calories} kcal • ⭐{score}/100 • {date}\n"
-                response_text += "\n"
+                    parts.extend([
+                        f"• {name}\n",
+                        f"  {calories} kcal • ⭐{score}/100 • {date}\n"
+                    ])
+                parts.append("\n")
         
         total_recipes = len(generated_recipes)
-        response_text += f"**Total de recetas:** {total_recipes}\n"
-        response_text += f"**Mostrando:** Las más recientes por categoría\n\n"
-        response_text += "💡 **Generar más:** /generar\n"
-        response_text += "🔍 **Búsqueda específica:** /buscar [consulta]"
+        parts.extend([
+            f"**Total de recetas:** {total_recipes}\n",
+            "**Mostrando:** Las más recientes por categoría\n\n",
+            "💡 **Generar más:** /generar\n",
+            "🔍 **Búsqueda específica:** /buscar [consulta]"
+        ])
+        response_text = "".join(parts)
     
     meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown')
 
@@ -851,274 +2206,194 @@ def complementos_command(message):
     """Mostrar complementos mediterráneos personalizados según preferencias"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
+    complements = meal_bot.data.get("global_complements", {})
+    response_text = meal_bot.get_rendered_text(
+        telegram_id, "complementos", render_complementos, user_profile, complements
+    )
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
+    meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown', priority=PRIORITY_BULK)
+
+def render_complementos(user_profile: Dict, complements: Dict) -> str:
+    """Renderizar el texto de /complementos según perfil y preferencias"""
     preferences = user_profile.get("preferences", {})
     exercise_profile = user_profile.get("exercise_profile", {})
     
-    # Obtener preferencias del usuario
-    liked_foods = preferences.get("liked_foods", [])
-    disliked_foods = preferences.get("disliked_foods", [])
+    # Obtener preferencias del usuario (sets para comprobaciones O(1) en el bucle)
+    liked_set = frozenset(preferences.get("liked_foods", []))
+    disliked_set = frozenset(preferences.get("disliked_foods", []))
     training_schedule = exercise_profile.get("training_schedule", "variable")
     objetivo = user_profile["basic_data"]["objetivo"]
     
-    # Mostrar complementos de la base de datos
-    complements = meal_bot.data.get("global_complements", {})
-    
-    response_text = f"🥜 **COMPLEMENTOS MEDITERRÁNEOS PERSONALIZADOS**\n\n"
-    response_text += f"👤 **Adaptado a tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}\n"
-    response_text += f"⏰ **Timing:** {exercise_profile.get('training_schedule_desc', 'Variable')}\n\n"
+    parts = [
+        "🥜 **COMPLEMENTOS MEDITERRÁNEOS PERSONALIZADOS**\n\n",
+        f"👤 **Adaptado a tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}\n",
+        f"⏰ **Timing:** {exercise_profile.get('training_schedule_desc', 'Variable')}\n\n"
+    ]
     
-    def is_food_preferred(item_name_lower, category_name_lower):
+    def is_food_preferred(item_name_lower, liked_set, disliked_set):
         """Verificar si un complemento coincide con preferencias del usuario"""
+        matches = FOOD_MAPPING_RE.findall(item_name_lower)
+        if not matches:
+            return False, False
         
-        # Mapeo de complementos a categorías de alimentos
-        food_mappings = {
-            # Frutos secos
-            "almendras": "frutos_secos", "nueces": "frutos_secos", "pistachos": "frutos_secos",
-            "avellanas": "frutos_secos", "anacardos": "frutos_secos",
-            
-            # Lácteos
-            "yogur": "lacteos", "queso": "lacteos", "feta": "lacteos",
-            
-            # Aceitunas y derivados
-            "aceitunas": "aceitunas", "aceite": "aceitunas",
-            
-            # Frutas
-            "higos": "frutas", "dátiles": "frutas", "pasas": "frutas",
-            
-            # Otros
-            "miel": "endulzantes_naturales"
-        }
-        
-        for word, food_category in food_mappings.items():
-            if word in item_name_lower:
-                return food_category in liked_foods, food_category in disliked_foods
-        
-        return False, False
+        food_category = FOOD_MAPPINGS[min(matches, key=FOOD_MAPPING_PRIORITY.__getitem__)]
+        return food_category in liked_set, food_category in disliked_set
     
     total_shown = 0
     preferred_items = []
     neutral_items = []
     avoided_items = []
+    add_preferred = preferred_items.append
+    add_neutral = neutral_items.append
+    add_avoided = avoided_items.append
+    max_neutral_items = 8  # Limitar para no sobrecargar
     
     for category, items in complements.items():
         category_name = category.replace("_", " ").title()
         
         for item_id, item_data in items.items():
             name = item_data["name"]
+            
+            # Verificar preferencias
+            is_preferred, is_disliked = is_food_preferred(name.lower(), liked_set, disliked_set)
+            
+            # Neutrales ya completos: no formatear ni guardar el item
+            if not (is_preferred or is_disliked) and len(neutral_items) >= max_neutral_items:
+                continue
+            
             portion = item_data["portion_size"]
             unit = item_data["unit"]
             macros = item_data["macros_per_portion"]
             
-            # Verificar preferencias
-            is_preferred, is_disliked = is_food_preferred(name.lower(), category.lower())
-            
-            item_text = f"• {name} ({portion}{unit})\n"
-            item_text += f"  {macros['protein']}P / {macros['carbs']}C / {macros['fat']}G = {macros['calories']} kcal"
+            item_text = (
+                f"• {name} ({portion}{unit})\n"
+                f"  {macros['protein']}P / {macros['carbs']}C / {macros['fat']}G = {macros['calories']} kcal\n"
+            )
             
             if is_preferred:
-                preferred_items.append((category_name, f"✅ {item_text}"))
+                add_preferred((category_name, f"✅ {item_text}"))
             elif is_disliked:
-                avoided_items.append((category_name, f"⚠️ {item_text}"))
+                add_avoided((category_name, f"⚠️ {item_text}"))
             else:
-                neutral_items.append((category_name, item_text))
+                add_neutral((category_name, item_text))
+    
+    def append_grouped(items):
+        """Añadir items con una cabecera por categoría (ya vienen agrupados por categoría)"""
+        for category_name, group in itertools.groupby(items, key=itemgetter(0)):
+            parts.append(f"\n**{category_name.upper()}:**\n")
+            parts.extend(item_text for _, item_text in group)
+        parts.append("\n")
     
     # Mostrar complementos preferidos primero
     if preferred_items:
-        response_text += "⭐ **RECOMENDADOS PARA TI:**\n"
-        current_category = ""
-        for category_name, item_text in preferred_items:
-            if category_name != current_category:
-                response_text += f"\n**{category_name.upper()}:**\n"
-                current_category = category_name
-            response_text += f"{item_text}\n"
-        response_text += "\n"
+        parts.append("⭐ **RECOMENDADOS PARA TI:**\n")
+        append_grouped(preferred_items)
     
     # Mostrar complementos neutrales
     if neutral_items:
-        response_text += "🍽️ **OTROS COMPLEMENTOS DISPONIBLES:**\n"
-        current_category = ""
-        for category_name, item_text in neutral_items[:8]:  # Limitar para no sobrecargar
-            if category_name != current_category:
-                response_text += f"\n**{category_name.upper()}:**\n"
-                current_category = category_name
-            response_text += f"{item_text}\n"
-        response_text += "\n"
+        parts.append("🍽️ **OTROS COMPLEMENTOS DISPONIBLES:**\n")
+        append_grouped(neutral_items)
     
     # Mostrar complementos a evitar (si los hay)
     if avoided_items:
-        response_text += "🚫 **COMPLEMENTOS QUE EVITAS:**\n"
-        current_category = ""
-        for category_name, item_text in avoided_items:
-            if category_name != current_category:
-                response_text += f"\n**{category_name.upper()}:**\n"
-                current_category = category_name
-            response_text += f"{item_text}\n"
-        response_text += "\n"
+        parts.append("🚫 **COMPLEMENTOS QUE EVITAS:**\n")
+        append_grouped(avoided_items)
     
     # Timing personalizado según horario de entrenamiento
-    timing_recommendations = {
-        "mañana": {
-            "pre": "🌅 **Pre-entreno (6:00-6:30):** Miel + almendras",
-            "post": "☀️ **Post-entreno (8:00-9:00):** Yogur griego + nueces",
-            "tarde": "🌆 **Tarde:** Aceitunas + queso feta"
-        },
-        "mediodia": {
-            "pre": "☀️ **Pre-entreno (11:30-12:00):** Dátiles + pistachos",
-            "post": "🌞 **Post-entreno (14:00-15:00):** Yogur + miel",
-            "tarde": "🌆 **Tarde:** Frutos secos mixtos"
-        },
-        "tarde": {
-            "pre": "🌆 **Pre-entreno (15:30-16:00):** Miel + frutos secos",
-            "post": "🌙 **Post-entreno (20:30-21:00):** Yogur + aceitunas",
-            "noche": "🌃 **Noche:** Complementos según macros faltantes"
-        },
-        "noche": {
-            "pre": "🌙 **Pre-entreno (19:30-20:00):** Almendras + miel (ligero)",
-            "post": "🌃 **Post-entreno (22:00-22:30):** Yogur (evitar exceso)",
-            "descanso": "😴 **Antes de dormir:** Solo si faltan macros"
-        },
-        "variable": {
-            "general": "🔄 **Timing flexible:** Adapta según tu horario de entrenamiento",
-            "regla": "📋 **Regla general:** Pre-entreno ligero, post-entreno proteico"
-        }
-    }
+    schedule_recommendations = TIMING_RECOMMENDATIONS.get(training_schedule, TIMING_RECOMMENDATIONS["variable"])
     
-    schedule_recommendations = timing_recommendations.get(training_schedule, timing_recommendations["variable"])
-    
-    response_text += "⏰ **TIMING PERSONALIZADO PARA TI:**\n"
+    parts.append("⏰ **TIMING PERSONALIZADO PARA TI:**\n")
     for timing_name, recommendation in schedule_recommendations.items():
-        response_text += f"{recommendation}\n"
+        parts.append(f"{recommendation}\n")
     
-    response_text += f"""
+    parts.append(f"""
 
 🎯 **RECOMENDACIONES PARA {objetivo.upper().replace('_', ' ')}:**
-"""
+""")
     
     # Recomendaciones específicas por objetivo
-    objective_recommendations = {
-        "bajar_peso": [
-            "• Prioriza complementos altos en proteína (yogur griego)",
-            "• Controla porciones de frutos secos (máximo 30g/día)",
-            "• Evita miel en exceso (máximo 15g/día)"
-        ],
-        "subir_masa": [
-            "• Aumenta frecuencia de frutos secos y aceitunas",
-            "• Combina complementos para maximizar calorías",
-            "• Miel post-entreno para reponer glucógeno"
-        ],
-        "recomposicion": [
-            "• Timing preciso: proteínas post-entreno",
-            "• Carbohidratos (miel, frutas) solo peri-entreno",
-            "• Grasas saludables en comidas principales"
-        ],
-        "mantener": [
-            "• Distribución equilibrada durante el día",
-            "• Usa complementos para completar macros faltantes",
-            "• Flexibilidad según apetito y actividad"
-        ]
-    }
-    
-    recs = objective_recommendations.get(objetivo, objective_recommendations["mantener"])
+    recs = OBJECTIVE_RECOMMENDATIONS.get(objetivo, OBJECTIVE_RECOMMENDATIONS["mantener"])
     for rec in recs:
-        response_text += f"{rec}\n"
+        parts.append(f"{rec}\n")
     
-    response_text += f"""
+    parts.append("""
 
 💡 **PERSONALIZACIÓN ACTIVA:**
 ✅ Complementos filtrados según tus preferencias
 ✅ Timing adaptado a tu horario de entrenamiento
 ✅ Recomendaciones específicas para tu objetivo
 ✅ Usa `/editar_perfil` para modificar preferencias
-"""
+""")
     
-    meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown')
+    return "".join(parts)
 
 @bot.message_handler(commands=['favoritas'])
 def favoritas_command(message):
     """Mostrar recetas favoritas del usuario"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
-    
-    user_profile = meal_bot.get_user_profile(telegram_id)
     favorite_ids = meal_bot.profile_system.get_user_favorites(user_profile)
     
     if not favorite_ids:
-        response_text = """
-⭐ **TUS RECETAS FAVORITAS**
-
-❌ **No tienes recetas favoritas aún**
-
-Para añadir recetas a favoritos:
-• Genera recetas con `/generar`
-• Busca recetas con `/buscar [consulta]`
-• Marca las que te gusten con ⭐
-
-**¡Empieza a generar recetas personalizadas!**
-"""
-        bot.send_message(message.chat.id, response_text, parse_mode='Markdown')
+        response_text = NO_FAVORITES_TEXT
+        enqueue_send(message.chat.id, response_text, parse_mode='Markdown')
         return
     
-    # Obtener recetas favoritas de la base de datos
-    generated_recipes = meal_bot.data.get("generated_recipes", [])
-    favorite_recipes = []
+    # Índice id -> receta: lista global heredada y recetas generadas del usuario
+    recipes_by_id = {
+        recipe_entry.get("recipe_id"): recipe_entry
+        for recipe_entry in meal_bot.data.get("generated_recipes", [])
+    }
+    recipes_by_id.update(
+        (recipe_entry["id"], recipe_entry)
+        for recipe_entry in user_profile.get("generated_recipes", [])
+    )
     
-    for recipe_entry in generated_recipes:
-        recipe_id = recipe_entry.get("recipe_id")
-        if recipe_id in favorite_ids:
-            favorite_recipes.append(recipe_entry)
+    # Buscar solo las favoritas, en el orden en que se marcaron
+    favorite_recipes = [recipes_by_id[recipe_id] for recipe_id in favorite_ids if recipe_id in recipes_by_id]
     
     if not favorite_recipes:
-        response_text = """
-⭐ **TUS RECETAS FAVORITAS**
-
-⚠️ **Recetas favoritas no encontradas**
-
-Puede que algunas recetas favoritas ya no estén disponibles.
-Genera nuevas recetas con `/generar` y márcalas como favoritas.
-"""
-        bot.send_message(message.chat.id, response_text, parse_mode='Markdown')
+        response_text = FAVORITES_NOT_FOUND_TEXT
+        enqueue_send(message.chat.id, response_text, parse_mode='Markdown')
         return
     
-    # Mostrar recetas favoritas
-    response_text = f"⭐ **TUS RECETAS FAVORITAS**\n\n"
-    response_text += f"📚 **Total:** {len(favorite_recipes)} recetas\n\n"
+    # Mostrar recetas favoritas, enviadas por bloques según se generan
+    meal_bot.send_message_chunks(message.chat.id, iter_favoritas_fragments(favorite_recipes), parse_mode='Markdown')
+
+def iter_favoritas_fragments(favorite_recipes: List[Dict]) -> Iterator[str]:
+    """Generar el texto de /favoritas fragmento a fragmento"""
+    yield "⭐ **TUS RECETAS FAVORITAS**\n\n"
+    yield f"📚 **Total:** {len(favorite_recipes)} recetas\n\n"
     
     # Agrupar por categoría de timing
-    categories = {
-        "pre_entreno": "⚡ **PRE-ENTRENO**",
-        "post_entreno": "💪 **POST-ENTRENO**", 
-        "comida_principal": "🍽️ **COMIDA PRINCIPAL**",
-        "snack_complemento": "🥜 **SNACK/COMPLEMENTO**"
-    }
-    
-    recipes_by_category = {}
+    recipes_by_category = defaultdict(list)
     for recipe in favorite_recipes:
-        category = recipe.get("timing_category", "comida_principal")
-        if category not in recipes_by_category:
-            recipes_by_category[category] = []
-        recipes_by_category[category].append(recipe)
-    
-    for category, category_name in categories.items():
-        if category in recipes_by_category:
-            response_text += f"\n{category_name}\n"
-            for i, recipe in enumerate(recipes_by_category[category], 1):
-                recipe_data = recipe.get("recipe_data", {})
-                name = recipe_data.get("nombre", "Receta sin nombre")
-                macros = recipe_data.get("macros_per_portion", recipe_data.get("macros_por_porcion", {}))
-                calories = macros.get("calories", macros.get("calorias", "N/A"))
-                score = recipe.get("validation_score", 0)
-                date = recipe.get("generated_date", "")[:10] if recipe.get("generated_date") else "N/A"
-                
-                response_text += f"⭐ **{name}**\n"
-                response_text += f"   {calories} kcal • ⭐{score}/100 • {date}\n\n"
-    
-    response_text += """
+        recipes_by_category[recipe.get("timing_category", "comida_principal")].append(recipe)
+    
+    for category, category_name in FAVORITE_TIMING_CATEGORIES:
+        category_recipes = recipes_by_category.get(category)
+        if not category_recipes:
+            continue
+        
+        yield f"\n{category_name}\n"
+        for recipe in category_recipes:
+            recipe_data = recipe.get("recipe_data", {})
+            name = recipe_data.get("nombre", "Receta sin nombre")
+            macros = recipe_data.get("macros_per_portion", recipe_data.get("macros_por_porcion", {}))
+            calories = macros.get("calories", macros.get("calorias", "N/A"))
+            score = recipe.get("validation_score", 0)
+            generated_date = recipe.get("generated_date")
+            date = generated_date[:10] if generated_date else "N/A"
+            
+            yield f"⭐ **{name}**\n   {calories} kcal • ⭐{score}/100 • {date}\n\n"
+    
+    yield """
 💡 **GESTIÓN DE FAVORITAS:**
 • Usa 🚫 para quitar de favoritos
 • `/generar` para crear más recetas
@@ -1126,8 +2401,6 @@ Genera nuevas recetas con `/generar` y márcalas como favoritas.
 
 **¡Tus favoritas se guardan automáticamente!**
 """
-    
-    meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown')
 
 @bot.message_handler(commands=['buscar'])
 def buscar_command(message):
@@ -1138,10 +2411,11 @@ def buscar_command(message):
         return
     
     # Extraer consulta del mensaje
-    query = message.text.replace('/buscar', '').strip()
+    command_parts = message.text.split(maxsplit=1)
+    query = command_parts[1].strip() if len(command_parts) > 1 else ""
     
     if not query:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "🔍 **BÚSQUEDA INTELIGENTE DE RECETAS**\n\n"
             "Usa: `/buscar [tu consulta]`\n\n"
@@ -1162,7 +2436,7 @@ def buscar_command(message):
         "step": "processing"
     }
     
-    bot.send_message(
+    enqueue_send(
         message.chat.id,
         f"🤖 **Buscando recetas para:** '{query}'\n\n"
         "⏳ Generando opciones personalizadas con IA...\n"
@@ -1181,59 +2455,75 @@ def determine_optimal_theme(user_profile: Dict) -> str:
     objetivo = user_profile["basic_data"]["objetivo"]
     available_energy = user_profile["energy_data"]["available_energy"]
     preferences = user_profile.get("preferences", {})
-    liked_foods = preferences.get("liked_foods", [])
-    
-    # Scoring por objetivo
-    if objetivo == "subir_masa":
-        if available_energy > 50:
-            return "alta_proteina"
-        else:
-            return "energia_sostenida"
-    elif objetivo == "bajar_peso":
-        if "pescados" in liked_foods or "verduras" in liked_foods:
-            return "mediterranea"
-        else:
-            return "detox_natural"
-    elif objetivo == "recomposicion":
-        return "variedad_maxima"  # Balance perfecto
-    else:  # mantener
-        if "frutos_secos" in liked_foods or "aceitunas" in liked_foods:
-            return "mediterranea"
-        else:
-            return "variedad_maxima"
+    liked_foods = frozenset(preferences.get("liked_foods", []))
+    
+    # Huella del perfil: solo los campos que influyen en el tema
+    return _optimal_theme_for(
+        objetivo,
+        available_energy > 50,
+        "pescados" in liked_foods or "verduras" in liked_foods,
+        "frutos_secos" in liked_foods or "aceitunas" in liked_foods
+    )
+
+# Reglas de tema por objetivo: (energía alta, gusta ligero, gusta grasas mediterráneas) -> tema
+def _theme_subir_masa(high_energy: bool, likes_light_foods: bool, likes_mediterranean_fats: bool) -> str:
+    return "alta_proteina" if high_energy else "energia_sostenida"
+
+def _theme_bajar_peso(high_energy: bool, likes_light_foods: bool, likes_mediterranean_fats: bool) -> str:
+    return "mediterranea" if likes_light_foods else "detox_natural"
+
+def _theme_recomposicion(high_energy: bool, likes_light_foods: bool, likes_mediterranean_fats: bool) -> str:
+    return "variedad_maxima"  # Balance perfecto
+
+def _theme_mantener(high_energy: bool, likes_light_foods: bool, likes_mediterranean_fats: bool) -> str:
+    return "mediterranea" if likes_mediterranean_fats else "variedad_maxima"
+
+THEME_RULES_BY_OBJECTIVE = {
+    "subir_masa": _theme_subir_masa,
+    "bajar_peso": _theme_bajar_peso,
+    "recomposicion": _theme_recomposicion,
+    "mantener": _theme_mantener
+}
+
+@lru_cache(maxsize=64)
+def _optimal_theme_for(objetivo: str, high_energy: bool, likes_light_foods: bool,
+                       likes_mediterranean_fats: bool) -> str:
+    """Tema óptimo para una huella de perfil (memoizado)"""
+    theme_rule = THEME_RULES_BY_OBJECTIVE.get(objetivo, _theme_mantener)
+    return theme_rule(high_energy, likes_light_foods, likes_mediterranean_fats)
+
+# Cronogramas por tramo de Available Energy (umbrales inferiores inclusivos)
+COOKING_SCHEDULE_AE_THRESHOLDS = (35, 45, 60)
+COOKING_SCHEDULES_BY_AE = (
+    "preparacion_diaria",    # Mínimo esfuerzo
+    "tres_sesiones",         # Distribuida
+    "dos_sesiones",          # Balance
+    "sesion_unica_domingo"   # Máxima eficiencia
+)
 
 def determine_optimal_cooking_schedule(user_profile: Dict) -> str:
     """
     Determinar cronograma óptimo basándose en Available Energy
     """
     available_energy = user_profile["energy_data"]["available_energy"]
-    
-    if available_energy >= 60:
-        return "sesion_unica_domingo"  # Máxima eficiencia
-    elif available_energy >= 45:
-        return "dos_sesiones"  # Balance
-    elif available_energy >= 35:
-        return "tres_sesiones"  # Distribuida
-    else:
-        return "preparacion_diaria"  # Mínimo esfuerzo
+    return COOKING_SCHEDULES_BY_AE[bisect_right(COOKING_SCHEDULE_AE_THRESHOLDS, available_energy)]
 
-def generate_intelligent_week(message, user_profile: Dict, theme: str):
+def generate_intelligent_week(chat_id: int, telegram_id: str, user_profile: Dict, theme: str):
     """
     Generar plan semanal inteligente con tema específico
     """
     try:
-        telegram_id = str(message.from_user.id)
-        
         # Mostrar mensaje de generación
-        processing_msg = bot.send_message(
-            message.chat.id,
+        processing_msg = enqueue_send(
+            chat_id,
             "🤖 **Generando plan semanal inteligente...**\n\n"
             "⚡ Analizando tu perfil nutricional\n"
             "🎯 Aplicando algoritmos de variedad\n"
             "🌊 Integrando ingredientes estacionales\n"
             "📊 Calculando métricas de calidad\n\n"
             "*Esto puede tomar unos segundos...*",
-            parse_mode='Markdown'
+            parse_mode='Markdown',
+            dedupe=False
         )
         
         # Preparar preferencias de semana
@@ -1258,9 +2548,6 @@ def generate_intelligent_week(message, user_profile: Dict, theme: str):
             user_profile, week_preferences
         )
         
-        # Eliminar mensaje de procesamiento
-        bot.delete_message(message.chat.id, processing_msg.message_id)
-        
         if result["success"]:
             # Formatear y enviar resultado
             formatted_plan = meal_bot.weekly_planner.format_weekly_plan_for_telegram(
@@ -1278,23 +2565,26 @@ def generate_intelligent_week(message, user_profile: Dict, theme: str):
                 types.InlineKeyboardButton("📊 Ver Métricas", callback_data="week_metrics")
             )
             
-            meal_bot.send_long_message(
-                message.chat.id, 
+            # El mensaje de procesamiento pasa a ser el plan; los botones van al final
+            meal_bot.replace_processing_message(
+                chat_id,
+                processing_msg,
                 formatted_plan, 
                 parse_mode='Markdown',
-                reply_markup=keyboard
+                final_reply_markup=keyboard
             )
             
-            # Guardar plan en el perfil del usuario
-            if "current_week_plan" not in user_profile:
-                user_profile["current_week_plan"] = {}
-            
-            user_profile["current_week_plan"] = {
-                "plan_data": result,
-                "generated_at": datetime.now().isoformat(),
-                "theme_used": theme
-            }
-            meal_bot.database.save_user_profile(telegram_id, user_profile)
+            with meal_bot.data_lock:
+                # Guardar plan en el perfil del usuario
+                if "current_week_plan" not in user_profile:
+                    user_profile["current_week_plan"] = {}
+                
+                user_profile["current_week_plan"] = {
+                    "plan_data": result,
+                    "generated_at": datetime.now().isoformat(),
+                    "theme_used": theme
+                }
+                meal_bot.save_user_profile(telegram_id, user_profile)
             
         else:
             error_message = f"""
@@ -1309,12 +2599,17 @@ def generate_intelligent_week(message, user_profile: Dict, theme: str):
 
 **Puedes intentar de nuevo con `/nueva_semana`**
 """
-            bot.send_message(message.chat.id, error_message, parse_mode='Markdown')
+            meal_bot.replace_processing_message(
+                chat_id,
+                processing_msg,
+                error_message,
+                parse_mode='Markdown'
+            )
             
     except Exception as e:
-        logger.error(f"Error generating intelligent week: {e}")
-        bot.send_message(
-            message.chat.id,
+        logger.error("Error generating intelligent week: %s", e)
+        enqueue_send(
+            chat_id,
             f"❌ **Error interno:** {str(e)}\n\nIntenta de nuevo con `/nueva_semana`",
             parse_mode='Markdown'
         )
@@ -1324,64 +2619,30 @@ def nueva_semana_command(message):
     """Generar plan semanal inteligente"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
     # Extraer argumentos del comando (tema opcional)
     command_parts = message.text.split()
     requested_theme = command_parts[1] if len(command_parts) > 1 else None
     
-    # Crear teclado inline para selección de tema
-    keyboard = types.InlineKeyboardMarkup(row_width=2)
-    
-    # Botones de temas disponibles
-    keyboard.add(
-        types.InlineKeyboardButton("🌊 Mediterránea", callback_data="theme_mediterranea"),
-        types.InlineKeyboardButton("💪 Alta Proteína", callback_data="theme_alta_proteina")
-    )
-    keyboard.add(
-        types.InlineKeyboardButton("🌿 Detox Natural", callback_data="theme_detox_natural"),
-        types.InlineKeyboardButton("⚡ Energía Sostenida", callback_data="theme_energia_sostenida")
-    )
-    keyboard.add(
-        types.InlineKeyboardButton("🌈 Variedad Máxima", callback_data="theme_variedad_maxima")
-    )
-    keyboard.add(
-        types.InlineKeyboardButton("🎯 Auto-selección IA", callback_data="theme_auto")
-    )
-    
     # Si se especificó tema, generar directamente
-    if requested_theme and requested_theme in ['mediterranea', 'alta_proteina', 'detox_natural', 'energia_sostenida', 'variedad_maxima']:
-        generate_intelligent_week(message, user_profile, requested_theme)
+    if requested_theme in VALID_WEEK_THEMES:
+        generate_intelligent_week(message.chat.id, telegram_id, user_profile, requested_theme)
         return
     
     # Mostrar opciones de tema
-    response_text = f"""
-🗓️ **PLANIFICACIÓN SEMANAL INTELIGENTE**
-
-👤 **Tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}
-🔥 **Calorías diarias:** {user_profile['macros']['calories']} kcal
-⚡ **Available Energy:** {user_profile['energy_data']['available_energy']} kcal/kg FFM
-
-🎨 **TEMAS SEMANALES DISPONIBLES:**
-
-🌊 **Mediterránea** - Ingredientes tradicionales mediterráneos
-💪 **Alta Proteína** - Maximizar síntesis proteica y recuperación  
-🌿 **Detox Natural** - Alimentos depurativos y antioxidantes
-⚡ **Energía Sostenida** - Carbohidratos complejos y grasas saludables
-🌈 **Variedad Máxima** - Máxima diversidad de ingredientes
-
-🎯 **Auto-selección IA** - Deja que la IA elija el tema óptimo para ti
-
-**Selecciona un tema para generar tu plan semanal inteligente:**
-"""
+    response_text = NUEVA_SEMANA_TEMPLATE.format_map({
+        "objetivo": user_profile['basic_data']['objetivo_descripcion'],
+        "calories": user_profile['macros']['calories'],
+        "available_energy": user_profile['energy_data']['available_energy']
+    })
     
-    bot.send_message(
+    enqueue_send(
         message.chat.id,
         response_text,
-        reply_markup=keyboard,
+        reply_markup=NUEVA_SEMANA_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -1390,34 +2651,15 @@ def lista_compras_command(message):
     """Generar lista de compras personalizada automática"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
     # Mostrar opciones de duración
-    response_text = f"""
-🛒 **LISTA DE COMPRAS PERSONALIZADA**
-
-👤 **Tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}
-🔥 **Calorías diarias:** {user_profile['macros']['calories']} kcal
-
-📅 **¿Para cuántos días quieres la lista?**
-
-🅰️ **3 días** - Lista compacta para meal prep corto
-🅱️ **5 días** - Lista estándar para semana laboral
-🅲️ **7 días** - Lista completa para toda la semana
-🅳️ **10 días** - Lista extendida para compra quincenal
-
-**Responde con la letra de tu opción (A, B, C, D)**
-
-✨ **La lista se adapta automáticamente a:**
-• Tus alimentos preferidos (cantidades aumentadas)
-• Alimentos que evitas (excluidos automáticamente)
-• Tu objetivo nutricional específico
-• Complementos mediterráneos optimizados
-• Distribución inteligente por frescura
-"""
+    response_text = LISTA_COMPRAS_TEMPLATE.format_map({
+        "objetivo": user_profile['basic_data']['objetivo_descripcion'],
+        "calories": user_profile['macros']['calories']
+    })
     
     meal_bot.user_states[telegram_id] = {
         "state": "shopping_list_setup",
@@ -1435,29 +2677,11 @@ def generar_command(message):
         return
     
     # Mostrar opciones de generación
-    keyboard = types.InlineKeyboardMarkup(row_width=2)
-    
-    # Botones por timing (ocultando pre/post entreno según solicitud)
-    keyboard.add(
-        types.InlineKeyboardButton("🌅 Desayuno", callback_data="gen_desayuno"),
-        types.InlineKeyboardButton("🍽️ Almuerzo", callback_data="gen_almuerzo")
-    )
-    keyboard.add(
-        types.InlineKeyboardButton("🥜 Merienda", callback_data="gen_merienda"),
-        types.InlineKeyboardButton("🌙 Cena", callback_data="gen_cena")
-    )
-    
-    bot.send_message(
+    enqueue_send(
         message.chat.id,
-        "🤖 **GENERACIÓN ESPECÍFICA DE RECETAS**\n\n"
-        "Selecciona el tipo de receta que quieres generar según tu comida del día:\n\n"
-        "🌅 **Desayuno:** Primera comida del día - energética y nutritiva\n"
-        "🍽️ **Almuerzo:** Comida principal del mediodía - completa y saciante\n"
-        "🥜 **Merienda:** Snack de la tarde - rico en micronutrientes\n"
-        "🌙 **Cena:** Última comida del día - ligera y digestiva\n\n"
-        "**Cada receta se adaptará automáticamente a tu perfil nutricional y enfoque dietético.**",
+        GENERAR_TEXT,
         parse_mode='Markdown',
-        reply_markup=keyboard
+        reply_markup=GENERAR_KEYBOARD
     )
 
 @bot.message_handler(commands=['valorar'])
@@ -1465,250 +2689,189 @@ def valorar_command(message):
     """Valorar recetas específicas con escala 1-5 estrellas"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
     # Verificar si hay recetas recientes generadas
-    recent_recipes = user_profile.get("recent_generated_recipes", [])
+    recent_recipes = recent_generated_recipes(user_profile)
     
     if not recent_recipes:
-        no_recipes_text = """
-⭐ **SISTEMA DE VALORACIÓN 1-5 ESTRELLAS**
-
-❌ **No hay recetas para valorar**
-
-Para valorar recetas necesitas:
-1. 🤖 Generar recetas con `/generar`
-2. 🔍 Buscar recetas con `/buscar [consulta]`
-3. ✅ Seleccionar recetas de las opciones
-
-💡 **¿Para qué sirven las valoraciones?**
-• Mejorar recomendaciones futuras personalizadas
-• Entrenar la IA con tus preferencias específicas
-• Optimizar el algoritmo según tu feedback
-
-🎯 **Genera algunas recetas primero y luego regresa aquí**
-"""
-        
-        keyboard = types.InlineKeyboardMarkup()
-        keyboard.add(
-            types.InlineKeyboardButton("🤖 Generar Recetas", callback_data="gen_comida_principal")
-        )
-        
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
-            no_recipes_text,
+            NO_RECIPES_TO_RATE_TEXT,
             parse_mode='Markdown',
-            reply_markup=keyboard
+            reply_markup=VALORAR_EMPTY_KEYBOARD
         )
         return
     
-    # Mostrar recetas disponibles para valorar
-    response_text = """
-⭐ **VALORAR RECETAS - ESCALA 1-5 ESTRELLAS**
-
-📋 **Selecciona la receta que quieres valorar:**
-
-"""
-    
-    keyboard = types.InlineKeyboardMarkup(row_width=1)
-    
     # Mostrar últimas 10 recetas
-    for i, recipe_data in enumerate(recent_recipes[-10:], 1):
-        recipe = recipe_data.get("recipe", {})
-        recipe_name = recipe.get("nombre", f"Receta {i}")
-        timing = recipe_data.get("timing_category", "")
-        
-        # Truncar nombre si es muy largo
-        display_name = recipe_name if len(recipe_name) <= 35 else f"{recipe_name[:32]}..."
-        
-        # Agregar emoji según timing
-        timing_emoji = {
-            "desayuno": "🌅",
-            "almuerzo": "🍽️",
-            "merienda": "🥜",
-            "cena": "🌙",
-            "pre_entreno": "⚡",
-            "post_entreno": "💪"
-        }.get(timing, "🍽️")
-        
-        keyboard.add(
-            types.InlineKeyboardButton(
-                f"{timing_emoji} {display_name}",
-                callback_data=f"rate_recipe_{i-1}"
-            )
-        )
-    
-    response_text += f"💫 **{len(recent_recipes[-10:])} recetas disponibles**\n\n"
-    response_text += "🌟 **Escala de valoración:**\n"
-    response_text += "⭐ = No me gustó\n"
-    response_text += "⭐⭐ = Regular\n" 
-    response_text += "⭐⭐⭐ = Buena\n"
-    response_text += "⭐⭐⭐⭐ = Muy buena\n"
-    response_text += "⭐⭐⭐⭐⭐ = Excelente\n\n"
-    response_text += "🤖 **Tus valoraciones ayudan a la IA a generar mejores recomendaciones**"
-    
-    bot.send_message(
-        message.chat.id,
-        response_text,
-        parse_mode='Markdown',
-        reply_markup=keyboard
+    response_text, keyboard = render_rate_menu(
+        recent_recipes, 10, VALORAR_HEADER_TEXT, VALORAR_FOOTER_TEXT
     )
+    meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown', reply_markup=keyboard)
 
 @bot.message_handler(commands=['valorar_receta'])
 def valorar_receta_command(message):
     """Valorar receta para mejorar IA"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
+    send_rating_menu(message.chat.id, user_profile)
+
+def send_rating_menu(chat_id: int, user_profile: Dict, priority: int = PRIORITY_COMMAND):
+    """Enviar el menú de /valorar_receta (también usado por el botón 'Valorar Otra Receta')"""
     # Verificar si hay recetas recientes generadas
-    recent_recipes = user_profile.get("recent_generated_recipes", [])
+    recent_recipes = recent_generated_recipes(user_profile)
     
     if not recent_recipes:
-        no_recipes_text = """
-⭐ **VALORAR RECETAS - SISTEMA DE APRENDIZAJE IA**
-
-❌ **No hay recetas recientes para valorar**
-
-Para poder valorar recetas necesitas:
-1. 🤖 Generar recetas con `/generar`
-2. 🔍 Buscar recetas con `/buscar [consulta]`
-3. 📅 Crear plan semanal con `/nueva_semana`
-
-💡 **¿Por qué valorar recetas?**
-• La IA aprende tus preferencias automáticamente
-• Mejoran las recomendaciones personalizadas
-• El sistema se adapta a tu gusto específico
-• Planes semanales más precisos
-
-🚀 **Genera tu primera receta:**
-"""
-        
-        # Crear botones para generar receta
-        keyboard = types.InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            types.InlineKeyboardButton("🤖 Generar Receta", callback_data="gen_comida_principal"),
-            types.InlineKeyboardButton("📅 Plan Semanal", callback_data="theme_auto")
-        )
-        
-        bot.send_message(
-            message.chat.id,
-            no_recipes_text,
+        enqueue_send(
+            chat_id,
+            NO_RECIPES_TO_LEARN_TEXT,
+            priority=priority,
             parse_mode='Markdown',
-            reply_markup=keyboard
+            reply_markup=VALORAR_RECETA_EMPTY_KEYBOARD
         )
         return
     
-    # Mostrar recetas disponibles para valorar
-    keyboard = types.InlineKeyboardMarkup(row_width=1)
+    # Mostrar hasta 5 recetas más recientes, con acceso al reporte de IA
+    header_text = VALORAR_RECETA_HEADER_TEMPLATE.format_map({
+        "objetivo": user_profile['basic_data']['objetivo_descripcion'],
+        "intelligence_score": meal_bot.recipe_intelligence.get_intelligence_score(
+            user_profile.get('recipe_intelligence', {})
+        )
+    })
+    response_text, keyboard = render_rate_menu(
+        recent_recipes, 5, header_text, VALORAR_RECETA_FOOTER_TEXT,
+        extra_buttons=(INTELLIGENCE_REPORT_BUTTON,)
+    )
+    meal_bot.send_long_message(chat_id, response_text, priority=priority, parse_mode='Markdown', reply_markup=keyboard)
+
+@lru_cache(maxsize=32)
+def render_schedule_body(schedule_type: str) -> str:
+    """
+    Texto común a todos los usuarios de un cronograma: cabecera, sesiones y
+    ventajas/consideraciones. cooking_schedules no se modifica en ejecución,
+    así que se renderiza una vez por tipo de cronograma
+    """
+    schedule_data = meal_bot.data['cooking_schedules'][schedule_type]
+    
+    parts = [CRONOGRAMA_HEADER_TEMPLATE.format_map({
+        "name": schedule_data.get('name', 'Personalizado'),
+        "description": schedule_data.get('description', 'Cronograma optimizado'),
+        "estimated_time": schedule_data.get('estimated_time', 'Variable')
+    })]
+    
+    sessions = schedule_data.get('sessions', [])
+    for i, session in enumerate(sessions, 1):
+        parts.append(CRONOGRAMA_SESSION_TEMPLATE.format_map({
+            "number": i,
+            "day": session.get('day', 'día').title(),
+            "start_time": session.get('start_time', '10:00'),
+            "duration": session.get('duration', '2-3 horas')
+        }))
+        parts.extend(f"• {task.replace('_', ' ').title()}\n" for task in session.get('tasks', []))
+    
+    # Ventajas/desventajas
+    pros = schedule_data.get('pros', [])
+    cons = schedule_data.get('cons', [])
     
-    response_text = f"""
-⭐ **VALORAR RECETAS - APRENDER PREFERENCIAS**
-
-👤 **Tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}
-🧠 **IA Score:** {meal_bot.recipe_intelligence._calculate_intelligence_score(user_profile.get('recipe_intelligence', {}))} /100
-
-📋 **RECETAS DISPONIBLES PARA VALORAR:**
-
-"""
+    if pros:
+        parts.append("\n✅ **VENTAJAS:**\n")
+        parts.extend(f"• {pro}\n" for pro in pros)
+    
+    if cons:
+        parts.append("\n⚠️ **CONSIDERACIONES:**\n")
+        parts.extend(f"• {con}\n" for con in cons)
+    
+    return "".join(parts)
+
+def render_cooking_schedule(schedule_type: str, user_profile: Dict, footer_text: str) -> str:
+    """Construir el texto de un cronograma de cocción (/cronograma y su selección)"""
+    profile_text = CRONOGRAMA_PROFILE_TEMPLATE.format_map({
+        "objetivo": user_profile["basic_data"]['objetivo_descripcion'],
+        "available_energy": user_profile["energy_data"]['available_energy'],
+        "calories": user_profile["macros"]['calories']
+    })
+    return "".join((render_schedule_body(schedule_type), profile_text, footer_text))
+
+def render_rate_menu(recent_recipes: List[Dict], max_shown: int, header_text: str, footer_text: str,
+                     extra_buttons: Tuple[types.InlineKeyboardButton, ...] = ()) -> Tuple[str, types.InlineKeyboardMarkup]:
+    """
+    Construir texto y teclado de selección de receta a valorar.
+    Las recetas se listan de la más reciente a la más antigua; cada botón lleva
+    el recipe_id, así la selección no depende de la posición en la lista
+    """
+    parts = [header_text]
+    keyboard = types.InlineKeyboardMarkup(row_width=1)
+    shown = 0
     
-    # Mostrar hasta 5 recetas más recientes
-    for i, recipe in enumerate(recent_recipes[-5:]):
-        recipe_name = recipe.get("nombre", f"Receta {i+1}")
-        recipe_timing = recipe.get("categoria_timing", "general")
+    for index, item in enumerate(itertools.islice(reversed(recent_recipes), max_shown)):
+        recipe = item.get("recipe", {})
+        recipe_name = recipe.get("nombre", f"Receta {index + 1}")
+        timing = item.get("timing_category", "")
+        timing_emoji = TIMING_EMOJIS.get(timing, "🍽️")
         calories = recipe.get("macros_por_porcion", {}).get("calorias", 0)
         
-        response_text += f"**{i+1}.** {recipe_name}\n"
-        response_text += f"   🎯 {recipe_timing.replace('_', ' ').title()} • {calories} kcal\n\n"
-        
-        # Botón para valorar esta receta específica
+        parts.append(
+            f"**{index + 1}.** {recipe_name}\n"
+            f"   {timing_emoji} {timing.replace('_', ' ').title()} • {calories} kcal\n\n"
+        )
         keyboard.add(
             types.InlineKeyboardButton(
-                f"⭐ Valorar: {recipe_name[:25]}{'...' if len(recipe_name) > 25 else ''}",
-                callback_data=f"rate_recipe_{i}"
+                f"{timing_emoji} {shorten_label(recipe_name, 35)}",
+                callback_data=f"rate_recipe_{recipe.get('recipe_id')}"
             )
         )
+        shown += 1
     
-    # Botón para ver reporte de inteligencia
-    keyboard.add(
-        types.InlineKeyboardButton("🧠 Ver Reporte de IA", callback_data="show_intelligence_report")
-    )
-    
-    response_text += """
-💡 **ESCALA DE VALORACIÓN:**
-⭐ = Muy malo (la IA evitará ingredientes/estilos similares)
-⭐⭐ = Malo (reduce recomendaciones similares)  
-⭐⭐⭐ = Neutro (sin cambios en preferencias)
-⭐⭐⭐⭐ = Bueno (aumenta recomendaciones similares)
-⭐⭐⭐⭐⭐ = Excelente (prioriza ingredientes/estilos similares)
-
-**¡Cada valoración mejora automáticamente tus recomendaciones futuras!**
-"""
+    for button in extra_buttons:
+        keyboard.add(button)
     
-    meal_bot.send_long_message(
-        message.chat.id,
-        response_text,
-        parse_mode='Markdown',
-        reply_markup=keyboard
-    )
+    parts.append(f"💫 **{shown} recetas disponibles**\n")
+    parts.append(footer_text)
+    return "".join(parts), keyboard
 
 @bot.message_handler(commands=['insights_ia'])
 def insights_ia_command(message):
     """Ver análisis detallado de preferencias aprendidas por la IA"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
     # Obtener insights detallados de preferencias
     insights = meal_bot.recipe_intelligence.get_user_preference_insights(user_profile)
     
     if not insights.get("insights_available"):
-        not_available_text = """
-🧠 **ANÁLISIS DE PREFERENCIAS IA**
-
-❌ **Sin datos suficientes para análisis**
-
-Para activar el análisis avanzado necesitas:
-• 🤖 Generar recetas con `/generar`
-• ⭐ Valorar recetas con `/valorar_receta`
-• 🔄 Seleccionar opciones del sistema múltiple
-
-💡 **¿Qué incluye el análisis IA?**
-• Patrones de ingredientes preferidos/evitados
-• Métodos de cocción que más te gustan
-• Análisis nutricional personalizado
-• Preferencias de timing (desayuno, almuerzo, etc.)
-• Tendencias dietéticas identificadas
-• Fuerza de las recomendaciones
-
-🚀 **Comienza generando tu primera receta:**
-"""
-        
         keyboard = types.InlineKeyboardMarkup(row_width=2)
         keyboard.add(
             types.InlineKeyboardButton("🤖 Generar Receta", callback_data="gen_comida_principal"),
-            types.InlineKeyboardButton("⭐ Valorar Existentes", url="t.me/" + bot.get_me().username + "?start=valorar")
+            types.InlineKeyboardButton("⭐ Valorar Existentes", url=f"t.me/{get_bot_username()}?start=valorar")
         )
         
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
-            not_available_text,
+            INSIGHTS_UNAVAILABLE_TEXT,
             parse_mode='Markdown',
             reply_markup=keyboard
         )
         return
     
-    # Formatear insights detallados
-    insights_text = f"""
+    # Formatear insights detallados y enviarlos por bloques
+    meal_bot.send_message_chunks(
+        message.chat.id,
+        iter_insights_fragments(user_profile, insights),
+        parse_mode='Markdown'
+    )
+
+def iter_insights_fragments(user_profile: Dict, insights: Dict) -> Iterator[str]:
+    """Generar el texto de /insights_ia fragmento a fragmento"""
+    yield f"""
 🧠 **ANÁLISIS AVANZADO DE PREFERENCIAS IA**
 
 👤 **Usuario:** {user_profile['basic_data']['objetivo_descripcion']}
@@ -1718,59 +2881,71 @@ Para activar el análisis avanzado necesitas:
 
 """
     
+    # Cada sección se emite como un único fragmento (una sola unión de líneas)
     # Análisis de ingredientes
     ingredient_insights = insights['ingredient_insights']
     if ingredient_insights.get('strong_preferences', 0) > 0:
-        insights_text += "🥗 **ANÁLISIS DE INGREDIENTES:**\n"
-        insights_text += f"• Preferencias fuertes: {ingredient_insights['strong_preferences']}\n"
-        insights_text += f"• Rechazos identificados: {ingredient_insights['strong_dislikes']}\n"
+        lines = [
+            "🥗 **ANÁLISIS DE INGREDIENTES:**",
+            f"• Preferencias fuertes: {ingredient_insights['strong_preferences']}",
+            f"• Rechazos identificados: {ingredient_insights['strong_dislikes']}"
+        ]
         
         if ingredient_insights.get('preferred_proteins'):
-            insights_text += f"• Proteínas favoritas: {', '.join(ingredient_insights['preferred_proteins'])}\n"
+            lines.append(f"• Proteínas favoritas: {', '.join(ingredient_insights['preferred_proteins'])}")
         
         if ingredient_insights.get('preferred_plants'):
-            insights_text += f"• Vegetales preferidos: {', '.join(ingredient_insights['preferred_plants'])}\n"
+            lines.append(f"• Vegetales preferidos: {', '.join(ingredient_insights['preferred_plants'])}")
         
-        insights_text += f"• Patrón dietético: {ingredient_insights['dietary_pattern'].replace('_', ' ').title()}\n\n"
+        lines.append(f"• Patrón dietético: {ingredient_insights['dietary_pattern'].replace('_', ' ').title()}")
+        yield "\n".join(lines) + "\n\n"
     
     # Análisis de métodos de cocción
     method_insights = insights['method_insights']
     if method_insights.get('preferred_methods'):
-        insights_text += "👨‍🍳 **MÉTODOS DE COCCIÓN:**\n"
-        insights_text += f"• Métodos preferidos: {', '.join(method_insights['preferred_methods'])}\n"
-        insights_text += f"• Complejidad: {method_insights['complexity_preference'].title()}\n"
-        insights_text += f"• Versatilidad: {method_insights['versatility_score']:.1%}\n\n"
+        yield "\n".join((
+            "👨‍🍳 **MÉTODOS DE COCCIÓN:**",
+            f"• Métodos preferidos: {', '.join(method_insights['preferred_methods'])}",
+            f"• Complejidad: {method_insights['complexity_preference'].title()}",
+            f"• Versatilidad: {method_insights['versatility_score']:.1%}"
+        )) + "\n\n"
     
     # Análisis nutricional
     nutrition_insights = insights['nutrition_insights']
     if nutrition_insights.get('preferred_macro_pattern'):
-        insights_text += "🎯 **PATRONES NUTRICIONALES:**\n"
-        insights_text += f"• Patrón de macros: {nutrition_insights['preferred_macro_pattern'].replace('_', ' ').title()}\n"
-        insights_text += f"• Enfoque nutricional: {nutrition_insights['nutrition_focus'].replace('_', ' ').title()}\n"
-        insights_text += f"• Flexibilidad: {nutrition_insights['flexibility']:.1%}\n\n"
+        yield "\n".join((
+            "🎯 **PATRONES NUTRICIONALES:**",
+            f"• Patrón de macros: {nutrition_insights['preferred_macro_pattern'].replace('_', ' ').title()}",
+            f"• Enfoque nutricional: {nutrition_insights['nutrition_focus'].replace('_', ' ').title()}",
+            f"• Flexibilidad: {nutrition_insights['flexibility']:.1%}"
+        )) + "\n\n"
     
     # Análisis de timing
     timing_insights = insights['timing_insights']
     if timing_insights.get('preferred_timing'):
-        insights_text += "⏰ **PREFERENCIAS DE TIMING:**\n"
-        insights_text += f"• Timing preferido: {timing_insights['preferred_timing'].replace('_', ' ').title()}\n"
-        insights_text += f"• Flexibilidad horaria: {timing_insights['timing_flexibility']}/4\n"
-        insights_text += f"• Enfoque en entreno: {'Sí' if timing_insights['training_focus'] else 'No'}\n\n"
+        yield "\n".join((
+            "⏰ **PREFERENCIAS DE TIMING:**",
+            f"• Timing preferido: {timing_insights['preferred_timing'].replace('_', ' ').title()}",
+            f"• Flexibilidad horaria: {timing_insights['timing_flexibility']}/4",
+            f"• Enfoque en entreno: {'Sí' if timing_insights['training_focus'] else 'No'}"
+        )) + "\n\n"
     
     # Recomendaciones para mejorar
-    insights_text += "💡 **RECOMENDACIONES PARA MEJORAR IA:**\n"
+    lines = ["💡 **RECOMENDACIONES PARA MEJORAR IA:**"]
     
     if insights['total_data_points'] < 10:
-        insights_text += "• Genera y valora más recetas (objetivo: 10+ valoraciones)\n"
+        lines.append("• Genera y valora más recetas (objetivo: 10+ valoraciones)")
     
     if insights['confidence_level'] < 50:
-        insights_text += "• Usa toda la escala de valoración (1-5 estrellas)\n"
-        insights_text += "• Selecciona opciones variadas en el sistema múltiple\n"
+        lines.append("• Usa toda la escala de valoración (1-5 estrellas)")
+        lines.append("• Selecciona opciones variadas en el sistema múltiple")
     
     if insights['recommendation_strength'] == 'weak':
-        insights_text += "• Interactúa más frecuentemente con las recomendaciones\n"
+        lines.append("• Interactúa más frecuentemente con las recomendaciones")
+    
+    yield "\n".join(lines) + "\n"
     
-    insights_text += f"""
+    yield """
 
 🤖 **COMANDOS IA AVANZADOS:**
 • `/valorar_receta` - Valorar para aprender
@@ -1779,114 +2954,63 @@ Para activar el análisis avanzado necesitas:
 
 **¡La IA mejora automáticamente con cada interacción!**
 """
-    
-    meal_bot.send_long_message(
-        message.chat.id,
-        insights_text,
-        parse_mode='Markdown'
-    )
 
 @bot.message_handler(commands=['progreso'])
 def progreso_command(message):
     """Seguimiento de progreso y métricas del usuario"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
-    
-    user_profile = meal_bot.get_user_profile(telegram_id)
+    basic_data = user_profile["basic_data"]
     
     # Verificar si tiene datos de tracking
     tracking_data = user_profile.get("progress_tracking", {})
     has_data = tracking_data and tracking_data.get("metrics")
     
     if has_data:
-        # Mostrar opciones de progreso
-        keyboard = types.InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            types.InlineKeyboardButton("📊 Ver Reporte", callback_data="progress_report"),
-            types.InlineKeyboardButton("📈 Registrar Métrica", callback_data="progress_record")
-        )
-        keyboard.add(
-            types.InlineKeyboardButton("📅 Reporte Semanal", callback_data="progress_week"),
-            types.InlineKeyboardButton("📆 Reporte Mensual", callback_data="progress_month")
-        )
-        keyboard.add(
-            types.InlineKeyboardButton("🎯 Configurar Objetivos", callback_data="progress_goals")
+        # Obtener métricas básicas
+        metrics = tracking_data.get("metrics", {})
+        total_metrics = len(metrics)
+        total_records = sum(len(records) for records in metrics.values())
+        
+        # Última métrica registrada: los timestamps ISO-8601 se ordenan como texto
+        last_timestamp = max(
+            (records[-1]["timestamp"] for records in metrics.values() if records),
+            default=None
         )
+        if last_timestamp:
+            last_record_date = datetime.fromisoformat(last_timestamp).strftime("%d/%m/%Y")
+        else:
+            last_record_date = "Nunca"
         
-        # Obtener métricas básicas
-        total_metrics = len(tracking_data.get("metrics", {}))
-        total_records = sum(len(records) for records in tracking_data.get("metrics", {}).values())
-        
-        # Última métrica registrada
-        last_record_date = "Nunca"
-        for metric_records in tracking_data.get("metrics", {}).values():
-            if metric_records:
-                last_date = datetime.fromisoformat(metric_records[-1]["timestamp"])
-                if last_record_date == "Nunca" or last_date > datetime.fromisoformat(last_record_date):
-                    last_record_date = last_date.strftime("%d/%m/%Y")
-        
-        progress_text = f"""
-📊 **SEGUIMIENTO DE PROGRESO**
-
-👤 **Tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}
-🎯 **Objetivo:** {user_profile['basic_data']['objetivo'].replace('_', ' ').title()}
-
-📈 **ESTADÍSTICAS DE TRACKING:**
-• Métricas registradas: {total_metrics} tipos
-• Total de registros: {total_records}
-• Último registro: {last_record_date}
-
-**¿Qué quieres hacer?**
-"""
+        progress_text = PROGRESO_TEMPLATE.format_map({
+            "objetivo_descripcion": basic_data['objetivo_descripcion'],
+            "objetivo": basic_data['objetivo'].replace('_', ' ').title(),
+            "total_metrics": total_metrics,
+            "total_records": total_records,
+            "last_record_date": last_record_date
+        })
         
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             progress_text,
             parse_mode='Markdown',
-            reply_markup=keyboard
+            reply_markup=PROGRESO_KEYBOARD
         )
     
     else:
         # Primera vez - introducir el sistema
-        keyboard = types.InlineKeyboardMarkup(row_width=1)
-        keyboard.add(
-            types.InlineKeyboardButton("📈 Registrar Primera Métrica", callback_data="progress_record"),
-            types.InlineKeyboardButton("❓ ¿Cómo Funciona?", callback_data="progress_help")
-        )
-        
-        intro_text = f"""
-📊 **SISTEMA DE SEGUIMIENTO DE PROGRESO**
-
-👤 **Tu objetivo:** {user_profile['basic_data']['objetivo_descripcion']}
-
-🎯 **¿QUÉ PUEDES TRACKEAR?**
-⚖️ Peso corporal
-📊 Porcentaje de grasa
-💪 Masa muscular  
-📏 Circunferencia de cintura
-⚡ Nivel de energía
-💤 Calidad de sueño
-🔄 Recuperación post-entreno
-🍽️ Control del apetito
-
-💡 **BENEFICIOS DEL TRACKING:**
-• Análisis automático de tendencias
-• Insights personalizados con IA
-• Recomendaciones adaptativas
-• Detección de patrones
-• Ajustes automáticos del plan
-
-🚀 **COMIENZA AHORA:**
-**Registra tu primera métrica para activar el sistema inteligente de seguimiento.**
-"""
+        intro_text = PROGRESO_INTRO_TEMPLATE.format_map({
+            "objetivo": basic_data['objetivo_descripcion']
+        })
         
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             intro_text,
             parse_mode='Markdown',
-            reply_markup=keyboard
+            reply_markup=PROGRESO_INTRO_KEYBOARD
         )
 
 @bot.message_handler(commands=['planificar_semana'])
@@ -1894,58 +3018,40 @@ def planificar_semana_command(message):
     """Generar cronograma optimizado de meal prep personalizado"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
+    # Extraer parámetros del comando (opcional), tokenizados y en minúsculas una vez
+    args = [arg.lower() for arg in message.text.split()[1:]]
     
-    # Extraer parámetros del comando (opcional)
-    args = message.text.split()[1:] if len(message.text.split()) > 1 else []
-    
-    # Configurar preferencias por defecto
-    default_preferences = {
-        "max_prep_time_hours": 6,
-        "preferred_prep_days": ["domingo"],
-        "max_session_hours": 4,
-        "cooking_experience": "intermedio",
-        "freshness_priority": 7,
-        "time_efficiency_priority": 8,
-        "storage_capacity": "medio",
-        "kitchen_equipment": ["basico"]
-    }
+    # Preferencias por defecto + personalización rápida (los presets se pueden combinar)
+    default_preferences = dict(SCHEDULE_BASE_PREFERENCES)
+    for arg in args:
+        default_preferences.update(SCHEDULE_PREFERENCE_PRESETS.get(arg, {}))
     
-    # Si hay argumentos, permitir personalización rápida
-    if args:
-        if "rapido" in args:
-            default_preferences["time_efficiency_priority"] = 10
-            default_preferences["max_prep_time_hours"] = 4
-        elif "fresco" in args:
-            default_preferences["freshness_priority"] = 10
-            default_preferences["preferred_prep_days"] = ["domingo", "miercoles"]
-        elif "simple" in args:
-            default_preferences["cooking_experience"] = "principiante"
-            default_preferences["max_session_hours"] = 2
-    
-    # Mostrar mensaje de procesamiento
-    processing_msg = bot.send_message(
-        message.chat.id,
-        "🗓️ **GENERANDO CRONOGRAMA OPTIMIZADO...**\n\n"
-        "⚙️ Analizando tu perfil y restricciones\n"
-        "📊 Calculando carga de trabajo total\n"
-        "🎯 Optimizando distribución temporal\n"
-        "📈 Aplicando algoritmos de eficiencia\n\n"
-        "*Esto puede tomar unos segundos...*",
-        parse_mode='Markdown'
-    )
+    # Reutilizar el cronograma si ya se calculó con estas preferencias
+    cache_params = json.dumps(default_preferences, sort_keys=True)
+    cache_version = meal_bot.get_cache_version(telegram_id)
+    result = meal_bot.get_cached_result(telegram_id, "schedule", cache_params, SCHEDULE_CACHE_TTL)
     
-    try:
-        # Generar cronograma optimizado
-        result = meal_bot.meal_prep_scheduler.generate_optimized_schedule(
-            user_profile, default_preferences
+    # Mostrar mensaje de procesamiento solo si hay que calcular
+    processing_msg = None
+    if result is None:
+        processing_msg = enqueue_send(
+            message.chat.id,
+            CRONOGRAMA_PROCESSING_TEXT,
+            parse_mode='Markdown',
+            dedupe=False
         )
-        
-        # Eliminar mensaje de procesamiento
-        bot.delete_message(message.chat.id, processing_msg.message_id)
+    
+    try:
+        if result is None:
+            # Generar cronograma optimizado
+            result = meal_bot.meal_prep_scheduler.generate_optimized_schedule(
+                user_profile, default_preferences
+            )
+            meal_bot.store_cached_result(telegram_id, "schedule", cache_params, result, cache_version)
         
         if result["success"]:
             # Formatear y enviar cronograma
@@ -1953,34 +3059,20 @@ def planificar_semana_command(message):
                 result, user_profile
             )
             
-            meal_bot.send_long_message(
-                message.chat.id,
-                formatted_schedule,
-                parse_mode='Markdown'
-            )
-            
-            # Botones de acciones rápidas
-            keyboard = types.InlineKeyboardMarkup(row_width=2)
-            keyboard.add(
-                types.InlineKeyboardButton("📋 Lista de Compras", callback_data="generate_shopping_list"),
-                types.InlineKeyboardButton("🗓️ Nuevo Cronograma", callback_data="new_schedule")
-            )
-            keyboard.add(
-                types.InlineKeyboardButton("⚙️ Personalizar", callback_data="customize_schedule"),
-                types.InlineKeyboardButton("📊 Ver Eficiencia", callback_data="schedule_metrics")
-            )
-            
-            bot.send_message(
+            # Cronograma y botones de acciones rápidas en el mismo envío, sobre el mensaje de procesamiento
+            meal_bot.replace_processing_message(
                 message.chat.id,
-                "🎯 **¿Qué quieres hacer con tu cronograma?**",
+                processing_msg,
+                formatted_schedule + "\n\n🎯 **¿Qué quieres hacer con tu cronograma?**",
                 parse_mode='Markdown',
-                reply_markup=keyboard
+                final_reply_markup=CRONOGRAMA_ACTIONS_KEYBOARD
             )
             
         else:
             error_msg = result.get("error", "Error desconocido")
-            bot.send_message(
+            meal_bot.replace_processing_message(
                 message.chat.id,
+                processing_msg,
                 f"❌ **Error generando cronograma:**\n{error_msg}\n\n"
                 "💡 **Intenta:**\n"
                 "• Usar `/planificar_semana` de nuevo\n"
@@ -1991,13 +3083,11 @@ def planificar_semana_command(message):
     
     except Exception as e:
         # Eliminar mensaje de procesamiento si existe
-        try:
-            bot.delete_message(message.chat.id, processing_msg.message_id)
-        except:
-            pass
+        if processing_msg is not None:
+            enqueue_delete(message.chat.id, processing_msg)
         
-        logger.error(f"Error in planificar_semana_command: {e}")
-        bot.send_message(
+        logger.error("Error in planificar_semana_command: %s", e)
+        enqueue_send(
             message.chat.id,
             f"❌ **Error procesando cronograma:**\n{str(e)}\n\n"
             "💡 **Soluciones:**\n"
@@ -2008,124 +3098,82 @@ def planificar_semana_command(message):
             parse_mode='Markdown'
         )
 
+def analysis_data_flags(user_profile: Dict) -> Tuple[bool, bool]:
+    """Indicar si el perfil tiene (métricas de progreso, valoraciones de recetas)"""
+    return (
+        bool(user_profile.get("progress_tracking", {}).get("metrics")),
+        bool(user_profile.get("recipe_intelligence", {}).get("ratings_history"))
+    )
+
 @bot.message_handler(commands=['analisis_nutricional'])
 def analisis_nutricional_command(message):
     """Generar análisis nutricional profundo con IA avanzada"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
-    # Extraer período del comando (opcional)
-    args = message.text.split()[1:]
+    # Extraer período del comando (opcional), tokenizado y en minúsculas una vez
+    args = [arg.lower() for arg in message.text.split()[1:]]
     period = "month"  # Default
     
     if args:
-        if "semana" in args[0].lower() or "week" in args[0].lower():
-            period = "week"
-        elif "trimestre" in args[0].lower() or "quarter" in args[0].lower():
-            period = "quarter"
-        elif "mes" in args[0].lower() or "month" in args[0].lower():
-            period = "month"
+        period = next(
+            (key for keyword, key in ANALYSIS_PERIOD_KEYWORDS if keyword in args[0]),
+            period
+        )
     
     # Verificar datos suficientes
-    progress_data = user_profile.get("progress_tracking", {})
-    recipe_intelligence = user_profile.get("recipe_intelligence", {})
-    
-    has_progress_data = progress_data and progress_data.get("metrics")
-    has_recipe_data = recipe_intelligence and recipe_intelligence.get("ratings_history")
+    has_progress_data, has_recipe_data = analysis_data_flags(user_profile)
     
     if not has_progress_data and not has_recipe_data:
         # Usuario sin datos - mostrar introducción
-        intro_text = f"""
-🧬 **ANÁLISIS NUTRICIONAL PROFUNDO CON IA**
-
-👤 **Tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}
-
-❌ **DATOS INSUFICIENTES PARA ANÁLISIS COMPLETO**
-
-🎯 **PARA DESBLOQUEAR ANÁLISIS PROFUNDO NECESITAS:**
-
-📊 **DATOS DE PROGRESO:**
-• Registra métricas con `/progreso`
-• Mínimo: peso, energía, sueño (1 semana)
-• Recomendado: 4+ métricas (2+ semanas)
-
-⭐ **DATOS DE PREFERENCIAS:**
-• Valora recetas con `/valorar_receta`
-• Mínimo: 3 valoraciones
-• Recomendado: 10+ valoraciones variadas
-
-🔬 **EL ANÁLISIS INCLUIRÁ:**
-• **Distribución de macronutrientes** - Adherencia vs objetivo
-• **Estado de micronutrientes** - Deficiencias y fortalezas
-• **Patrones de adherencia** - Consistencia y factores
-• **Timing nutricional** - Optimización per objetivos
-• **Variedad alimentaria** - Diversidad y monotonía
-• **Correlaciones con progreso** - Qué funciona para ti
-• **Puntuación nutricional global** - Score 0-100
-• **Recomendaciones personalizadas** - IA adaptada
-
-🚀 **PASOS PARA ACTIVAR:**
-1. Usa `/progreso` para registrar primera métrica
-2. Usa `/valorar_receta` para entrenar IA
-3. Regresa en 3-7 días para análisis completo
-
-💡 **ANÁLISIS DISPONIBLES:**
-• `/analisis_nutricional semana` - Análisis semanal
-• `/analisis_nutricional mes` - Análisis mensual (recomendado)
-• `/analisis_nutricional trimestre` - Análisis de tendencias
-
-**¡El análisis más avanzado se desbloquea con más datos!**
-"""
-        
-        keyboard = types.InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            types.InlineKeyboardButton("📊 Registrar Métrica", callback_data="progress_record"),
-            types.InlineKeyboardButton("⭐ Valorar Recetas", callback_data="start_rating")
-        )
-        keyboard.add(
-            types.InlineKeyboardButton("❓ ¿Cómo Funciona?", callback_data="analytics_help")
-        )
+        intro_text = ANALISIS_INTRO_TEMPLATE.format_map({
+            "objetivo": user_profile['basic_data']['objetivo_descripcion']
+        })
         
         meal_bot.send_long_message(
             message.chat.id,
             intro_text,
             parse_mode='Markdown',
-            reply_markup=keyboard
+            reply_markup=ANALISIS_NO_DATA_KEYBOARD
         )
         return
     
     # Usuario con datos - generar análisis
-    period_names = {"week": "semanal", "month": "mensual", "quarter": "trimestral"}
-    period_display = period_names.get(period, "mensual")
+    period_display = ANALYSIS_PERIOD_NAMES.get(period, "mensual")
     
-    # Mostrar mensaje de procesamiento
-    processing_msg = bot.send_message(
-        message.chat.id,
-        f"🧬 **GENERANDO ANÁLISIS NUTRICIONAL {period_display.upper()}...**\n\n"
-        "🔬 Analizando distribución de macronutrientes\n"
-        "⚗️ Evaluando estado de micronutrientes\n"
-        "📊 Calculando adherencia al plan\n"
-        "⏰ Optimizando timing nutricional\n"
-        "🌈 Analizando variedad alimentaria\n"
-        "🔗 Detectando correlaciones con progreso\n"
-        "🎯 Generando puntuación global\n"
-        "💡 Creando recomendaciones con IA\n\n"
-        "*Análisis profundo en proceso...*",
-        parse_mode='Markdown'
-    )
+    # Reutilizar el análisis del período si el perfil no cambió
+    cache_version = meal_bot.get_cache_version(telegram_id)
+    result = meal_bot.get_cached_result(telegram_id, "nutrition_analysis", period, ANALYSIS_CACHE_TTL)
     
-    try:
-        # Generar análisis completo
-        result = meal_bot.nutrition_analytics.generate_comprehensive_analysis(
-            user_profile, period
+    # Mostrar mensaje de procesamiento solo si hay que calcular
+    processing_msg = None
+    if result is None:
+        processing_msg = enqueue_send(
+            message.chat.id,
+            f"🧬 **GENERANDO ANÁLISIS NUTRICIONAL {period_display.upper()}...**\n\n"
+            "🔬 Analizando distribución de macronutrientes\n"
+            "⚗️ Evaluando estado de micronutrientes\n"
+            "📊 Calculando adherencia al plan\n"
+            "⏰ Optimizando timing nutricional\n"
+            "🌈 Analizando variedad alimentaria\n"
+            "🔗 Detectando correlaciones con progreso\n"
+            "🎯 Generando puntuación global\n"
+            "💡 Creando recomendaciones con IA\n\n"
+            "*Análisis profundo en proceso...*",
+            parse_mode='Markdown',
+            dedupe=False
         )
-        
-        # Eliminar mensaje de procesamiento
-        bot.delete_message(message.chat.id, processing_msg.message_id)
+    
+    try:
+        if result is None:
+            # Generar análisis completo
+            result = meal_bot.nutrition_analytics.generate_comprehensive_analysis(
+                user_profile, period
+            )
+            meal_bot.store_cached_result(telegram_id, "nutrition_analysis", period, result, cache_version)
         
         if result["success"]:
             # Formatear y enviar análisis
@@ -2133,75 +3181,54 @@ def analisis_nutricional_command(message):
                 result, user_profile
             )
             
-            meal_bot.send_long_message(
-                message.chat.id,
-                formatted_analysis,
-                parse_mode='Markdown'
-            )
-            
-            # Botones de acciones basadas en análisis
-            keyboard = types.InlineKeyboardMarkup(row_width=2)
-            
-            # Acciones basadas en puntuación
+            # Botones de acciones basadas en la puntuación del análisis
             overall_score = result["nutrition_score"]["overall_score"]
+            keyboard = ANALISIS_MEJORA_KEYBOARD if overall_score < 70 else ANALISIS_AVANZADO_KEYBOARD
             
-            if overall_score < 70:
-                keyboard.add(
-                    types.InlineKeyboardButton("🎯 Plan de Mejora", callback_data="create_improvement_plan"),
-                    types.InlineKeyboardButton("📋 Lista Optimizada", callback_data="generate_shopping_list")
-                )
-            else:
-                keyboard.add(
-                    types.InlineKeyboardButton("🔬 Análisis Avanzado", callback_data="advanced_analytics"),
-                    types.InlineKeyboardButton("📊 Exportar Datos", callback_data="export_analytics")
-                )
-            
-            keyboard.add(
-                types.InlineKeyboardButton("🆕 Nuevo Análisis", callback_data="new_nutrition_analysis"),
-                types.InlineKeyboardButton("📈 Ver Progreso", callback_data="progress_report")
-            )
-            
-            bot.send_message(
+            # Análisis y botones de acciones en el mismo envío, sobre el mensaje de procesamiento
+            meal_bot.replace_processing_message(
                 message.chat.id,
+                processing_msg,
+                f"{formatted_analysis}\n\n"
                 f"🎯 **Análisis completado - Score: {overall_score:.1f}/100**\n\n"
                 "**¿Qué quieres hacer con estos insights?**",
                 parse_mode='Markdown',
-                reply_markup=keyboard
+                final_reply_markup=keyboard
             )
             
         else:
             error_msg = result.get("error", "Error desconocido")
             suggestions = result.get("suggestions", [])
             
-            error_text = f"❌ **Error en análisis nutricional:**\n{error_msg}\n\n"
+            parts = [f"❌ **Error en análisis nutricional:**\n{error_msg}\n\n"]
             
             if suggestions:
-                error_text += "💡 **Sugerencias:**\n"
-                for suggestion in suggestions:
-                    error_text += f"• {suggestion}\n"
-                error_text += "\n"
-            
-            error_text += "🔄 **Intenta:**\n"
-            error_text += "• Registrar más métricas con `/progreso`\n"
-            error_text += "• Valorar más recetas con `/valorar_receta`\n"
-            error_text += "• Usar período más corto: `/analisis_nutricional semana`\n"
-            error_text += "• Esperar unos días y repetir el análisis"
-            
-            bot.send_message(
+                parts.append("💡 **Sugerencias:**\n")
+                parts.extend(f"• {suggestion}\n" for suggestion in suggestions)
+                parts.append("\n")
+            
+            parts.append(
+                "🔄 **Intenta:**\n"
+                "• Registrar más métricas con `/progreso`\n"
+                "• Valorar más recetas con `/valorar_receta`\n"
+                "• Usar período más corto: `/analisis_nutricional semana`\n"
+                "• Esperar unos días y repetir el análisis"
+            )
+            
+            meal_bot.replace_processing_message(
                 message.chat.id,
-                error_text,
+                processing_msg,
+                "".join(parts),
                 parse_mode='Markdown'
             )
     
     except Exception as e:
         # Eliminar mensaje de procesamiento si existe
-        try:
-            bot.delete_message(message.chat.id, processing_msg.message_id)
-        except:
-            pass
+        if processing_msg is not None:
+            enqueue_delete(message.chat.id, processing_msg)
         
-        logger.error(f"Error in analisis_nutricional_command: {e}")
-        bot.send_message(
+        logger.error("Error in analisis_nutricional_command: %s", e)
+        enqueue_send(
             message.chat.id,
             f"❌ **Error procesando análisis nutricional:**\n{str(e)}\n\n"
             "💡 **Soluciones:**\n"
@@ -2212,201 +3239,162 @@ def analisis_nutricional_command(message):
             parse_mode='Markdown'
         )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('theme_'))
+@callback_route('theme_')
+@safe_callback("❌ Error procesando selección")
 def handle_theme_selection_callback(call):
     """Manejar callbacks de selección de tema semanal"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        # Extraer tema seleccionado
-        theme_key = call.data.replace('theme_', '')
-        
-        user_profile = meal_bot.get_user_profile(telegram_id)
-        if not user_profile:
-            bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
-            return
-        
-        # Confirmar selección
-        theme_names = {
-            "mediterranea": "🌊 Mediterránea",
-            "alta_proteina": "💪 Alta Proteína", 
-            "detox_natural": "🌿 Detox Natural",
-            "energia_sostenida": "⚡ Energía Sostenida",
-            "variedad_maxima": "🌈 Variedad Máxima",
-            "auto": "🎯 Auto-selección IA"
-        }
-        
-        selected_theme_name = theme_names.get(theme_key, "Tema desconocido")
-        
-        bot.answer_callback_query(
-            call.id, 
-            f"✅ Generando plan {selected_theme_name}..."
-        )
-        
-        # Crear mensaje simulado para la función helper
-        class MockMessage:
-            def __init__(self, chat_id):
-                self.chat = type('obj', (object,), {'id': chat_id})
-        
-        mock_message = MockMessage(call.message.chat.id)
-        
-        # Generar plan semanal inteligente
-        generate_intelligent_week(mock_message, user_profile, theme_key)
-        
-    except Exception as e:
-        logger.error(f"Error in theme selection callback: {e}")
-        bot.answer_callback_query(call.id, "❌ Error procesando selección")
+    # Extraer tema seleccionado
+    theme_key = call.data[len('theme_'):]
+    
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
+        return
+    
+    # Confirmar selección
+    selected_theme_name = WEEK_THEME_NAMES.get(theme_key, "Tema desconocido")
+    
+    bot.answer_callback_query(
+        call.id, 
+        f"✅ Generando plan {selected_theme_name}..."
+    )
+    
+    # Generar plan semanal inteligente
+    generate_intelligent_week(call.message.chat.id, telegram_id, user_profile, theme_key)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('week_'))
+@callback_route('week_')
+@safe_callback("❌ Error procesando acción")
 def handle_week_actions_callback(call):
     """Manejar callbacks de acciones del plan semanal"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        action = call.data.replace('week_', '')
-        user_profile = meal_bot.get_user_profile(telegram_id)
-        
-        if not user_profile:
-            bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
-            return
-        
-        current_plan = user_profile.get("current_week_plan")
-        if not current_plan:
-            bot.answer_callback_query(call.id, "❌ No hay plan activo")
-            return
+    action = call.data[len('week_'):]
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
+        return
+    
+    current_plan = user_profile.get("current_week_plan")
+    if not current_plan:
+        bot.answer_callback_query(call.id, "❌ No hay plan activo")
+        return
+    
+    if action == "shopping_list":
+        # Generar lista de compras para el plan actual
+        shopping_result = meal_bot.shopping_generator.generate_shopping_list(
+            user_profile, days=5
+        )
         
-        if action == "shopping_list":
-            # Generar lista de compras para el plan actual
-            shopping_result = meal_bot.shopping_generator.generate_shopping_list(
-                user_profile, days=5
+        if shopping_result["success"]:
+            formatted_list = meal_bot.shopping_generator.format_shopping_list_for_telegram(
+                shopping_result, user_profile
             )
-            
-            if shopping_result["success"]:
-                formatted_list = meal_bot.shopping_generator.format_shopping_list_for_telegram(
-                    shopping_result, user_profile
-                )
-                meal_bot.send_long_message(
-                    call.message.chat.id,
-                    formatted_list,
-                    parse_mode='Markdown'
-                )
-                bot.answer_callback_query(call.id, "✅ Lista generada")
-            else:
-                bot.answer_callback_query(call.id, "❌ Error generando lista")
-        
-        elif action == "regenerate":
-            # Regenerar plan con el mismo tema
-            theme_used = current_plan.get("theme_used", "auto")
-            
-            class MockMessage:
-                def __init__(self, chat_id):
-                    self.chat = type('obj', (object,), {'id': chat_id})
-            
-            mock_message = MockMessage(call.message.chat.id)
-            generate_intelligent_week(mock_message, user_profile, theme_used)
-            bot.answer_callback_query(call.id, "🔄 Regenerando plan...")
+            meal_bot.send_long_message(
+                call.message.chat.id,
+                formatted_list,
+                parse_mode='Markdown',
+                priority=PRIORITY_CALLBACK
+            )
+            bot.answer_callback_query(call.id, "✅ Lista generada")
+        else:
+            bot.answer_callback_query(call.id, "❌ Error generando lista")
+    
+    elif action == "regenerate":
+        # Regenerar plan con el mismo tema
+        theme_used = current_plan.get("theme_used", "auto")
         
-        elif action == "save":
+        generate_intelligent_week(call.message.chat.id, telegram_id, user_profile, theme_used)
+        bot.answer_callback_query(call.id, "🔄 Regenerando plan...")
+    
+    elif action == "save":
+        with meal_bot.data_lock:
             # Guardar plan en favoritos
             if "saved_weekly_plans" not in user_profile:
                 user_profile["saved_weekly_plans"] = []
             
             # Agregar timestamp al plan guardado
+            now = datetime.now()
             saved_plan = current_plan.copy()
-            saved_plan["saved_at"] = datetime.now().isoformat() 
-            saved_plan["plan_name"] = f"Plan {saved_plan['theme_used'].title()} - {datetime.now().strftime('%d/%m')}"
+            saved_plan["saved_at"] = now.isoformat()
+            saved_plan["plan_name"] = f"Plan {saved_plan['theme_used'].title()} - {now.strftime('%d/%m')}"
             
-            user_profile["saved_weekly_plans"].append(saved_plan)
+            saved_plans = user_profile["saved_weekly_plans"]
+            saved_plans.append(saved_plan)
             
-            # Mantener solo los últimos 10 planes guardados
-            if len(user_profile["saved_weekly_plans"]) > 10:
-                user_profile["saved_weekly_plans"] = user_profile["saved_weekly_plans"][-10:]
+            # Mantener solo los últimos 10 planes guardados (recorte in situ, sin copiar la lista)
+            del saved_plans[:-10]
             
-            meal_bot.database.save_user_profile(telegram_id, user_profile)
-            bot.answer_callback_query(call.id, "⭐ Plan guardado en favoritos")
+            meal_bot.save_user_profile(telegram_id, user_profile)
+        bot.answer_callback_query(call.id, "⭐ Plan guardado en favoritos")
+    
+    elif action == "metrics":
+        # Mostrar métricas detalladas del plan
+        plan_data = current_plan["plan_data"]
+        quality_metrics = plan_data["quality_metrics"]
         
-        elif action == "metrics":
-            # Mostrar métricas detalladas del plan
-            plan_data = current_plan["plan_data"]
-            quality_metrics = plan_data["quality_metrics"]
-            
-            metrics_text = f"""
-📊 **MÉTRICAS DETALLADAS DEL PLAN**
-
-🎯 **Puntuación General:** {quality_metrics['overall_score']}/100
-
-📈 **Análisis de Variedad:**
-• Puntuación variedad: {quality_metrics['variety_score']}/5.0
-• Diversidad ingredientes: {quality_metrics['ingredient_diversity']} tipos únicos
-• Métodos de cocción: {quality_metrics['method_diversity']} diferentes
-
-🌊 **Integración Temática:**
-• Tema aplicado: {quality_metrics['theme_consistency']}
-• Comidas estacionales: {quality_metrics['seasonal_integration']}
-
-⭐ **Evaluación:**
-"""
-            
-            # Añadir evaluación cualitativa
-            if quality_metrics['overall_score'] >= 80:
-                metrics_text += "✅ **Excelente** - Plan óptimo con alta variedad\n"
-            elif quality_metrics['overall_score'] >= 60:
-                metrics_text += "🟡 **Bueno** - Plan sólido con variedad aceptable\n"  
-            else:
-                metrics_text += "🔄 **Mejorable** - Considera regenerar el plan\n"
-            
-            metrics_text += f"\n💡 **Generado:** {datetime.fromisoformat(current_plan['generated_at']).strftime('%d/%m/%Y %H:%M')}"
-            
-            bot.send_message(
-                call.message.chat.id,
-                metrics_text,
-                parse_mode='Markdown'
-            )
-            bot.answer_callback_query(call.id, "📊 Métricas mostradas")
+        # Evaluación cualitativa
+        if quality_metrics['overall_score'] >= 80:
+            evaluation = "✅ **Excelente** - Plan óptimo con alta variedad"
+        elif quality_metrics['overall_score'] >= 60:
+            evaluation = "🟡 **Bueno** - Plan sólido con variedad aceptable"
+        else:
+            evaluation = "🔄 **Mejorable** - Considera regenerar el plan"
         
-    except Exception as e:
-        logger.error(f"Error in week actions callback: {e}")
-        bot.answer_callback_query(call.id, "❌ Error procesando acción")
+        metrics_text = PLAN_METRICS_TEMPLATE.format_map({
+            "quality_metrics": quality_metrics,
+            "evaluation": evaluation,
+            "generated_at": datetime.fromisoformat(current_plan['generated_at']).strftime('%d/%m/%Y %H:%M')
+        })
+        
+        enqueue_send(
+            call.message.chat.id,
+            metrics_text,
+            parse_mode='Markdown'
+        )
+        bot.answer_callback_query(call.id, "📊 Métricas mostradas")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('rate_recipe_'))
+@callback_route('rate_recipe_')
+@safe_callback("❌ Error procesando selección")
 def handle_rate_recipe_callback(call):
     """Manejar callbacks de selección de receta para valorar"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        # Extraer índice de receta
-        recipe_index = int(call.data.replace('rate_recipe_', ''))
-        
-        user_profile = meal_bot.get_user_profile(telegram_id)
-        if not user_profile:
-            bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
-            return
-        
-        recent_recipes = user_profile.get("recent_generated_recipes", [])
-        if recipe_index >= len(recent_recipes):
-            bot.answer_callback_query(call.id, "❌ Receta no encontrada")
-            return
-        
-        selected_recipe = recent_recipes[-(recipe_index + 1)]  # Orden inverso
-        
-        # Crear teclado de valoración
-        keyboard = types.InlineKeyboardMarkup(row_width=5)
-        
-        # Botones de estrellas
-        star_buttons = []
-        for rating in range(1, 6):
-            stars = "⭐" * rating
-            star_buttons.append(
-                types.InlineKeyboardButton(stars, callback_data=f"rating_{recipe_index}_{rating}")
-            )
-        keyboard.add(*star_buttons)
-        
-        # Mostrar receta para valorar
-        recipe_name = selected_recipe.get("nombre", "Receta sin nombre")
-        macros = selected_recipe.get("macros_por_porcion", {})
-        ingredients = selected_recipe.get("ingredientes", [])
-        
-        rating_text = f"""
+    # Extraer ID de receta
+    recipe_id = call.data[len('rate_recipe_'):]
+    
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
+        return
+    
+    recent_item = find_recent_generated_recipe(user_profile, recipe_id)
+    if recent_item is None:
+        bot.answer_callback_query(call.id, "❌ Receta no encontrada")
+        return
+    
+    selected_recipe = recent_item["recipe"]
+    
+    # Crear teclado de valoración
+    keyboard = types.InlineKeyboardMarkup(row_width=5)
+    
+    # Botones de estrellas
+    star_buttons = []
+    for rating in range(1, 6):
+        stars = "⭐" * rating
+        star_buttons.append(
+            types.InlineKeyboardButton(stars, callback_data=f"rating_{recipe_id}_{rating}")
+        )
+    keyboard.add(*star_buttons)
+    
+    # Mostrar receta para valorar
+    recipe_name = selected_recipe.get("nombre", "Receta sin nombre")
+    macros = selected_recipe.get("macros_por_porcion", {})
+    ingredients = selected_recipe.get("ingredientes", [])
+    
+    parts = [f"""
 ⭐ **VALORAR RECETA ESPECÍFICA**
 
 📋 **Receta:** {recipe_name}
@@ -2415,78 +3403,76 @@ def handle_rate_recipe_callback(call):
 🥩 **Macros:** {macros.get("proteinas", 0)}P • {macros.get("carbohidratos", 0)}C • {macros.get("grasas", 0)}F
 
 🛒 **Ingredientes principales:**
-"""
-        
-        # Mostrar hasta 5 ingredientes principales
-        for ingredient in ingredients[:5]:
-            name = ingredient.get("nombre", "")
-            quantity = ingredient.get("cantidad", 0)
-            unit = ingredient.get("unidad", "")
-            rating_text += f"• {name} ({quantity}{unit})\n"
-        
-        if len(ingredients) > 5:
-            rating_text += f"• ... y {len(ingredients) - 5} ingredientes más\n"
-        
-        rating_text += f"""
+"""]
+    
+    # Mostrar hasta 5 ingredientes principales
+    for ingredient in ingredients[:5]:
+        name = ingredient.get("nombre", "")
+        quantity = ingredient.get("cantidad", 0)
+        unit = ingredient.get("unidad", "")
+        parts.append(f"• {name} ({quantity}{unit})\n")
+    
+    if len(ingredients) > 5:
+        parts.append(f"• ... y {len(ingredients) - 5} ingredientes más\n")
+    
+    parts.append("""
 
 💭 **¿Cómo valorarías esta receta?**
 
 ⭐ = Muy mala • ⭐⭐ = Mala • ⭐⭐⭐ = Regular • ⭐⭐⭐⭐ = Buena • ⭐⭐⭐⭐⭐ = Excelente
 
 **Tu valoración ayuda a la IA a aprender tus preferencias automáticamente.**
-"""
-        
-        bot.send_message(
-            call.message.chat.id,
-            rating_text,
-            parse_mode='Markdown',
-            reply_markup=keyboard
-        )
-        
-        bot.answer_callback_query(call.id, f"✅ Seleccionada: {recipe_name[:20]}...")
-        
-    except Exception as e:
-        logger.error(f"Error in rate recipe callback: {e}")
-        bot.answer_callback_query(call.id, "❌ Error procesando selección")
+""")
+    
+    enqueue_send(
+        call.message.chat.id,
+        "".join(parts),
+        parse_mode='Markdown',
+        reply_markup=keyboard
+    )
+    
+    bot.answer_callback_query(call.id, f"✅ Seleccionada: {recipe_name[:20]}...")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('rating_'))
+@callback_route('rating_')
+@safe_callback("❌ Error procesando valoración")
 def handle_rating_callback(call):
     """Manejar callbacks de valoración específica"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        # Extraer datos: rating_recipeIndex_rating
-        parts = call.data.replace('rating_', '').split('_')
-        recipe_index = int(parts[0])
-        rating = int(parts[1])
-        
-        user_profile = meal_bot.get_user_profile(telegram_id)
-        if not user_profile:
-            bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
-            return
-        
-        recent_recipes = user_profile.get("recent_generated_recipes", [])
-        if recipe_index >= len(recent_recipes):
-            bot.answer_callback_query(call.id, "❌ Receta no encontrada")
-            return
-        
-        selected_recipe = recent_recipes[-(recipe_index + 1)]
-        
-        # Aplicar aprendizaje con la inteligencia de recetas
+    # Extraer datos: rating_recipeId_rating (el ID contiene '_')
+    recipe_id, rating = call.data[len('rating_'):].rsplit('_', 1)
+    rating = int(rating)
+    
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
+        return
+    
+    recent_item = find_recent_generated_recipe(user_profile, recipe_id)
+    if recent_item is None:
+        bot.answer_callback_query(call.id, "❌ Receta no encontrada")
+        return
+    
+    selected_recipe = recent_item["recipe"]
+    
+    # Aplicar aprendizaje con la inteligencia de recetas
+    with meal_bot.data_lock:
         learning_result = meal_bot.recipe_intelligence.learn_from_rating(
             user_profile, selected_recipe, rating, ""
         )
         
         if learning_result["success"]:
             # Guardar perfil actualizado
-            meal_bot.database.save_user_profile(telegram_id, user_profile)
-            
-            # Crear respuesta de confirmación
-            stars = "⭐" * rating
-            recipe_name = selected_recipe.get("nombre", "Receta")
-            intelligence_score = learning_result["intelligence_score"]
-            
-            confirmation_text = f"""
+            meal_bot.save_user_profile(telegram_id, user_profile)
+    
+    if learning_result["success"]:
+        
+        # Crear respuesta de confirmación
+        stars = "⭐" * rating
+        recipe_name = selected_recipe.get("nombre", "Receta")
+        intelligence_score = learning_result["intelligence_score"]
+        
+        confirmation_text = f"""
 ✅ **VALORACIÓN REGISTRADA**
 
 📋 **Receta:** {recipe_name}
@@ -2495,28 +3481,28 @@ def handle_rating_callback(call):
 
 🎯 **APRENDIZAJES DE ESTA VALORACIÓN:**
 """
-            
-            # Mostrar insights del aprendizaje
-            learning_results = learning_result["learning_results"]
-            
-            if "ingredient_insights" in learning_results:
-                insights = learning_results["ingredient_insights"]
-                if insights.get("ingredients_affected", 0) > 0:
-                    confirmation_text += f"• Ingredientes analizados: {insights['ingredients_affected']}\n"
-            
-            if "method_insights" in learning_results:
-                insights = learning_results["method_insights"]
-                if insights.get("methods_detected"):
-                    methods = ", ".join(insights["methods_detected"])
-                    confirmation_text += f"• Métodos detectados: {methods}\n"
-            
-            # Recomendaciones actualizadas
-            recommendations = learning_result["updated_recommendations"]
-            if recommendations.get("recommended_ingredients"):
-                top_ingredients = recommendations["recommended_ingredients"][:3]
-                confirmation_text += f"• Ingredientes ahora favoritos: {', '.join(top_ingredients)}\n"
-            
-            confirmation_text += f"""
+        
+        # Mostrar insights del aprendizaje
+        learning_results = learning_result["learning_results"]
+        
+        if "ingredient_insights" in learning_results:
+            insights = learning_results["ingredient_insights"]
+            if insights.get("ingredients_affected", 0) > 0:
+                confirmation_text += f"• Ingredientes analizados: {insights['ingredients_affected']}\n"
+        
+        if "method_insights" in learning_results:
+            insights = learning_results["method_insights"]
+            if insights.get("methods_detected"):
+                methods = ", ".join(insights["methods_detected"])
+                confirmation_text += f"• Métodos detectados: {methods}\n"
+        
+        # Recomendaciones actualizadas
+        recommendations = learning_result["updated_recommendations"]
+        if recommendations.get("recommended_ingredients"):
+            top_ingredients = recommendations["recommended_ingredients"][:3]
+            confirmation_text += f"• Ingredientes ahora favoritos: {', '.join(top_ingredients)}\n"
+        
+        confirmation_text += f"""
 
 💡 **IMPACTO EN FUTURAS RECOMENDACIONES:**
 • Las recetas similares serán {'priorizadas' if rating >= 4 else 'penalizadas' if rating <= 2 else 'neutras'}
@@ -2528,322 +3514,243 @@ def handle_rating_callback(call):
 • Crea plan semanal con `/nueva_semana` más personalizado
 • Ve tu reporte completo con el botón de abajo
 """
-            
-            # Crear botón para ver reporte completo
-            keyboard = types.InlineKeyboardMarkup(row_width=1)
-            keyboard.add(
-                types.InlineKeyboardButton("🧠 Ver Reporte Completo IA", callback_data="show_intelligence_report"),
-                types.InlineKeyboardButton("⭐ Valorar Otra Receta", callback_data="back_to_rating")
-            )
-            
-            bot.send_message(
-                call.message.chat.id,
-                confirmation_text,
-                parse_mode='Markdown',
-                reply_markup=keyboard
-            )
-            
-            bot.answer_callback_query(call.id, f"✅ {stars} registrado - IA actualizada!")
-            
-        else:
-            bot.answer_callback_query(call.id, "❌ Error registrando valoración")
-            
-    except Exception as e:
-        logger.error(f"Error in rating callback: {e}")
-        bot.answer_callback_query(call.id, "❌ Error procesando valoración")
-
-@bot.callback_query_handler(func=lambda call: call.data == 'show_intelligence_report')
-def handle_intelligence_report_callback(call):
-    """Mostrar reporte completo de inteligencia"""
-    telegram_id = str(call.from_user.id)
-    
-    try:
-        user_profile = meal_bot.get_user_profile(telegram_id)
-        if not user_profile:
-            bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
-            return
-        
-        intelligence_profile = user_profile.get("recipe_intelligence", {})
-        
-        # Generar reporte completo
-        report = meal_bot.recipe_intelligence.format_intelligence_report_for_telegram(
-            intelligence_profile, user_profile
-        )
         
-        meal_bot.send_long_message(
+        enqueue_send(
             call.message.chat.id,
-            report,
-            parse_mode='Markdown'
+            confirmation_text,
+            parse_mode='Markdown',
+            reply_markup=RATING_DONE_KEYBOARD
         )
         
-        bot.answer_callback_query(call.id, "📊 Reporte de IA generado")
+        bot.answer_callback_query(call.id, f"✅ {stars} registrado - IA actualizada!")
         
-    except Exception as e:
-        logger.error(f"Error showing intelligence report: {e}")
-        bot.answer_callback_query(call.id, "❌ Error generando reporte")
-
-@bot.callback_query_handler(func=lambda call: call.data == 'back_to_rating')
-def handle_back_to_rating_callback(call):
-    """Volver a la pantalla de valoración"""
-    telegram_id = str(call.from_user.id)
-    
-    # Simular comando valorar_receta
-    class MockMessage:
-        def __init__(self, chat_id, from_user_id):
-            self.chat = type('obj', (object,), {'id': chat_id})
-            self.from_user = type('obj', (object,), {'id': from_user_id})
-            self.text = "/valorar_receta"
-    
-    mock_message = MockMessage(call.message.chat.id, call.from_user.id)
-    valorar_receta_command(mock_message)
-    
-    bot.answer_callback_query(call.id, "🔄 Volviendo a valoraciones...")
+    else:
+        bot.answer_callback_query(call.id, "❌ Error registrando valoración")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('progress_'))
-def handle_progress_callback(call):
-    """Manejar callbacks del sistema de progreso"""
+@callback_route('show_intelligence_report', exact=True)
+@safe_callback("❌ Error generando reporte")
+def handle_intelligence_report_callback(call):
+    """Mostrar reporte completo de inteligencia"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        action = call.data.replace('progress_', '')
-        user_profile = meal_bot.get_user_profile(telegram_id)
-        
-        if not user_profile:
-            bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
-            return
-        
-        if action in ["report", "week", "month"]:
-            # Generar reporte de progreso
-            period_map = {"report": "month", "week": "week", "month": "month"}
-            period = period_map[action]
-            
-            # Mostrar mensaje de generación
-            processing_msg = bot.send_message(
-                call.message.chat.id,
-                "📊 **Generando reporte de progreso...**\n\n"
-                "📈 Analizando tus métricas\n"
-                "🎯 Calculando tendencias\n"
-                "💡 Generando insights personalizados\n\n"
-                "*Esto puede tomar unos segundos...*",
-                parse_mode='Markdown'
-            )
-            
-            report = meal_bot.progress_tracker.generate_progress_report(user_profile, period)
-            
-            # Eliminar mensaje de procesamiento
-            bot.delete_message(call.message.chat.id, processing_msg.message_id)
-            
-            if report["success"]:
-                formatted_report = meal_bot.progress_tracker.format_progress_report_for_telegram(
-                    report, user_profile
-                )
-                
-                meal_bot.send_long_message(
-                    call.message.chat.id,
-                    formatted_report,
-                    parse_mode='Markdown'
-                )
-                
-                bot.answer_callback_query(call.id, f"📊 Reporte {period} generado")
-            else:
-                bot.send_message(
-                    call.message.chat.id,
-                    f"❌ **Error generando reporte:** {report.get('error', 'Error desconocido')}",
-                    parse_mode='Markdown'
-                )
-                bot.answer_callback_query(call.id, "❌ Error generando reporte")
-        
-        elif action == "record":
-            # Mostrar opciones de métricas para registrar
-            keyboard = types.InlineKeyboardMarkup(row_width=2)
-            
-            # Métricas principales
-            keyboard.add(
-                types.InlineKeyboardButton("⚖️ Peso", callback_data="metric_weight"),
-                types.InlineKeyboardButton("📊 % Grasa", callback_data="metric_body_fat")
-            )
-            keyboard.add(
-                types.InlineKeyboardButton("💪 Masa Muscular", callback_data="metric_muscle_mass"),
-                types.InlineKeyboardButton("📏 Cintura", callback_data="metric_waist_circumference")
-            )
-            keyboard.add(
-                types.InlineKeyboardButton("⚡ Energía", callback_data="metric_energy_level"),
-                types.InlineKeyboardButton("💤 Sueño", callback_data="metric_sleep_quality")
-            )
-            keyboard.add(
-                types.InlineKeyboardButton("🔄 Recuperación", callback_data="metric_recovery_rate"),
-                types.InlineKeyboardButton("🍽️ Apetito", callback_data="metric_appetite")
-            )
-            
-            bot.send_message(
-                call.message.chat.id,
-                "📈 **REGISTRAR MÉTRICA**\n\n"
-                "**Selecciona la métrica que quieres registrar:**\n\n"
-                "⚖️ **Peso** - Peso corporal en kg\n"
-                "📊 **% Grasa** - Porcentaje de grasa corporal\n"
-                "💪 **Masa Muscular** - Masa muscular en kg\n"
-                "📏 **Cintura** - Circunferencia de cintura en cm\n"
-                "⚡ **Energía** - Nivel de energía (1-10)\n"
-                "💤 **Sueño** - Calidad de sueño (1-10)\n"
-                "🔄 **Recuperación** - Recuperación post-entreno (1-10)\n"
-                "🍽️ **Apetito** - Control del apetito (1-10)",
-                parse_mode='Markdown',
-                reply_markup=keyboard
-            )
-            
-            bot.answer_callback_query(call.id, "📈 Selecciona métrica a registrar")
-        
-        elif action == "goals":
-            # Configurar objetivos (funcionalidad futura)
-            bot.send_message(
-                call.message.chat.id,
-                "🎯 **CONFIGURACIÓN DE OBJETIVOS**\n\n"
-                "🚧 Esta funcionalidad estará disponible próximamente.\n\n"
-                "**Por ahora puedes:**\n"
-                "• Registrar métricas regularmente\n"
-                "• Ver reportes de progreso\n"
-                "• Seguir las recomendaciones automáticas\n\n"
-                "El sistema aprende automáticamente de tus datos y ajusta las recomendaciones.",
-                parse_mode='Markdown'
-            )
-            
-            bot.answer_callback_query(call.id, "🚧 Próximamente disponible")
-        
-        elif action == "help":
-            # Ayuda del sistema de progreso
-            help_text = """
-📊 **CÓMO FUNCIONA EL SISTEMA DE PROGRESO**
-
-🎯 **OBJETIVO:**
-Trackear automáticamente tu progreso hacia tus objetivos nutricionales y de fitness.
-
-📈 **PROCESO:**
-1️⃣ **Registras métricas** (peso, energía, etc.)
-2️⃣ **El sistema analiza** tendencias automáticamente
-3️⃣ **Recibes insights** personalizados con IA
-4️⃣ **Se ajusta tu plan** según el progreso
-
-💡 **BENEFICIOS:**
-• **Análisis automático** de tendencias
-• **Detección de patrones** en tu progreso
-• **Recomendaciones adaptativas** según datos
-• **Ajustes automáticos** del Available Energy
-• **Insights personalizados** con IA
-
-📊 **MÉTRICAS DISPONIBLES:**
-⚖️ **Físicas:** Peso, grasa, masa muscular, cintura
-⚡ **Bienestar:** Energía, sueño, recuperación, apetito
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
+        return
+    
+    intelligence_profile = user_profile.get("recipe_intelligence", {})
+    
+    # Generar reporte completo
+    report = meal_bot.recipe_intelligence.format_intelligence_report_for_telegram(
+        intelligence_profile, user_profile
+    )
+    
+    meal_bot.send_long_message(
+        call.message.chat.id,
+        report,
+        parse_mode='Markdown',
+        priority=PRIORITY_CALLBACK
+    )
+    
+    bot.answer_callback_query(call.id, "📊 Reporte de IA generado")
 
-🔬 **ANÁLISIS INCLUIDO:**
-• Tendencias semanales/mensuales
-• Comparaciones con objetivos
-• Detección de correlaciones
-• Predicciones de progreso
+@callback_route('back_to_rating', exact=True)
+def handle_back_to_rating_callback(call):
+    """Volver a la pantalla de valoración"""
+    telegram_id = str(call.from_user.id)
+    
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
+        return
+    
+    send_rating_menu(call.message.chat.id, user_profile, priority=PRIORITY_CALLBACK)
+    
+    bot.answer_callback_query(call.id, "🔄 Volviendo a valoraciones...")
 
-🚀 **PRÓXIMOS PASOS:**
-• Registra tu primera métrica
-• Usa `/progreso` regularmente
-• Sigue las recomendaciones automáticas
-"""
+def send_progress_report(chat_id: int, user_profile: Dict, period: str, processing_msg: Future):
+    """
+    Generar y enviar el reporte de progreso (se ejecuta en segundo plano).
+    El callback ya se respondió en el handler; aquí solo se envían mensajes.
+    """
+    try:
+        # Se recorren las métricas del perfil: leerlas bajo data_lock para que un
+        # registro simultáneo no cambie los diccionarios durante la iteración
+        with meal_bot.data_lock:
+            report = meal_bot.progress_tracker.generate_progress_report(user_profile, period)
+        
+        # Eliminar mensaje de procesamiento
+        enqueue_delete(chat_id, processing_msg, priority=PRIORITY_CALLBACK)
+        
+        if report["success"]:
+            formatted_report = meal_bot.progress_tracker.format_progress_report_for_telegram(
+                report, user_profile
+            )
             
             meal_bot.send_long_message(
-                call.message.chat.id,
-                help_text,
-                parse_mode='Markdown'
+                chat_id,
+                formatted_report,
+                parse_mode='Markdown',
+                priority=PRIORITY_CALLBACK
             )
-            
-            bot.answer_callback_query(call.id, "ℹ️ Información mostrada")
-        
+        else:
+            enqueue_send(
+                chat_id,
+                f"❌ **Error generando reporte:** {report.get('error', 'Error desconocido')}",
+                parse_mode='Markdown',
+                priority=PRIORITY_CALLBACK
+            )
+    
     except Exception as e:
-        logger.error(f"Error in progress callback: {e}")
-        bot.answer_callback_query(call.id, "❌ Error procesando acción")
+        logger.error("Error generating progress report: %s", e)
+        enqueue_delete(chat_id, processing_msg, priority=PRIORITY_CALLBACK)
+        enqueue_send(
+            chat_id,
+            "❌ **Error técnico** generando el reporte.\n"
+            "Inténtalo de nuevo en unos momentos.",
+            parse_mode='Markdown',
+            priority=PRIORITY_CALLBACK
+        )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('metric_'))
-def handle_metric_callback(call):
-    """Manejar callbacks de selección de métrica específica"""
+@callback_route('progress_')
+@safe_callback("❌ Error procesando acción")
+def handle_progress_callback(call):
+    """Manejar callbacks del sistema de progreso"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        metric_name = call.data.replace('metric_', '')
-        user_profile = meal_bot.get_user_profile(telegram_id)
-        
-        if not user_profile:
-            bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
-            return
-        
-        # Generar ayuda para entrada de métrica
-        help_text = meal_bot.progress_tracker.get_metric_entry_keyboard(metric_name)
+    action = call.data[len('progress_'):]
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
+        return
+    
+    if action in ["report", "week", "month"]:
+        # Generar reporte de progreso
+        period_map = {"report": "month", "week": "week", "month": "month"}
+        period = period_map[action]
         
-        # Configurar estado para entrada de métrica
-        meal_bot.user_states[telegram_id] = {
-            "state": "metric_entry",
-            "metric_name": metric_name,
-            "step": "value"
-        }
+        # Mostrar mensaje de generación
+        processing_msg = enqueue_send(
+            call.message.chat.id,
+            "📊 **Generando reporte de progreso...**\n\n"
+            "📈 Analizando tus métricas\n"
+            "🎯 Calculando tendencias\n"
+            "💡 Generando insights personalizados\n\n"
+            "*Esto puede tomar unos segundos...*",
+            parse_mode='Markdown',
+            priority=PRIORITY_CALLBACK,
+            dedupe=False
+        )
         
-        bot.send_message(
+        # Responder ya al callback: Telegram deja de mostrar el reloj en el botón
+        # y la respuesta no depende de cuánto tarde el reporte
+        bot.answer_callback_query(call.id, f"📊 Generando reporte {period}...")
+        run_in_background(send_progress_report, call.message.chat.id, user_profile, period, processing_msg)
+    
+    elif action == "record":
+        # Mostrar opciones de métricas para registrar
+        enqueue_send(
             call.message.chat.id,
-            help_text,
-            parse_mode='Markdown'
+            METRIC_SELECTION_TEXT,
+            parse_mode='Markdown',
+            reply_markup=METRIC_SELECTION_KEYBOARD,
+            priority=PRIORITY_CALLBACK
         )
         
-        metric_config = meal_bot.progress_tracker.trackable_metrics.get(metric_name, {})
-        metric_display_name = metric_config.get("name", "Métrica")
+        bot.answer_callback_query(call.id, "📈 Selecciona métrica a registrar")
+    
+    elif action == "goals":
+        # Configurar objetivos (funcionalidad futura)
+        enqueue_send(
+            call.message.chat.id,
+            "🎯 **CONFIGURACIÓN DE OBJETIVOS**\n\n"
+            "🚧 Esta funcionalidad estará disponible próximamente.\n\n"
+            "**Por ahora puedes:**\n"
+            "• Registrar métricas regularmente\n"
+            "• Ver reportes de progreso\n"
+            "• Seguir las recomendaciones automáticas\n\n"
+            "El sistema aprende automáticamente de tus datos y ajusta las recomendaciones.",
+            parse_mode='Markdown',
+            priority=PRIORITY_CALLBACK
+        )
         
-        bot.answer_callback_query(call.id, f"📝 Registrando {metric_display_name}")
+        bot.answer_callback_query(call.id, "🚧 Próximamente disponible")
+    
+    elif action == "help":
+        # Ayuda del sistema de progreso (cabe en un único mensaje)
+        enqueue_send(
+            call.message.chat.id,
+            PROGRESO_HELP_TEXT,
+            parse_mode='Markdown',
+            priority=PRIORITY_CALLBACK
+        )
         
-    except Exception as e:
-        logger.error(f"Error in metric callback: {e}")
-        bot.answer_callback_query(call.id, "❌ Error procesando métrica")
+        bot.answer_callback_query(call.id, "ℹ️ Información mostrada")
+
+@callback_route('metric_')
+@safe_callback("❌ Error procesando métrica")
+def handle_metric_callback(call):
+    """Manejar callbacks de selección de métrica específica"""
+    telegram_id = str(call.from_user.id)
+    
+    metric_name = call.data[len('metric_'):]
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Error: Perfil no encontrado")
+        return
+    
+    # Generar ayuda para entrada de métrica
+    help_text = meal_bot.progress_tracker.get_metric_entry_keyboard(metric_name)
+    
+    # Configurar estado para entrada de métrica
+    meal_bot.user_states[telegram_id] = {
+        "state": "metric_entry",
+        "metric_name": metric_name,
+        "step": "value"
+    }
+    
+    enqueue_send(
+        call.message.chat.id,
+        help_text,
+        parse_mode='Markdown',
+        priority=PRIORITY_CALLBACK
+    )
+    
+    metric_config = meal_bot.progress_tracker.trackable_metrics.get(metric_name, {})
+    metric_display_name = metric_config.get("name", "Métrica")
+    
+    bot.answer_callback_query(call.id, f"📝 Registrando {metric_display_name}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('edit_'))
+@callback_route('edit_')
+@callback_route('cancel_edit', exact=True)
 def handle_edit_profile_callback(call):
     """Manejar callbacks de edición de perfil"""
     telegram_id = str(call.from_user.id)
     
     if call.data == "cancel_edit":
-        bot.edit_message_text(
-            "❌ **Edición cancelada**\n\nTus preferencias no han sido modificadas.",
+        enqueue_edit(
             call.message.chat.id,
             call.message.message_id,
+            "❌ **Edición cancelada**\n\nTus preferencias no han sido modificadas.",
+            priority=PRIORITY_CALLBACK,
             parse_mode='Markdown'
         )
         bot.answer_callback_query(call.id, "Edición cancelada")
         return
     
     # Mapear callback a sección de preferencias
-    edit_sections = {
-        "edit_liked_foods": {
-            "section": "liked_foods",
-            "title": "🍽️ ALIMENTOS PREFERIDOS",
-            "step": "9C",
-            "description": "Selecciona los alimentos que más te gustan. Puedes elegir múltiples opciones:"
-        },
-        "edit_disliked_foods": {
-            "section": "disliked_foods", 
-            "title": "🚫 ALIMENTOS A EVITAR",
-            "step": "9D",
-            "description": "Selecciona alimentos que prefieres evitar. Puedes elegir múltiples opciones:"
-        },
-        "edit_cooking_methods": {
-            "section": "cooking_methods",
-            "title": "👨‍🍳 MÉTODOS DE COCCIÓN",
-            "step": "9F", 
-            "description": "Selecciona tus métodos de cocción preferidos. Puedes elegir múltiples opciones:"
-        },
-        "edit_training_schedule": {
-            "section": "training_schedule",
-            "title": "⏰ HORARIO DE ENTRENAMIENTO",
-            "step": "7",
-            "description": "Selecciona tu horario habitual de entrenamiento:"
-        }
-    }
-    
-    section_data = edit_sections.get(call.data)
+    section_data = PROFILE_EDIT_SECTIONS.get(call.data)
     if not section_data:
         bot.answer_callback_query(call.id, "❌ Opción no válida", show_alert=True)
         return
     
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Configura tu perfil primero", show_alert=True)
+        return
+    
     # Configurar estado de edición
     meal_bot.user_states[telegram_id] = {
         "state": "profile_edit",
@@ -2855,140 +3762,54 @@ def handle_edit_profile_callback(call):
     bot.answer_callback_query(call.id, f"Editando {section_data['title']}")
     
     # Redirigir al paso específico de configuración
-    if section_data["step"] == "9C":
-        handle_edit_liked_foods(call.message, telegram_id)
-    elif section_data["step"] == "9D":
-        handle_edit_disliked_foods(call.message, telegram_id)
-    elif section_data["step"] == "9F":
-        handle_edit_cooking_methods(call.message, telegram_id)
-    elif section_data["step"] == "7":
-        handle_edit_training_schedule(call.message, telegram_id)
-
-def handle_edit_liked_foods(message, telegram_id):
-    """Manejar edición de alimentos preferidos"""
-    # Obtener preferencias actuales
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    current_liked = user_profile.get("preferences", {}).get("liked_foods", [])
-    
-    # Reutilizar lógica del paso 9C del setup inicial
-    markup = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
-    
-    food_options = [
-        "🥩 Carnes rojas", "🐔 Aves", "🐟 Pescados", "🥚 Huevos",
-        "🥛 Lácteos", "🥜 Frutos secos", "🫘 Legumbres", "🥬 Hojas verdes",
-        "🥦 Crucíferas", "🍅 Solanáceas", "🌿 Aromáticas", "🥕 Raíces",
-        "🌶️ Pimientos", "🥒 Pepináceas", "🫒 Aceitunas", "🥑 Aguacate",
-        "➡️ Continuar"
-    ]
-    
-    buttons = [types.KeyboardButton(option) for option in food_options]
-    markup.add(*buttons)
-    
-    selected_text = f"**Actualmente seleccionados:** {', '.join(current_liked) if current_liked else 'Ninguno'}"
-    
-    bot.edit_message_text(
-        f"🍽️ **EDITANDO ALIMENTOS PREFERIDOS**\n\n"
-        f"Selecciona los alimentos que más te gustan. Puedes elegir múltiples opciones.\n\n"
-        f"{selected_text}\n\n"
-        f"💡 Selecciona una opción o usa **➡️ Continuar** para finalizar.",
-        message.chat.id,
-        message.message_id,
-        parse_mode='Markdown',
-        reply_markup=markup
-    )
+    section = section_data["section"]
+    EDIT_SECTION_HANDLERS[section](call.message, user_profile, section)
 
-def handle_edit_disliked_foods(message, telegram_id):
-    """Manejar edición de alimentos a evitar"""
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    current_disliked = user_profile.get("preferences", {}).get("disliked_foods", [])
-    
-    markup = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
-    
-    food_options = [
-        "🥩 Carnes rojas", "🐔 Aves", "🐟 Pescados", "🥚 Huevos",
-        "🥛 Lácteos", "🥜 Frutos secos", "🫘 Legumbres", "🥬 Hojas verdes",
-        "🥦 Crucíferas", "🍅 Solanáceas", "🌿 Aromáticas", "🥕 Raíces",
-        "🌶️ Pimientos", "🥒 Pepináceas", "🫒 Aceitunas", "🥑 Aguacate",
-        "➡️ Continuar"
-    ]
+def handle_edit_multiselect(message, user_profile: Dict, section: str):
+    """Manejar edición de una preferencia de selección múltiple (alimentos, métodos)"""
+    title, description, label, keyboard = EDIT_MULTISELECT_SECTIONS[section]
     
-    buttons = [types.KeyboardButton(option) for option in food_options]
-    markup.add(*buttons)
+    # Obtener preferencias actuales
+    current = user_profile.get("preferences", {}).get(section, [])
     
-    selected_text = f"**Actualmente evitados:** {', '.join(current_disliked) if current_disliked else 'Ninguno'}"
+    selected_text = f"**{label}:** {', '.join(current) if current else 'Ninguno'}"
     
-    bot.edit_message_text(
-        f"🚫 **EDITANDO ALIMENTOS A EVITAR**\n\n"
-        f"Selecciona alimentos que prefieres evitar. Puedes elegir múltiples opciones.\n\n"
-        f"{selected_text}\n\n"
-        f"💡 Selecciona una opción o usa **➡️ Continuar** para finalizar.",
+    enqueue_edit(
         message.chat.id,
         message.message_id,
-        parse_mode='Markdown',
-        reply_markup=markup
-    )
-
-def handle_edit_cooking_methods(message, telegram_id):
-    """Manejar edición de métodos de cocción"""
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    current_methods = user_profile.get("preferences", {}).get("cooking_methods", [])
-    
-    markup = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
-    
-    cooking_options = [
-        "🔥 Horno", "🍳 Sartén", "🥘 Plancha", "🫕 Vapor",
-        "🥗 Crudo/Ensaladas", "🍲 Guisado", "🔥 Parrilla", "🥄 Hervido",
-        "➡️ Continuar"
-    ]
-    
-    buttons = [types.KeyboardButton(option) for option in cooking_options]
-    markup.add(*buttons)
-    
-    selected_text = f"**Actualmente seleccionados:** {', '.join(current_methods) if current_methods else 'Ninguno'}"
-    
-    bot.edit_message_text(
-        f"👨‍🍳 **EDITANDO MÉTODOS DE COCCIÓN**\n\n"
-        f"Selecciona tus métodos de cocción preferidos. Puedes elegir múltiples opciones.\n\n"
+        f"{title}\n\n"
+        f"{description}\n\n"
         f"{selected_text}\n\n"
         f"💡 Selecciona una opción o usa **➡️ Continuar** para finalizar.",
-        message.chat.id,
-        message.message_id,
+        priority=PRIORITY_CALLBACK,
         parse_mode='Markdown',
-        reply_markup=markup
+        reply_markup=keyboard
     )
 
-def handle_edit_training_schedule(message, telegram_id):
+def handle_edit_training_schedule(message, user_profile: Dict, section: str = "training_schedule"):
     """Manejar edición de horario de entrenamiento"""
-    user_profile = meal_bot.get_user_profile(telegram_id)
     current_schedule = user_profile.get("exercise_profile", {}).get("training_schedule_desc", "No especificado")
     
-    markup = types.ReplyKeyboardMarkup(row_width=1, resize_keyboard=True)
-    
-    schedule_options = [
-        "🌅 Mañana (6:00-12:00)",
-        "☀️ Mediodía (12:00-16:00)", 
-        "🌆 Tarde (16:00-20:00)",
-        "🌙 Noche (20:00-24:00)",
-        "🔄 Variable/Cambia"
-    ]
-    
-    buttons = [types.KeyboardButton(option) for option in schedule_options]
-    markup.add(*buttons)
-    
-    bot.edit_message_text(
+    enqueue_edit(
+        message.chat.id,
+        message.message_id,
         f"⏰ **EDITANDO HORARIO DE ENTRENAMIENTO**\n\n"
         f"¿Cuándo sueles entrenar habitualmente?\n\n"
         f"**Horario actual:** {current_schedule}\n\n"
         f"Selecciona tu nuevo horario:",
-        message.chat.id,
-        message.message_id,
+        priority=PRIORITY_CALLBACK,
         parse_mode='Markdown',
-        reply_markup=markup
+        reply_markup=EDIT_TRAINING_SCHEDULE_KEYBOARD
     )
 
-def create_favorite_buttons(telegram_id: str, recipe_id: str) -> types.InlineKeyboardMarkup:
+# Sección de /editar_perfil -> función que muestra su edición (misma firma para todas)
+EDIT_SECTION_HANDLERS = {
+    **{section: handle_edit_multiselect for section in EDIT_MULTISELECT_SECTIONS},
+    "training_schedule": handle_edit_training_schedule
+}
+
+def create_favorite_buttons(user_profile: Dict, recipe_id: str) -> types.InlineKeyboardMarkup:
     """Crear botones de favoritos para una receta"""
-    user_profile = meal_bot.get_user_profile(telegram_id)
     is_favorite = meal_bot.profile_system.is_recipe_favorite(user_profile, recipe_id)
     
     markup = types.InlineKeyboardMarkup(row_width=2)
@@ -3008,7 +3829,7 @@ def create_favorite_buttons(telegram_id: str, recipe_id: str) -> types.InlineKey
     
     return markup
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('fav_'))
+@callback_route('fav_')
 def handle_favorite_callback(call):
     """Manejar callbacks de favoritos"""
     telegram_id = str(call.from_user.id)
@@ -3025,57 +3846,49 @@ def handle_favorite_callback(call):
         return
     
     # Extraer acción y recipe_id
-    parts = call.data.split('_', 2)
-    if len(parts) != 3:
+    action, _, recipe_id = call.data[len("fav_"):].partition('_')  # action: 'add' o 'remove'
+    if not action or not recipe_id:
         bot.answer_callback_query(call.id, "❌ Comando no válido", show_alert=True)
         return
     
-    action = parts[1]  # 'add' o 'remove'
-    recipe_id = parts[2]
+    if action not in ("add", "remove"):
+        return
     
     try:
+        # Con doble pulsación el perfil ya está como pide el botón: no hace falta guardar
+        with meal_bot.data_lock:
+            changed = meal_bot.profile_system.is_recipe_favorite(user_profile, recipe_id) != (action == "add")
+            if changed:
+                if action == "add":
+                    meal_bot.profile_system.add_to_favorites(user_profile, recipe_id)
+                else:
+                    meal_bot.profile_system.remove_from_favorites(user_profile, recipe_id)
+                meal_bot.save_user_profile(telegram_id, user_profile)
+        
         if action == "add":
-            # Añadir a favoritos
-            meal_bot.profile_system.add_to_favorites(user_profile, recipe_id)
-            meal_bot.data["users"][telegram_id] = user_profile
-            meal_bot.save_data()
-            
             bot.answer_callback_query(call.id, "⭐ Añadido a favoritos!", show_alert=False)
-            
-            # Actualizar botones
-            new_markup = create_favorite_buttons(telegram_id, recipe_id)
-            try:
-                bot.edit_message_reply_markup(
-                    call.message.chat.id,
-                    call.message.message_id,
-                    reply_markup=new_markup
-                )
-            except:
-                pass  # Si no se puede editar, continuar
-            
-        elif action == "remove":
-            # Quitar de favoritos
-            meal_bot.profile_system.remove_from_favorites(user_profile, recipe_id)
-            meal_bot.data["users"][telegram_id] = user_profile
-            meal_bot.save_data()
-            
+        else:
             bot.answer_callback_query(call.id, "🚫 Quitado de favoritos", show_alert=False)
-            
-            # Actualizar botones
-            new_markup = create_favorite_buttons(telegram_id, recipe_id)
-            try:
-                bot.edit_message_reply_markup(
-                    call.message.chat.id,
-                    call.message.message_id,
-                    reply_markup=new_markup
-                )
-            except:
-                pass  # Si no se puede editar, continuar
+        
+        # El teclado se compara con el del mensaje pulsado, no con el perfil: un botón
+        # quedado obsoleto (favorito cambiado desde otro mensaje o /favoritas) también
+        # se corrige. Solo si ya coincide se evita la edición ("message is not modified")
+        new_markup = create_favorite_buttons(user_profile, recipe_id)
+        current_markup = call.message.reply_markup
+        if current_markup is None or current_markup.to_dict() != new_markup.to_dict():
+            # Por el dispatcher: respeta el límite global y los 429 de Telegram;
+            # si no se puede editar, el error queda registrado allí
+            dispatcher.submit(
+                call.message.chat.id, bot.edit_message_reply_markup,
+                call.message.chat.id, call.message.message_id,
+                reply_markup=new_markup,
+                priority=PRIORITY_CALLBACK
+            )
         
     except Exception as e:
         bot.answer_callback_query(call.id, f"❌ Error: {str(e)}", show_alert=True)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('gen_'))
+@callback_route('gen_')
 def handle_generation_callback(call):
     """Manejar callbacks de generación de múltiples opciones de recetas"""
     telegram_id = str(call.from_user.id)
@@ -3085,44 +3898,10 @@ def handle_generation_callback(call):
         bot.answer_callback_query(call.id, "❌ Configura tu perfil primero", show_alert=True)
         return
     
-    # Mapear callback a parámetros
-    timing_map = {
-        "gen_pre_entreno": {
-            "timing_category": "pre_entreno",
-            "function_category": "energia_rapida",
-            "target_macros": {"protein": 10, "carbs": 35, "fat": 5, "calories": 210}
-        },
-        "gen_post_entreno": {
-            "timing_category": "post_entreno", 
-            "function_category": "sintesis_proteica",
-            "target_macros": {"protein": 35, "carbs": 30, "fat": 8, "calories": 320}
-        },
-        "gen_desayuno": {
-            "timing_category": "desayuno",
-            "function_category": "equilibrio_nutricional",
-            "target_macros": {"protein": 25, "carbs": 45, "fat": 15, "calories": 380}
-        },
-        "gen_almuerzo": {
-            "timing_category": "almuerzo",
-            "function_category": "equilibrio_nutricional",
-            "target_macros": {"protein": 40, "carbs": 50, "fat": 20, "calories": 480}
-        },
-        "gen_merienda": {
-            "timing_category": "merienda",
-            "function_category": "micronutrientes", 
-            "target_macros": {"protein": 15, "carbs": 20, "fat": 12, "calories": 220}
-        },
-        "gen_cena": {
-            "timing_category": "cena",
-            "function_category": "equilibrio_nutricional",
-            "target_macros": {"protein": 35, "carbs": 25, "fat": 18, "calories": 360}
-        }
-    }
-    
     # Limpiar callback data para manejar "_more_timestamp"
     clean_callback = call.data.split('_more_')[0]
     
-    request_data = timing_map.get(clean_callback)
+    request_data = GENERATION_REQUESTS.get(clean_callback)
     if not request_data:
         bot.answer_callback_query(call.id, "❌ Opción no válida", show_alert=True)
         return
@@ -3130,24 +3909,19 @@ def handle_generation_callback(call):
     # Si es una solicitud de "más opciones", agregar indicador de variabilidad
     is_more_request = '_more_' in call.data
     if is_more_request:
-        # Agregar timestamp para forzar variabilidad en el prompt
-        request_data = request_data.copy()
-        request_data['variability_seed'] = call.data.split('_more_')[1]
-        request_data['generation_type'] = 'more_options'
+        # Agregar timestamp para forzar variabilidad en el prompt (sin tocar la constante compartida)
+        request_data = {
+            **request_data,
+            'variability_seed': call.data.split('_more_')[1],
+            'generation_type': 'more_options'
+        }
     
     bot.answer_callback_query(call.id, "🤖 Generando 5 opciones personalizadas...")
     
     # Mensaje de procesamiento
-    timing_display = {
-        "pre_entreno": "⚡ PRE-ENTRENO",
-        "post_entreno": "💪 POST-ENTRENO",
-        "desayuno": "🌅 DESAYUNO",
-        "almuerzo": "🍽️ ALMUERZO",
-        "merienda": "🥜 MERIENDA",
-        "cena": "🌙 CENA"
-    }.get(request_data['timing_category'], request_data['timing_category'].upper())
-    
-    processing_msg = bot.send_message(
+    timing_display = GENERATION_TIMING_NAMES.get(request_data['timing_category'], request_data['timing_category'].upper())
+    
+    processing_msg = enqueue_send(
         call.message.chat.id,
         f"🤖 **GENERANDO 5 OPCIONES PARA {timing_display}**\n\n"
         f"📊 **Macros objetivo:** {request_data['target_macros']['calories']} kcal por opción\n"
@@ -3158,22 +3932,34 @@ def handle_generation_callback(call):
         "🧬 Adaptando a tus preferencias...\n"
         "✅ Validando calidad nutricional...\n\n"
         "*Esto puede tomar 10-15 segundos...*",
-        parse_mode='Markdown'
+        parse_mode='Markdown',
+        priority=PRIORITY_CALLBACK,
+        dedupe=False
+    )
+    
+    run_in_background(
+        run_recipe_generation, call.message.chat.id, telegram_id, user_profile,
+        request_data, clean_callback, processing_msg
     )
+
+def run_recipe_generation(chat_id: int, telegram_id: str, user_profile: Dict, request_data: Dict,
+                          clean_callback: str, processing_msg: Future):
+    """Generar las opciones de receta con IA y enviarlas (se ejecuta en segundo plano)"""
+    timing_category = request_data['timing_category']
     
     try:
         # Generar múltiples opciones con IA
         result = meal_bot.ai_generator.generate_multiple_recipes(user_profile, request_data, num_options=5)
         
         # Borrar mensaje de procesamiento
-        bot.delete_message(call.message.chat.id, processing_msg.message_id)
+        enqueue_delete(chat_id, processing_msg, priority=PRIORITY_CALLBACK)
         
         if result["success"]:
-            # Importar la función de formateo
-            from ai_integration import format_multiple_recipes_for_display
-            
             # Formatear opciones para display
-            options_text = format_multiple_recipes_for_display(result, request_data['timing_category'])
+            options_text = format_multiple_recipes_for_display(result, timing_category)
+            
+            # Un único instante para la semilla de variabilidad y la fecha de generación
+            now = time.time()
             
             # Crear botones de selección
             keyboard = types.InlineKeyboardMarkup(row_width=2)
@@ -3183,72 +3969,105 @@ def handle_generation_callback(call):
             for i, option in enumerate(options[:5], 1):  # Máximo 5 opciones
                 recipe_name = option["recipe"]["nombre"]
                 # Acortar nombre si es muy largo
-                display_name = recipe_name if len(recipe_name) <= 25 else f"{recipe_name[:22]}..."
+                display_name = shorten_label(recipe_name, 25)
                 keyboard.add(
                     types.InlineKeyboardButton(
                         f"✅ Opción {i}: {display_name}", 
-                        callback_data=f"select_recipe_{i}_{request_data['timing_category']}"
+                        callback_data=f"select_recipe_{i}_{timing_category}"
                     )
                 )
             
             # Botón para generar más opciones con timestamp para forzar variabilidad
-            import time
-            timestamp = int(time.time())
             keyboard.add(
                 types.InlineKeyboardButton(
                     "🔄 Generar 5 opciones nuevas", 
-                    callback_data=f"{call.data}_more_{timestamp}"
+                    callback_data=f"{clean_callback}_more_{int(now)}"
                 )
             )
             
             # Enviar opciones con botones
             meal_bot.send_long_message(
-                call.message.chat.id, 
+                chat_id, 
                 options_text, 
                 parse_mode='Markdown', 
-                reply_markup=keyboard
+                reply_markup=keyboard,
+                priority=PRIORITY_CALLBACK
             )
             
             # Guardar las opciones temporalmente para cuando el usuario seleccione
-            if "temp_recipe_options" not in user_profile:
-                user_profile["temp_recipe_options"] = {}
-            
-            user_profile["temp_recipe_options"][request_data['timing_category']] = {
-                "options": options,
-                "generated_at": datetime.now().isoformat(),
-                "request_data": request_data
-            }
-            
-            # Guardar en la base de datos
-            meal_bot.data["users"][telegram_id] = user_profile
-            meal_bot.save_data()
+            with meal_bot.data_lock:
+                if "temp_recipe_options" not in user_profile:
+                    user_profile["temp_recipe_options"] = {}
+                
+                user_profile["temp_recipe_options"][timing_category] = {
+                    "options": options,
+                    "generated_at": datetime.fromtimestamp(now).isoformat(),
+                    "request_data": request_data
+                }
+                
+                # Guardar en la base de datos
+                meal_bot.save_user_profile(telegram_id, user_profile)
             
         else:
             error_msg = result.get("error", "Error desconocido")
-            bot.send_message(
-                call.message.chat.id,
+            enqueue_send(
+                chat_id,
                 f"❌ **Error generando opciones:**\n{error_msg}\n\n"
                 "💡 **Intenta:**\n"
                 "• Usar /generar de nuevo\n"
                 "• Verificar tu conexión\n"
                 "• Usar /buscar para búsqueda libre",
-                parse_mode='Markdown'
+                parse_mode='Markdown',
+                priority=PRIORITY_CALLBACK
             )
             
     except Exception as e:
-        logger.error(f"Error in multiple recipe generation: {e}")
-        try:
-            bot.delete_message(call.message.chat.id, processing_msg.message_id)
-        except:
-            pass
-        bot.send_message(
-            call.message.chat.id,
+        logger.error("Error in multiple recipe generation: %s", e)
+        enqueue_delete(chat_id, processing_msg, priority=PRIORITY_CALLBACK)
+        enqueue_send(
+            chat_id,
             "❌ **Error técnico** generando las opciones.\n"
             "Inténtalo de nuevo en unos momentos.",
-            parse_mode='Markdown'
+            parse_mode='Markdown',
+            priority=PRIORITY_CALLBACK
         )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('select_recipe_'))
+def apply_selection_learning(telegram_id: str, recipe: Dict, timing_category: str,
+                             option_number: int, options: List[Dict], user_profile: Dict):
+    """Registrar la selección y los rechazos en el sistema de aprendizaje (en segundo plano)"""
+    try:
+        # El perfil es compartido con el hilo de updates y con el guardado:
+        # se modifica bajo data_lock para no serializarlo a medio actualizar
+        with meal_bot.data_lock:
+            # Registrar la receta seleccionada (valoración positiva implícita)
+            selection_result = meal_bot.recipe_intelligence.register_recipe_selection(
+                telegram_id, 
+                recipe, 
+                timing_category,
+                option_number,
+                len(options),
+                user_profile
+            )
+            
+            # Registrar las opciones no seleccionadas (valoración negativa implícita)
+            all_recipes = [opt["recipe"] for opt in options]
+            rejection_result = meal_bot.recipe_intelligence.register_recipe_rejection(
+                telegram_id,
+                all_recipes,
+                option_number,
+                timing_category,
+                user_profile
+            )
+            
+            # Guardar el perfil actualizado con los aprendizajes
+            meal_bot.save_user_profile(telegram_id, user_profile)
+        
+        logger.info("Learning system updated: selection=%s, rejections=%s", selection_result.get('success'), rejection_result.get('success'))
+        
+    except Exception as e:
+        logger.error("Error registering recipe learning: %s", e)
+
+@callback_route('select_recipe_')
 def handle_recipe_selection_callback(call):
     """Manejar la selección de una receta específica de las múltiples opciones"""
     telegram_id = str(call.from_user.id)
@@ -3260,101 +4079,75 @@ def handle_recipe_selection_callback(call):
     
     try:
         # Parsear callback data: select_recipe_{option_number}_{timing_category}
-        parts = call.data.split('_')
-        if len(parts) != 4:
+        # (el timing puede llevar '_', p. ej. pre_entreno)
+        option_text, _, timing_category = call.data[len("select_recipe_"):].partition('_')
+        if not timing_category:
             bot.answer_callback_query(call.id, "❌ Formato de callback inválido", show_alert=True)
             return
         
-        option_number = int(parts[2])
-        timing_category = parts[3]
+        option_number = int(option_text)
+        
+        # Leer, retirar y guardar las opciones bajo data_lock: una doble pulsación o
+        # el guardado de nuevas opciones en segundo plano no pueden intercalarse
+        with meal_bot.data_lock:
+            # Obtener opciones temporales guardadas
+            temp_options = user_profile.get("temp_recipe_options", {}).get(timing_category)
+            options = temp_options.get("options", []) if temp_options else []
+            valid_option = 1 <= option_number <= len(options)
+            
+            if valid_option:
+                # Obtener la receta seleccionada
+                selected_option = options[option_number - 1]
+                recipe = selected_option["recipe"]
+                validation = selected_option["validation"]
+                
+                # Guardar receta en el perfil del usuario
+                meal_bot.save_generated_recipe(telegram_id, recipe, timing_category, validation)
+                
+                # Limpiar opciones temporales después de la selección
+                del user_profile["temp_recipe_options"][timing_category]
+                
+                # Guardado diferido de la receta y las opciones temporales
+                meal_bot.save_user_profile(telegram_id, user_profile)
         
-        # Obtener opciones temporales guardadas
-        temp_options = user_profile.get("temp_recipe_options", {}).get(timing_category)
         if not temp_options:
             bot.answer_callback_query(call.id, "❌ Opciones expiradas. Genera nuevas opciones.", show_alert=True)
             return
         
-        options = temp_options.get("options", [])
-        if option_number < 1 or option_number > len(options):
+        if not valid_option:
             bot.answer_callback_query(call.id, "❌ Opción no válida", show_alert=True)
             return
         
-        # Obtener la receta seleccionada
-        selected_option = options[option_number - 1]
-        recipe = selected_option["recipe"]
-        validation = selected_option["validation"]
-        request_data = temp_options["request_data"]
-        
         bot.answer_callback_query(call.id, f"✅ Opción {option_number} seleccionada!")
         
-        # Guardar receta en el perfil del usuario
-        save_success = meal_bot.save_generated_recipe(telegram_id, recipe, timing_category, validation)
-        
-        # Formatear receta completa para mostrar
-        from ai_integration import format_recipe_for_display
-        recipe_text = format_recipe_for_display(recipe, validation)
-        
         # Mensaje de confirmación simple con nombre de la receta
         recipe_name = recipe.get("nombre", "Receta")
         confirmation_message = f"✅ {recipe_name} guardada en tu historial"
         
         success_text = confirmation_message
         
-        # Limpiar opciones temporales después de la selección
-        if "temp_recipe_options" in user_profile:
-            if timing_category in user_profile["temp_recipe_options"]:
-                del user_profile["temp_recipe_options"][timing_category]
-            
-            # Guardar cambios
-            meal_bot.data["users"][telegram_id] = user_profile
-            meal_bot.save_data()
-        
         # Enviar mensaje de confirmación simple (sin submenú)
-        bot.send_message(
+        enqueue_send(
             call.message.chat.id, 
             success_text, 
-            parse_mode='Markdown'
+            parse_mode='Markdown',
+            priority=PRIORITY_CALLBACK
         )
         
-        # Sistema de aprendizaje: registrar la selección y rechazos
+        # Sistema de aprendizaje en segundo plano: el usuario ya tiene su confirmación
         if hasattr(meal_bot, 'recipe_intelligence'):
-            try:
-                # Registrar la receta seleccionada (valoración positiva implícita)
-                selection_result = meal_bot.recipe_intelligence.register_recipe_selection(
-                    telegram_id, 
-                    recipe, 
-                    timing_category,
-                    option_number,
-                    len(options),
-                    user_profile
-                )
-                
-                # Registrar las opciones no seleccionadas (valoración negativa implícita)
-                all_recipes = [opt["recipe"] for opt in options]
-                rejection_result = meal_bot.recipe_intelligence.register_recipe_rejection(
-                    telegram_id,
-                    all_recipes,
-                    option_number,
-                    timing_category,
-                    user_profile
-                )
-                
-                logger.info(f"Learning system updated: selection={selection_result.get('success')}, rejections={rejection_result.get('success')}")
-                
-                # Guardar el perfil actualizado con los aprendizajes
-                if selection_result.get('success'):
-                    meal_bot.database.save_user_profile(telegram_id, user_profile)
-                
-            except Exception as e:
-                logger.error(f"Error registering recipe learning: {e}")
+            run_in_background(
+                apply_selection_learning, telegram_id, recipe, timing_category,
+                option_number, options, user_profile
+            )
         
     except ValueError:
         bot.answer_callback_query(call.id, "❌ Número de opción inválido", show_alert=True)
     except Exception as e:
-        logger.error(f"Error handling recipe selection: {e}")
+        logger.error("Error handling recipe selection: %s", e)
         bot.answer_callback_query(call.id, "❌ Error procesando selección", show_alert=True)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('schedule_'))
+@callback_route('schedule_')
 def handle_schedule_callback(call):
     """Manejar callbacks de selección de cronograma"""
     telegram_id = str(call.from_user.id)
@@ -3363,87 +4156,43 @@ def handle_schedule_callback(call):
     if not user_profile:
         bot.answer_callback_query(call.id, "❌ Configura tu perfil primero", show_alert=True)
         return
-    
+
     # Extraer el tipo de cronograma seleccionado
-    schedule_type = call.data.replace('schedule_', '')
+    schedule_type = call.data[len('schedule_'):]
     
     # Verificar que el cronograma existe
     schedule_data = meal_bot.data['cooking_schedules'].get(schedule_type, {})
     
     if not schedule_data:
-        bot.answer_callback_query(call.id, "❌ Cronograma no encontrado", show_alert=True)
-        return
-    
-    # Guardar la selección en el perfil del usuario
-    if 'settings' not in user_profile:
-        user_profile['settings'] = {}
-    user_profile['settings']['cooking_schedule'] = schedule_type
-    meal_bot.save_data()
-    
-    bot.answer_callback_query(call.id, "✅ Cronograma seleccionado")
-    
-    # Mostrar el cronograma seleccionado
-    response_text = f"""
-⏰ **CRONOGRAMA DE COCCIÓN SEMANAL**
-
-🎯 **Tu cronograma:** {schedule_data.get('name', 'Personalizado')}
-📝 **Descripción:** {schedule_data.get('description', 'Cronograma optimizado')}
-⏱️ **Tiempo estimado:** {schedule_data.get('estimated_time', 'Variable')}
-
-**SESIONES PLANIFICADAS:**
-"""
-    
-    sessions = schedule_data.get('sessions', [])
-    for i, session in enumerate(sessions, 1):
-        day = session.get('day', 'día').title()
-        duration = session.get('duration', '2-3 horas')
-        start_time = session.get('start_time', '10:00')
-        tasks = session.get('tasks', [])
-        
-        response_text += f"""
-**SESIÓN {i} - {day}**
-🕐 Horario: {start_time}
-⏰ Duración: {duration}
-📋 Tareas:
-"""
-        for task in tasks:
-            response_text += f"• {task.replace('_', ' ').title()}\n"
+        bot.answer_callback_query(call.id, "❌ Cronograma no encontrado", show_alert=True)
+        return
     
-    # Ventajas/desventajas
-    pros = schedule_data.get('pros', [])
-    cons = schedule_data.get('cons', [])
+    # Pulsación repetida del mismo cronograma: ni guardado ni nueva edición del mensaje
+    if user_profile.get('settings', {}).get('cooking_schedule') == schedule_type:
+        bot.answer_callback_query(call.id, "✅ Cronograma ya seleccionado")
+        return
     
-    if pros:
-        response_text += "\n✅ **VENTAJAS:**\n"
-        for pro in pros:
-            response_text += f"• {pro}\n"
+    # Guardar la selección en el perfil del usuario
+    with meal_bot.data_lock:
+        if 'settings' not in user_profile:
+            user_profile['settings'] = {}
+        user_profile['settings']['cooking_schedule'] = schedule_type
+        meal_bot.save_user_profile(telegram_id, user_profile)
     
-    if cons:
-        response_text += "\n⚠️ **CONSIDERACIONES:**\n"
-        for con in cons:
-            response_text += f"• {con}\n"
+    bot.answer_callback_query(call.id, "✅ Cronograma seleccionado")
     
-    response_text += f"""
-
-💡 **OPTIMIZACIÓN SEGÚN TU PERFIL:**
-• Objetivo: {user_profile['basic_data']['objetivo_descripcion']}
-• Available Energy: {user_profile['energy_data']['available_energy']} kcal/kg FFM/día
-• Macros diarios: {user_profile['macros']['calories']} kcal
-
-**Comandos relacionados:**
-• /compras - Lista de compras para este cronograma
-• /menu - Ver distribución nutricional semanal
-• /planificar_semana - Optimización avanzada
-"""
+    # Mostrar el cronograma seleccionado
+    response_text = render_cooking_schedule(schedule_type, user_profile, CRONOGRAMA_CALLBACK_FOOTER_TEXT)
     
-    bot.edit_message_text(
-        text=response_text,
-        chat_id=call.message.chat.id,
-        message_id=call.message.message_id,
+    enqueue_edit(
+        call.message.chat.id,
+        call.message.message_id,
+        response_text,
+        priority=PRIORITY_CALLBACK,
         parse_mode='Markdown'
     )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('select_search_recipe_'))
+@callback_route('select_search_recipe_')
 def handle_search_recipe_selection_callback(call):
     """Manejar selección de receta de búsqueda"""
     telegram_id = str(call.from_user.id)
@@ -3459,16 +4208,14 @@ def handle_search_recipe_selection_callback(call):
         bot.answer_callback_query(call.id, "❌ Sesión expirada. Intenta la búsqueda de nuevo.", show_alert=True)
         return
     
-    # Extraer índice de la receta seleccionada
-    recipe_index = int(call.data.replace('select_search_recipe_', ''))
-    results = user_state.get("results", [])
-    
-    if recipe_index >= len(results):
+    # Extraer índice y obtener la receta seleccionada
+    recipe_index = int(call.data[len('select_search_recipe_'):])
+    try:
+        selected_result = user_state["results"][recipe_index]
+    except (KeyError, IndexError):
         bot.answer_callback_query(call.id, "❌ Receta no encontrada", show_alert=True)
         return
     
-    # Obtener la receta seleccionada
-    selected_result = results[recipe_index]
     recipe = selected_result.get("adaptacion_propuesta")
     validation = selected_result.get("validation", {})
     
@@ -3482,10 +4229,9 @@ def handle_search_recipe_selection_callback(call):
     timing_category = recipe.get("categoria_timing", "almuerzo")  # Default a almuerzo
     
     # Guardar la receta seleccionada
-    success = meal_bot.save_generated_recipe(telegram_id, recipe, timing_category, validation)
+    meal_bot.save_generated_recipe(telegram_id, recipe, timing_category, validation)
     
-    if success:
-        response_text = f"""
+    response_text = f"""
 ✅ **RECETA GUARDADA EXITOSAMENTE**
 
 📚 **"{recipe.get('nombre', 'Receta')}"** ha sido añadida a tus recetas.
@@ -3497,18 +4243,13 @@ def handle_search_recipe_selection_callback(call):
 • `/nueva_semana` - Generar plan completo
 
 💡 **La IA aprende de tus selecciones para futuras recomendaciones.**
-"""
-    else:
-        response_text = """
-❌ **Error al guardar la receta**
-
-Intenta de nuevo o contacta soporte si el problema persiste.
 """
     
-    bot.edit_message_text(
-        text=response_text,
-        chat_id=call.message.chat.id,
-        message_id=call.message.message_id,
+    enqueue_edit(
+        call.message.chat.id,
+        call.message.message_id,
+        response_text,
+        priority=PRIORITY_CALLBACK,
         parse_mode='Markdown'
     )
     
@@ -3516,30 +4257,28 @@ Intenta de nuevo o contacta soporte si el problema persiste.
     if telegram_id in meal_bot.user_states:
         del meal_bot.user_states[telegram_id]
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('more_search_options_'))
+@callback_route('more_search_options_')
 def handle_more_search_options_callback(call):
     """Manejar solicitud de más opciones de búsqueda"""
     telegram_id = str(call.from_user.id)
-    query = call.data.replace('more_search_options_', '')
+    query = call.data[len('more_search_options_'):]
     
     bot.answer_callback_query(call.id, "🔄 Buscando más opciones...")
     
-    # Editar mensaje para mostrar que está procesando
-    bot.edit_message_text(
-        text=f"🤖 **Buscando más opciones para:** '{query}'\n\n"
-             "⏳ Generando nuevas recetas con IA...\n"
-             "📊 Adaptando a tu perfil nutricional...",
-        chat_id=call.message.chat.id,
-        message_id=call.message.message_id,
-        parse_mode='Markdown'
+    # Editar mensaje para mostrar que está procesando (sin esperar a Telegram:
+    # la búsqueda responde con mensajes nuevos, no vuelve a editar este)
+    enqueue_edit(
+        call.message.chat.id,
+        call.message.message_id,
+        f"🤖 **Buscando más opciones para:** '{query}'\n\n"
+        "⏳ Generando nuevas recetas con IA...\n"
+        "📊 Adaptando a tu perfil nutricional...",
+        parse_mode='Markdown',
+        priority=PRIORITY_CALLBACK
     )
     
     # Crear mensaje simulado para reutilizar la función
-    class MockMessage:
-        def __init__(self, chat_id):
-            self.chat = type('obj', (object,), {'id': chat_id})
-    
-    mock_message = MockMessage(call.message.chat.id)
+    mock_message = mock_message_from_call(call)
     
     # Llamar a la función de búsqueda
     process_ai_search(telegram_id, query, mock_message)
@@ -3549,58 +4288,14 @@ def compras_command(message):
     """Mostrar lista de compras con complementos"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    
-    response_text = f"""
-🛒 **LISTA DE COMPRAS SEMANAL**
-
-👤 **Tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}
-🔥 **Calorías objetivo:** {user_profile['macros']['calories']} kcal/día
-
-**PROTEÍNAS:**
-• Pechuga de pollo: 2.5 kg
-• Carne de res magra: 1.5 kg
-• Huevos frescos: 2 docenas
-• Salmón fresco: 800g
-
-**LEGUMBRES Y CEREALES:**
-• Quinoa: 500g
-• Arroz integral: 1 kg
-• Lentejas rojas: 400g
-• Garbanzos secos: 500g
-
-**VEGETALES FRESCOS:**
-• Brócoli: 1 kg
-• Espinacas: 500g
-• Tomates: 1.5 kg
-• Pimientos: 800g
-• Cebolla: 1 kg
-
-🥜 **COMPLEMENTOS MEDITERRÁNEOS:**
-• Almendras crudas: 250g
-• Nueces: 200g
-• Yogur griego natural: 1 kg
-• Queso feta: 300g
-• Aceitunas kalamata: 200g
-• Miel cruda: 1 bote
-• Aceite oliva virgen extra: 500ml
-
-**ESPECIAS Y HIERBAS:**
-• Oregano seco
-• Tomillo fresco
-• Ajo fresco
-• Jengibre
-• Comino molido
-
-💡 **Tip:** Esta lista está optimizada para meal prep semanal según tu perfil nutricional.
-
-**Comandos relacionados:**
-• /cronograma - Ver cuándo cocinar cada cosa
-• /menu - Ver cómo se distribuye todo
-"""
+    response_text = COMPRAS_TEMPLATE.format_map({
+        "objetivo": user_profile['basic_data']['objetivo_descripcion'],
+        "calories": user_profile['macros']['calories']
+    })
     
     meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown')
 
@@ -3609,20 +4304,20 @@ def cronograma_command(message):
     """Mostrar cronograma de cocción"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
-        return
-    
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    if not user_profile:
-        bot.send_message(message.chat.id, "❌ Error: No se pudo encontrar tu perfil")
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
+
+    # Datos del perfil
+    basic_data = user_profile["basic_data"]
+    energy_data = user_profile["energy_data"]
     
     # Obtener cronograma con valores por defecto
     cooking_schedule = user_profile.get('settings', {}).get('cooking_schedule', 'dos_sesiones')
     
     # Verificar que existan cooking_schedules en los datos
     if 'cooking_schedules' not in meal_bot.data:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "⚠️ **CRONOGRAMA NO DISPONIBLE**\n\n"
             "Los datos de cronogramas no están disponibles actualmente.\n"
@@ -3648,8 +4343,8 @@ def cronograma_command(message):
         response_text = f"""
 ⏰ **SELECCIONA TU CRONOGRAMA DE COCCIÓN**
 
-👤 **Tu perfil:** {user_profile['basic_data']['objetivo_descripcion']}
-⚡ **Available Energy:** {user_profile['energy_data']['available_energy']} kcal/kg FFM/día
+👤 **Tu perfil:** {basic_data['objetivo_descripcion']}
+⚡ **Available Energy:** {energy_data['available_energy']} kcal/kg FFM/día
 
 **OPCIONES DISPONIBLES:**
 
@@ -3663,7 +4358,7 @@ def cronograma_command(message):
 **¿Quieres más opciones?**
 Usa /nueva_semana para explorar cronogramas específicos.
 """
-        bot.send_message(
+        enqueue_send(
             message.chat.id, 
             response_text, 
             parse_mode='Markdown',
@@ -3671,56 +4366,7 @@ Usa /nueva_semana para explorar cronogramas específicos.
         )
         return
     
-    response_text = f"""
-⏰ **CRONOGRAMA DE COCCIÓN SEMANAL**
-
-🎯 **Tu cronograma:** {schedule_data.get('name', 'Personalizado')}
-📝 **Descripción:** {schedule_data.get('description', 'Cronograma optimizado')}
-⏱️ **Tiempo estimado:** {schedule_data.get('estimated_time', 'Variable')}
-
-**SESIONES PLANIFICADAS:**
-"""
-    
-    sessions = schedule_data.get('sessions', [])
-    for i, session in enumerate(sessions, 1):
-        day = session.get('day', 'día').title()
-        duration = session.get('duration', '2-3 horas')
-        start_time = session.get('start_time', '10:00')
-        tasks = session.get('tasks', [])
-        
-        response_text += f"""
-**SESIÓN {i} - {day}**
-🕐 Horario: {start_time}
-⏰ Duración: {duration}
-📋 Tareas:
-"""
-        for task in tasks:
-            response_text += f"• {task.replace('_', ' ').title()}\n"
-    
-    # Ventajas/desventajas
-    pros = schedule_data.get('pros', [])
-    cons = schedule_data.get('cons', [])
-    
-    if pros:
-        response_text += "\n✅ **VENTAJAS:**\n"
-        for pro in pros:
-            response_text += f"• {pro}\n"
-    
-    if cons:
-        response_text += "\n⚠️ **CONSIDERACIONES:**\n"
-        for con in cons:
-            response_text += f"• {con}\n"
-    
-    response_text += f"""
-
-💡 **OPTIMIZACIÓN SEGÚN TU PERFIL:**
-• Objetivo: {user_profile['basic_data']['objetivo_descripcion']}
-• Available Energy: {user_profile['energy_data']['available_energy']} kcal/kg FFM/día
-• Macros diarios: {user_profile['macros']['calories']} kcal
-
-**¿Quieres cambiar tu cronograma?**
-Usa /nueva_semana para explorar otras opciones.
-"""
+    response_text = render_cooking_schedule(cooking_schedule, user_profile, CRONOGRAMA_COMMAND_FOOTER_TEXT)
     
     meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown')
 
@@ -3729,12 +4375,8 @@ def timing_command(message):
     """Mostrar timing nutricional personalizado según horario de entrenamiento"""
     telegram_id = str(message.from_user.id)
     
-    if not meal_bot.create_user_if_not_exists(telegram_id, message):
-        return
-    
-    user_profile = meal_bot.get_user_profile(telegram_id)
-    if not user_profile:
-        bot.send_message(message.chat.id, "❌ Error: No se pudo encontrar tu perfil")
+    user_profile = meal_bot.require_user_profile(telegram_id, message)
+    if user_profile is None:
         return
     
     exercise_profile = user_profile.get("exercise_profile", {})
@@ -3744,38 +4386,22 @@ def timing_command(message):
     timing_desc = exercise_profile.get("timing_description", {})
     objetivo = user_profile["basic_data"]["objetivo_descripcion"]
     
-    response_text = f"""
+    parts = [f"""
 ⏰ **TU TIMING NUTRICIONAL PERSONALIZADO**
 
 🎯 **Horario de entrenamiento:** {training_desc}
 💪 **Objetivo:** {objetivo}
 
 **DISTRIBUCIÓN ÓPTIMA DE COMIDAS:**
-"""
-    
-    # Iconos para cada comida
-    meal_icons = {
-        "desayuno": "🌅",
-        "almuerzo": "🌞", 
-        "merienda": "🌇",
-        "cena": "🌙"
-    }
-    
-    # Traducir categorías de timing
-    timing_translation = {
-        "pre_entreno": "⚡ PRE-ENTRENO",
-        "post_entreno": "💪 POST-ENTRENO",
-        "comida_principal": "🍽️ COMIDA PRINCIPAL", 
-        "snack_complemento": "🥜 SNACK/COMPLEMENTO"
-    }
+"""]
     
     for meal, timing_category in dynamic_timing.items():
-        icon = meal_icons.get(meal, "🍽️")
-        timing_name = timing_translation.get(timing_category, timing_category.title())
-        response_text += f"\n{icon} **{meal.title()}:** {timing_name}"
+        icon = TIMING_MEAL_ICONS.get(meal, "🍽️")
+        timing_name = TIMING_CATEGORY_NAMES.get(timing_category, timing_category.title())
+        parts.append(f"\n{icon} **{meal.title()}:** {timing_name}")
     
     if timing_desc:
-        response_text += f"""
+        parts.append(f"""
 
 📝 **ESTRATEGIA NUTRICIONAL:**
 • **Pre-entreno:** {timing_desc.get('pre_timing', 'Adaptado a tu horario')}
@@ -3789,20 +4415,11 @@ def timing_command(message):
 
 🔄 **¿Cambió tu horario?**
 Usa /perfil para actualizar tu horario de entrenamiento.
-"""
+""")
     else:
-        response_text += """
-
-💡 **CÓMO USARLO:**
-• Usa /generar para crear recetas específicas por timing
-• /recetas te mostrará todas tus recetas generadas
-• Cada receta está optimizada para el momento del día
-
-🔄 **¿Quieres optimizar más?**
-Usa /perfil para configurar tu horario de entrenamiento específico.
-"""
+        parts.append(TIMING_GENERIC_TIPS_TEXT)
     
-    meal_bot.send_long_message(message.chat.id, response_text, parse_mode='Markdown')
+    meal_bot.send_long_message(message.chat.id, "".join(parts), parse_mode='Markdown')
 
 @bot.message_handler(commands=['rating'])
 def rating_command(message):
@@ -3813,10 +4430,10 @@ def rating_command(message):
         return
     
     # Extraer rating del mensaje (formato: /rating receta 1-5 comentario)
-    text_parts = message.text.split(' ', 3)
+    match = RATING_COMMAND_RE.match(message.text.strip())
     
-    if len(text_parts) < 3:
-        bot.send_message(
+    if not match:
+        enqueue_send(
             message.chat.id,
             "📊 **SISTEMA DE CALIFICACIONES**\n\n"
             "**Uso:** `/rating nombre_receta 1-5 [comentario]`\n\n"
@@ -3829,22 +4446,19 @@ def rating_command(message):
         )
         return
     
-    recipe_name = text_parts[1]
-    try:
-        rating_value = int(text_parts[2])
-        if not (1 <= rating_value <= 5):
-            raise ValueError
-    except (ValueError, IndexError):
-        bot.send_message(
+    recipe_name, rating_text, comment = match.groups()
+    rating_value = RATING_VALUES.get(rating_text)
+    if rating_value is None:
+        enqueue_send(
             message.chat.id,
             "❌ **Error:** La calificación debe ser un número del 1 al 5."
         )
         return
     
-    comment = text_parts[3] if len(text_parts) > 3 else ""
+    comment = comment or ""
     
     # Simular guardado de rating (se implementaría completamente)
-    bot.send_message(
+    enqueue_send(
         message.chat.id,
         f"⭐ **CALIFICACIÓN GUARDADA**\n\n"
         f"**Receta:** {recipe_name.replace('_', ' ').title()}\n"
@@ -3867,7 +4481,7 @@ def favorito_command(message):
     text_parts = message.text.split(' ', 1)
     
     if len(text_parts) < 2:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "❤️ **SISTEMA DE FAVORITOS**\n\n"
             "**Uso:** `/favorito nombre_receta`\n\n"
@@ -3883,7 +4497,7 @@ def favorito_command(message):
     recipe_name = text_parts[1]
     
     # Simular guardado de favorito
-    bot.send_message(
+    enqueue_send(
         message.chat.id,
         f"❤️ **RECETA MARCADA COMO FAVORITA**\n\n"
         f"**Receta:** {recipe_name.replace('_', ' ').title()}\n\n"
@@ -3906,7 +4520,7 @@ def process_profile_setup(telegram_id: str, message):
     try:
         if step == "enfoque_dietetico":
             # Este paso se maneja por callbacks, no por texto
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 "⚠️ Por favor, selecciona tu enfoque dietético usando los botones de arriba.\n\n"
                 "Si no los ves, usa `/perfil` para empezar de nuevo.",
@@ -3923,7 +4537,7 @@ def process_profile_setup(telegram_id: str, message):
             meal_bot.user_states[telegram_id]["step"] = "altura"
             meal_bot.user_states[telegram_id]["data"] = data
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Peso registrado: {peso} kg\n\n"
                 "📏 **Paso 2/10:** ¿Cuál es tu altura en cm?\n"
@@ -3939,7 +4553,7 @@ def process_profile_setup(telegram_id: str, message):
             meal_bot.user_states[telegram_id]["step"] = "edad"
             meal_bot.user_states[telegram_id]["data"] = data
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Altura registrada: {altura} cm\n\n"
                 "🎂 **Paso 3/10:** ¿Cuál es tu edad en años?\n"
@@ -3958,7 +4572,7 @@ def process_profile_setup(telegram_id: str, message):
             keyboard = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
             keyboard.add("Masculino", "Femenino")
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Edad registrada: {edad} años\n\n"
                 "⚧️ **Paso 4/10:** ¿Cuál es tu sexo biológico?\n"
@@ -3980,7 +4594,7 @@ def process_profile_setup(telegram_id: str, message):
             keyboard.add("Ganancia limpia", "Recomposición")
             keyboard.add("Mantener")
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Sexo registrado: {sexo}\n\n"
                 "🎯 **Paso 5/10:** ¿Cuál es tu objetivo principal?\n\n"
@@ -4017,7 +4631,7 @@ def process_profile_setup(telegram_id: str, message):
             keyboard.add("🏃 Moderado (3-4 días/semana)")
             keyboard.add("💪 Intenso (5+ días/semana)")
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Objetivo registrado: {message.text}\n\n"
                 "🏃 **Paso 6/9:** ¿Cuál es tu nivel de actividad física?\n\n"
@@ -4070,7 +4684,7 @@ def process_profile_setup(telegram_id: str, message):
                 keyboard = types.ReplyKeyboardMarkup(row_width=1, resize_keyboard=True)
                 keyboard.add("Continuar con preferencias")
                 
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     f"✅ Actividad registrada: {activity_level.title()} (0 días/semana)\n\n"
                     "⏭️ **Saltando configuración de ejercicio**\n\n"
@@ -4087,7 +4701,7 @@ def process_profile_setup(telegram_id: str, message):
                 keyboard.add("Deportes", "HIIT")
                 keyboard.add("Mixto")
                 
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     f"✅ Actividad registrada: {activity_level.title()} ({frecuencia_semanal} días/semana)\n\n"
                     "🏋️ **Paso 7/9:** ¿Qué tipo de ejercicio haces principalmente?\n\n"
@@ -4120,7 +4734,7 @@ def process_profile_setup(telegram_id: str, message):
             keyboard.add("30-45 min", "45-60 min")
             keyboard.add("60-90 min", "90+ min")
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Ejercicio registrado: {message.text}\n\n"
                 "⏱️ **Paso 8/9:** ¿Cuánto dura cada sesión de entrenamiento?\n\n"
@@ -4157,7 +4771,7 @@ def process_profile_setup(telegram_id: str, message):
             elif any(keyword in text for keyword in ["90", "larga", "intensa"]):
                 duracion = 75
             else:
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     "❌ **No pude entender la duración.**\n\n"
                     "Por favor, usa los botones del teclado o escribe un tiempo como:\n"
@@ -4178,7 +4792,7 @@ def process_profile_setup(telegram_id: str, message):
             keyboard.add("🌇 Tarde (16:00-20:00)", "🌙 Noche (20:00-24:00)")
             keyboard.add("🔄 Variable/Cambia")
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Duración registrada: {message.text}\n\n"
                 "⏰ **Paso 9/9:** ¿A qué hora entrenas normalmente?\n\n"
@@ -4211,7 +4825,7 @@ def process_profile_setup(telegram_id: str, message):
                 horario = "variable"
                 horario_desc = "Variable/Cambia"
             else:
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     "❌ **No reconocí ese horario.**\n\n"
                     "Por favor usa los botones o escribe: mañana, mediodía, tarde, noche, o variable."
@@ -4234,7 +4848,7 @@ def process_profile_setup(telegram_id: str, message):
             keyboard.add("🌰 Frutos secos", "✅ Todas", "⏭️ Ninguna especial")
             keyboard.add("➡️ Continuar")
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Horario registrado: {horario_desc}\n\n"
                 "🍽️ **CONFIGURACIÓN FINAL:** ¿Qué PROTEÍNAS prefieres?\n\n"
@@ -4296,7 +4910,7 @@ def process_profile_setup(telegram_id: str, message):
                     selected_names = [name.replace("_", " ").title() for name in data["liked_proteins"]]
                     selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
                     
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         f"✅ **{selected.replace('_', ' ').title()}** añadido\n\n"
                         f"**Seleccionados:** {selection_text}\n\n"
@@ -4305,7 +4919,7 @@ def process_profile_setup(telegram_id: str, message):
                     return  # Mantener en el mismo paso
                 else:
                     # Si no reconoce la entrada, pedir clarificación
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         "❌ No reconocí esa opción. Por favor usa los botones o escribe: pollo, ternera, pescado, huevos, legumbres, lacteos, frutos secos, todas, ninguna, o continuar."
                     )
@@ -4326,7 +4940,7 @@ def process_profile_setup(telegram_id: str, message):
             selected_proteins = [name.replace("_", " ").title() for name in data["liked_proteins"]]
             protein_text = ", ".join(selected_proteins) if selected_proteins else "Ninguna"
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Proteínas registradas: {protein_text}\n\n"
                 "🍽️ **Paso 9B/10:** ¿Qué CARBOHIDRATOS prefieres?\n\n"
@@ -4387,7 +5001,7 @@ def process_profile_setup(telegram_id: str, message):
                     selected_names = [name.replace("_", " ").title() for name in data["liked_carbs"]]
                     selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
                     
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         f"✅ **{selected.replace('_', ' ').title()}** añadido\n\n"
                         f"**Seleccionados:** {selection_text}\n\n"
@@ -4395,7 +5009,7 @@ def process_profile_setup(telegram_id: str, message):
                     )
                     return  # Mantener en el mismo paso
                 else:
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         "❌ No reconocí esa opción. Por favor usa los botones o escribe: arroz, quinoa, avena, patatas, pasta, pan integral, frutas, todas, ninguna, o continuar."
                     )
@@ -4416,7 +5030,7 @@ def process_profile_setup(telegram_id: str, message):
             selected_carbs = [name.replace("_", " ").title() for name in data["liked_carbs"]]
             carb_text = ", ".join(selected_carbs) if selected_carbs else "Ninguna"
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Carbohidratos registrados: {carb_text}\n\n"
                 "🍽️ **Paso 9C/10:** ¿Qué VERDURAS prefieres?\n\n"
@@ -4477,7 +5091,7 @@ def process_profile_setup(telegram_id: str, message):
                     selected_names = [name.replace("_", " ").title() for name in data["liked_vegetables"]]
                     selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
                     
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         f"✅ **{selected.replace('_', ' ').title()}** añadido\n\n"
                         f"**Seleccionados:** {selection_text}\n\n"
@@ -4485,7 +5099,7 @@ def process_profile_setup(telegram_id: str, message):
                     )
                     return  # Mantener en el mismo paso
                 else:
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         "❌ No reconocí esa opción. Por favor usa los botones o escribe: hojas verdes, cruciferas, solanaceas, aromaticas, raices, pimientos, pepinaceas, todas, ninguna, o continuar."
                     )
@@ -4506,7 +5120,7 @@ def process_profile_setup(telegram_id: str, message):
             selected_veggies = [name.replace("_", " ").title() for name in data["liked_vegetables"]]
             veggie_text = ", ".join(selected_veggies) if selected_veggies else "Ninguna"
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Verduras registradas: {veggie_text}\n\n"
                 "🚫 **Paso 9D/10:** ¿Qué alimentos prefieres EVITAR?\n\n"
@@ -4543,7 +5157,7 @@ def process_profile_setup(telegram_id: str, message):
             elif "otros" in text or text == "📝 otros":
                 # Permitir texto libre para casos específicos
                 meal_bot.user_states[telegram_id]["step"] = "disgustos_texto"
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     "📝 **Escribe otros alimentos que prefieres evitar:**\n\n"
                     "Ejemplos: mariscos, gluten, soja, cítricos\n\n"
@@ -4576,7 +5190,7 @@ def process_profile_setup(telegram_id: str, message):
                     selected_names = [name.replace("_", " ").title() for name in data["disliked_foods"]]
                     selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
                     
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         f"✅ **{selected.replace('_', ' ').title()}** añadido a evitar\n\n"
                         f"**A evitar:** {selection_text}\n\n"
@@ -4584,7 +5198,7 @@ def process_profile_setup(telegram_id: str, message):
                     )
                     return  # Mantener en el mismo paso
                 else:
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         "❌ No reconocí esa opción. Por favor usa los botones o escribe: pescado, lacteos, picante, ajo, cebolla, frutos secos, hongos, cilantro, sin restricciones, otros, o continuar."
                     )
@@ -4606,7 +5220,7 @@ def process_profile_setup(telegram_id: str, message):
             selected_dislikes = [name.replace("_", " ").title() for name in data["disliked_foods"]]
             dislike_text = ", ".join(selected_dislikes) if selected_dislikes else "Ninguna"
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Alimentos a evitar registrados: {dislike_text}\n\n"
                 "⚠️ **Paso 9E/10:** ¿Tienes alguna RESTRICCIÓN ESPECIAL?\n\n"
@@ -4643,7 +5257,7 @@ def process_profile_setup(telegram_id: str, message):
             keyboard.add("🕌 Halal", "✡️ Kosher")
             keyboard.add("⏭️ Sin restricciones especiales")
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 "✅ Alimentos adicionales registrados\n\n"
                 "⚠️ **Paso 9E/10:** ¿Tienes alguna RESTRICCIÓN ESPECIAL?\n\n"
@@ -4698,7 +5312,7 @@ def process_profile_setup(telegram_id: str, message):
                     selected_names = [name.replace("_", " ").title() for name in data["special_restrictions"]]
                     selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
                     
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         f"✅ **{selected.replace('_', ' ').title()}** añadido\n\n"
                         f"**Restricciones:** {selection_text}\n\n"
@@ -4706,7 +5320,7 @@ def process_profile_setup(telegram_id: str, message):
                     )
                     return  # Mantener en el mismo paso
                 else:
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         "❌ No reconocí esa opción. Por favor usa los botones o escribe: alergias, vegano, sin lactosa, sin gluten, halal, kosher, sin restricciones, o continuar."
                     )
@@ -4727,7 +5341,7 @@ def process_profile_setup(telegram_id: str, message):
             selected_restrictions = [name.replace("_", " ").title() for name in data["special_restrictions"]]
             restriction_text = ", ".join(selected_restrictions) if selected_restrictions else "Ninguna"
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Restricciones registradas: {restriction_text}\n\n"
                 "👨‍🍳 **Paso 9F/10:** ¿Qué MÉTODOS DE COCCIÓN prefieres?\n\n"
@@ -4787,7 +5401,7 @@ def process_profile_setup(telegram_id: str, message):
                     selected_names = [name.replace("_", " ").title() for name in data["cooking_methods"]]
                     selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
                     
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         f"✅ **{selected.replace('_', ' ').title()}** añadido\n\n"
                         f"**Métodos seleccionados:** {selection_text}\n\n"
@@ -4795,7 +5409,7 @@ def process_profile_setup(telegram_id: str, message):
                     )
                     return  # Mantener en el mismo paso
                 else:
-                    bot.send_message(
+                    enqueue_send(
                         message.chat.id,
                         "❌ No reconocí esa opción. Por favor usa los botones o escribe: horno, sarten, plancha, guisos, vapor, crudo, todos, sin preferencias, o continuar."
                     )
@@ -4810,7 +5424,7 @@ def process_profile_setup(telegram_id: str, message):
             selected_methods = [name.replace("_", " ").title() for name in data["cooking_methods"]]
             methods_text = ", ".join(selected_methods) if selected_methods else "Por defecto"
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"✅ Métodos de cocción registrados: {methods_text}\n\n"
                 "🎯 **Paso 10/10:** ¡Todo listo para crear tu perfil científico!\n\n"
@@ -4853,7 +5467,7 @@ def process_profile_setup(telegram_id: str, message):
                     break
             
             if not is_valid:
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     "❌ Para crear tu perfil, por favor:\n\n"
                     "• Usa el botón: ✅ Crear mi perfil nutricional\n"
@@ -4908,32 +5522,35 @@ def process_profile_setup(telegram_id: str, message):
                 
                 # Crear perfil usando el sistema científico
                 user_profile = meal_bot.profile_system.create_user_profile(telegram_id, profile_data)
+                user_profile["preferences_display"] = build_preferences_display(user_profile)
                 
                 # Guardar en la base de datos
-                meal_bot.data["users"][telegram_id] = user_profile
-                meal_bot.save_data()
+                meal_bot.save_user_profile(telegram_id, user_profile)
                 
                 # Limpiar estado de configuración
                 meal_bot.user_states[telegram_id] = {}
                 
                 # Mostrar resumen del perfil creado
+                energy_data = user_profile["energy_data"]
+                ea_status = energy_data["ea_status"]
+                macros = user_profile["macros"]
                 success_message = f"""
 🎉 **¡PERFIL NUTRICIONAL CREADO EXITOSAMENTE!**
 
 👤 **TU PERFIL CIENTÍFICO:**
 • Objetivo: {user_profile['basic_data']['objetivo_descripcion']}
 • BMR: {user_profile['body_composition']['bmr']} kcal/día
-• Available Energy: {user_profile['energy_data']['available_energy']} kcal/kg FFM/día
-• Estado: {user_profile['energy_data']['ea_status']['color']} {user_profile['energy_data']['ea_status']['description']}
+• Available Energy: {energy_data['available_energy']} kcal/kg FFM/día
+• Estado: {ea_status['color']} {ea_status['description']}
 
 🎯 **MACROS DIARIOS PERSONALIZADOS:**
-🔥 {user_profile['macros']['calories']} kcal totales
-🥩 {user_profile['macros']['protein_g']}g proteína
-🍞 {user_profile['macros']['carbs_g']}g carbohidratos  
-🥑 {user_profile['macros']['fat_g']}g grasas
+🔥 {macros['calories']} kcal totales
+🥩 {macros['protein_g']}g proteína
+🍞 {macros['carbs_g']}g carbohidratos  
+🥑 {macros['fat_g']}g grasas
 
 💡 **RECOMENDACIÓN CIENTÍFICA:**
-{user_profile['energy_data']['ea_status']['recommendation']}
+{ea_status['recommendation']}
 
 🚀 **¡YA PUEDES USAR EL SISTEMA V2.0!**
 
@@ -4955,14 +5572,14 @@ def process_profile_setup(telegram_id: str, message):
                 )
                 
             except Exception as e:
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     f"❌ Error creando el perfil: {str(e)}\n\n"
                     "Por favor, intenta de nuevo con /perfil"
                 )
         
     except ValueError as e:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             f"❌ Error: {str(e)}\n\n"
             "Por favor, introduce un valor válido."
@@ -5032,7 +5649,7 @@ def process_edit_liked_foods(telegram_id: str, message, data):
         selected_names = [name.replace("_", " ").title() for name in data["liked_foods"]]
         selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
         
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             f"✅ **{selected.replace('_', ' ').title()}** añadido\n\n"
             f"**Seleccionados:** {selection_text}\n\n"
@@ -5043,7 +5660,7 @@ def process_edit_liked_foods(telegram_id: str, message, data):
         # Actualizar estado
         meal_bot.user_states[telegram_id]["data"] = data
     else:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "❌ Opción no válida. Selecciona una de las opciones del teclado o usa **➡️ Continuar**.",
             parse_mode='Markdown'
@@ -5088,7 +5705,7 @@ def process_edit_disliked_foods(telegram_id: str, message, data):
         selected_names = [name.replace("_", " ").title() for name in data["disliked_foods"]]
         selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
         
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             f"✅ **{selected.replace('_', ' ').title()}** añadido a evitar\n\n"
             f"**A evitar:** {selection_text}\n\n"
@@ -5099,7 +5716,7 @@ def process_edit_disliked_foods(telegram_id: str, message, data):
         # Actualizar estado
         meal_bot.user_states[telegram_id]["data"] = data
     else:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "❌ Opción no válida. Selecciona una de las opciones del teclado o usa **➡️ Continuar**.",
             parse_mode='Markdown'
@@ -5136,7 +5753,7 @@ def process_edit_cooking_methods(telegram_id: str, message, data):
         selected_names = [name.replace("_", " ").title() for name in data["cooking_methods"]]
         selection_text = ", ".join(selected_names) if selected_names else "Ninguna"
         
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             f"✅ **{selected.replace('_', ' ').title()}** añadido\n\n"
             f"**Métodos seleccionados:** {selection_text}\n\n"
@@ -5147,7 +5764,7 @@ def process_edit_cooking_methods(telegram_id: str, message, data):
         # Actualizar estado
         meal_bot.user_states[telegram_id]["data"] = data
     else:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "❌ Opción no válida. Selecciona una de las opciones del teclado o usa **➡️ Continuar**.",
             parse_mode='Markdown'
@@ -5174,58 +5791,57 @@ def process_edit_training_schedule(telegram_id: str, message, data):
         # Guardar inmediatamente
         save_profile_edit_changes(telegram_id, "training_schedule", data)
     else:
-        bot.send_message(
-            message.chat.id,
-            "❌ Opción no válida. Selecciona una de las opciones del teclado.",
-            parse_mode='Markdown'
-        )
+        enqueue_send(message.chat.id, "❌ Opción no válida. Selecciona una de las opciones del teclado.")
 
 def save_profile_edit_changes(telegram_id: str, edit_section: str, data):
     """Guardar cambios de edición en el perfil del usuario"""
     try:
         user_profile = meal_bot.get_user_profile(telegram_id)
         if not user_profile:
-            bot.send_message(
+            enqueue_send(
                 telegram_id,
                 "❌ Error: No se pudo encontrar tu perfil."
             )
             return
         
-        # Actualizar según sección editada
-        if edit_section == "liked_foods":
-            user_profile["preferences"]["liked_foods"] = data.get("liked_foods", [])
-            updated_section = "Alimentos preferidos"
-            
-        elif edit_section == "disliked_foods":
-            user_profile["preferences"]["disliked_foods"] = data.get("disliked_foods", [])
-            updated_section = "Alimentos a evitar"
-            
-        elif edit_section == "cooking_methods":
-            user_profile["preferences"]["cooking_methods"] = data.get("cooking_methods", [])
-            updated_section = "Métodos de cocción"
+        with meal_bot.data_lock:
+            # Actualizar según sección editada
+            if edit_section == "liked_foods":
+                user_profile["preferences"]["liked_foods"] = data.get("liked_foods", [])
+                updated_section = "Alimentos preferidos"
+                
+            elif edit_section == "disliked_foods":
+                user_profile["preferences"]["disliked_foods"] = data.get("disliked_foods", [])
+                updated_section = "Alimentos a evitar"
+                
+            elif edit_section == "cooking_methods":
+                user_profile["preferences"]["cooking_methods"] = data.get("cooking_methods", [])
+                updated_section = "Métodos de cocción"
+                
+            elif edit_section == "training_schedule":
+                user_profile["exercise_profile"]["training_schedule"] = data.get("training_schedule", "variable")
+                user_profile["exercise_profile"]["training_schedule_desc"] = data.get("training_schedule_desc", "Variable/Cambia")
+                
+                # Recalcular timing dinámico de comidas
+                objetivo = user_profile["basic_data"]["objetivo"]
+                new_timing = meal_bot.profile_system.get_dynamic_meal_timing(
+                    data["training_schedule"], 
+                    objetivo
+                )
+                user_profile["exercise_profile"]["dynamic_meal_timing"] = new_timing
+                updated_section = "Horario de entrenamiento"
             
-        elif edit_section == "training_schedule":
-            user_profile["exercise_profile"]["training_schedule"] = data.get("training_schedule", "variable")
-            user_profile["exercise_profile"]["training_schedule_desc"] = data.get("training_schedule_desc", "Variable/Cambia")
+            # Recalcular textos de preferencias mostrados en /mis_macros
+            user_profile["preferences_display"] = build_preferences_display(user_profile)
             
-            # Recalcular timing dinámico de comidas
-            objetivo = user_profile["basic_data"]["objetivo"]
-            new_timing = meal_bot.profile_system.get_dynamic_meal_timing(
-                data["training_schedule"], 
-                objetivo
-            )
-            user_profile["exercise_profile"]["dynamic_meal_timing"] = new_timing
-            updated_section = "Horario de entrenamiento"
-        
-        # Guardar cambios en base de datos
-        meal_bot.data["users"][telegram_id] = user_profile
-        meal_bot.save_data()
+            # Guardar cambios en base de datos
+            meal_bot.save_user_profile(telegram_id, user_profile)
         
         # Limpiar estado de edición
         meal_bot.user_states[telegram_id] = {}
         
         # Confirmar cambios
-        bot.send_message(
+        enqueue_send(
             telegram_id,
             f"✅ **¡{updated_section} actualizado exitosamente!**\n\n"
             f"Tus preferencias han sido guardadas y se aplicarán en:\n"
@@ -5238,7 +5854,7 @@ def save_profile_edit_changes(telegram_id: str, edit_section: str, data):
         )
         
     except Exception as e:
-        bot.send_message(
+        enqueue_send(
             telegram_id,
             f"❌ Error al guardar cambios: {str(e)}\n\n"
             f"Por favor, intenta de nuevo."
@@ -5251,7 +5867,7 @@ def process_ai_search(telegram_id: str, query: str, message):
     
     user_profile = meal_bot.get_user_profile(telegram_id)
     if not user_profile:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "❌ **Error:** Necesitas configurar tu perfil primero.\n"
             "Usa /perfil para comenzar.",
@@ -5268,7 +5884,7 @@ def process_ai_search(telegram_id: str, query: str, message):
             total_found = result["total_found"]
             
             if total_found == 0:
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     f"🔍 **Búsqueda: '{query}'**\n\n"
                     "❌ No se encontraron recetas que cumplan tus criterios.\n\n"
@@ -5356,7 +5972,7 @@ Puedes elegir cualquiera de las recetas mostradas arriba o buscar más opciones.
 💡 **Tip:** Todas las recetas están validadas con ingredientes naturales y ajustadas a tus macros objetivo.
 """
             
-            bot.send_message(
+            enqueue_send(
                 message.chat.id, 
                 followup_text, 
                 parse_mode='Markdown',
@@ -5366,7 +5982,7 @@ Puedes elegir cualquiera de las recetas mostradas arriba o buscar más opciones.
         else:
             # Error en la generación
             error_msg = result.get("error", "Error desconocido")
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"❌ **Error en la búsqueda:**\n{error_msg}\n\n"
                 "💡 **Intenta:**\n"
@@ -5378,8 +5994,8 @@ Puedes elegir cualquiera de las recetas mostradas arriba o buscar más opciones.
             )
             
     except Exception as e:
-        logger.error(f"Error in AI search: {e}")
-        bot.send_message(
+        logger.error("Error in AI search: %s", e)
+        enqueue_send(
             message.chat.id,
             "❌ **Error técnico** procesando tu búsqueda.\n"
             "Inténtalo de nuevo en unos momentos.",
@@ -5447,23 +6063,9 @@ def handle_text_messages(message):
 """
         else:
             # Usuario sin perfil
-            help_text = """
-❓ **COMANDOS DISPONIBLES:**
-
-⚠️ **Primero configura tu perfil para personalización completa:**
-🆕 /perfil - Configurar perfil nutricional
-
-**COMANDOS BÁSICOS:**
-/menu - Menú semanal genérico
-/recetas - Explorar recetas
-/complementos - Ver complementos
-/buscar [consulta] - Buscar recetas con IA
-/generar - Generar receta específica
-
-💡 **¡Configura tu perfil para experiencia 100% personalizada!**
-"""
+            help_text = NO_PROFILE_HELP_TEXT
         
-        bot.send_message(message.chat.id, help_text, parse_mode='Markdown')
+        enqueue_send(message.chat.id, help_text, parse_mode='Markdown')
 
 def process_schedule_setup(telegram_id: str, message):
     """Procesar configuración de cronograma"""
@@ -5484,7 +6086,7 @@ def process_schedule_setup(telegram_id: str, message):
         # Guardar en perfil de usuario (cuando esté implementado)
         # user_profile["settings"]["cooking_schedule"] = schedule_id
         
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             f"✅ **Cronograma seleccionado:** {schedule_data['name']}\n\n"
             f"📝 **Descripción:** {schedule_data['description']}\n"
@@ -5502,7 +6104,7 @@ def process_schedule_setup(telegram_id: str, message):
         meal_bot.user_states[telegram_id] = {}
         
     else:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "❌ **Opción no válida**\n\n"
             "Por favor responde con A, B, C o D según tu preferencia."
@@ -5524,7 +6126,7 @@ def process_shopping_list_setup(telegram_id: str, message):
         days = days_mapping[choice]
         
         # Mostrar mensaje de procesamiento
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             f"🛒 **Generando lista de compras para {days} días...**\n\n"
             "⏳ Calculando cantidades según tus macros...\n"
@@ -5567,10 +6169,10 @@ def process_shopping_list_setup(telegram_id: str, message):
 **¡Lista personalizada 100% para tu perfil!**
 """
                 
-                bot.send_message(message.chat.id, confirmation_text, parse_mode='Markdown')
+                enqueue_send(message.chat.id, confirmation_text, parse_mode='Markdown')
                 
             else:
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     f"❌ **Error generando lista:**\n{shopping_result.get('error', 'Error desconocido')}\n\n"
                     "💡 **Intenta:**\n"
@@ -5581,7 +6183,7 @@ def process_shopping_list_setup(telegram_id: str, message):
                 )
         
         except Exception as e:
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"❌ **Error procesando solicitud:**\n{str(e)}\n\n"
                 "💡 Intenta usar `/lista_compras` de nuevo",
@@ -5592,7 +6194,7 @@ def process_shopping_list_setup(telegram_id: str, message):
         meal_bot.user_states[telegram_id] = {}
         
     else:
-        bot.send_message(
+        enqueue_send(
             message.chat.id,
             "❌ **Opción no válida**\n\n"
             "Por favor responde con A, B, C o D según la duración deseada."
@@ -5605,7 +6207,7 @@ def process_metric_entry(telegram_id: str, message):
     step = user_state.get("step", "value")
     
     if not metric_name:
-        bot.send_message(message.chat.id, "❌ Error: No se encontró la métrica a registrar")
+        enqueue_send(message.chat.id, "❌ Error: No se encontró la métrica a registrar")
         meal_bot.user_states[telegram_id] = {}
         return
     
@@ -5632,7 +6234,7 @@ def process_metric_entry(telegram_id: str, message):
             
             # Validar rango
             if not (min_val <= value <= max_val):
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     f"❌ **Valor fuera de rango**\n\n"
                     f"📊 **{metric_config.get('name', 'Métrica')}** debe estar entre "
@@ -5645,31 +6247,32 @@ def process_metric_entry(telegram_id: str, message):
             # Registrar métrica
             user_profile = meal_bot.get_user_profile(telegram_id)
             if not user_profile:
-                bot.send_message(message.chat.id, "❌ Error: No se encontró tu perfil")
+                enqueue_send(message.chat.id, "❌ Error: No se encontró tu perfil")
                 meal_bot.user_states[telegram_id] = {}
                 return
             
             # Mostrar mensaje de procesamiento
-            processing_msg = bot.send_message(
+            processing_msg = enqueue_send(
                 message.chat.id,
                 f"📊 **Registrando {metric_config.get('name', 'métrica')}...**\n\n"
                 "📈 Guardando datos\n"
                 "🎯 Calculando tendencias\n"
                 "💡 Generando insights\n\n"
                 "*Esto puede tomar unos segundos...*",
-                parse_mode='Markdown'
+                parse_mode='Markdown',
+                dedupe=False
             )
             
-            # Registrar la métrica
-            result = meal_bot.progress_tracker.record_metric(user_profile, metric_name, value, notes)
+            # Registrar la métrica (un reporte en segundo plano puede estar leyéndolas)
+            with meal_bot.data_lock:
+                result = meal_bot.progress_tracker.record_metric(user_profile, metric_name, value, notes)
+                if result["success"]:
+                    meal_bot.save_user_profile(telegram_id, user_profile)
             
             # Eliminar mensaje de procesamiento
-            bot.delete_message(message.chat.id, processing_msg.message_id)
+            enqueue_delete(message.chat.id, processing_msg)
             
             if result["success"]:
-                # Guardar perfil actualizado
-                meal_bot.database.save_user_profile(telegram_id, user_profile)
-                
                 # Formatear respuesta de éxito
                 metric_recorded = result["metric_recorded"]
                 trend_analysis = result["trend_analysis"]
@@ -5719,7 +6322,7 @@ def process_metric_entry(telegram_id: str, message):
                     types.InlineKeyboardButton("📈 Registrar Otra", callback_data="progress_record")
                 )
                 
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     "🎯 **¿Qué quieres hacer ahora?**",
                     parse_mode='Markdown',
@@ -5727,7 +6330,7 @@ def process_metric_entry(telegram_id: str, message):
                 )
                 
             else:
-                bot.send_message(
+                enqueue_send(
                     message.chat.id,
                     f"❌ **Error registrando métrica:**\n{result.get('error', 'Error desconocido')}\n\n"
                     "💡 Intenta de nuevo o usa `/progreso` para volver al menú principal",
@@ -5738,7 +6341,7 @@ def process_metric_entry(telegram_id: str, message):
             meal_bot.user_states[telegram_id] = {}
             
         except ValueError as e:
-            bot.send_message(
+            enqueue_send(
                 message.chat.id,
                 f"❌ **Formato no válido**\n\n"
                 f"📝 **Envía solo el número** (ejemplo: 75.2)\n"
@@ -5752,8 +6355,8 @@ def process_metric_entry(telegram_id: str, message):
             )
             
         except Exception as e:
-            logger.error(f"Error processing metric entry: {e}")
-            bot.send_message(
+            logger.error("Error processing metric entry: %s", e)
+            enqueue_send(
                 message.chat.id,
                 f"❌ **Error procesando métrica:**\n{str(e)}\n\n"
                 "💡 Intenta de nuevo o usa `/progreso` para volver al menú",
@@ -5783,7 +6386,7 @@ def setup_webhook():
     if USE_WEBHOOK and WEBHOOK_URL:
         webhook_url = f"{WEBHOOK_URL}{WEBHOOK_PATH}"
         bot.set_webhook(url=webhook_url)
-        logger.info(f"✅ Webhook configurado: {webhook_url}")
+        logger.info("✅ Webhook configurado: %s", webhook_url)
         return True
     return False
 
@@ -5791,23 +6394,24 @@ def setup_webhook():
 # CALLBACK HANDLERS - WEEKLY MENU CONFIGURATION
 # ========================================
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('menu_select_'))
+@callback_route('menu_select_')
+@safe_callback("❌ Error procesando selección")
 def handle_menu_recipe_selection(call):
     """Manejar selección de recetas para el menú semanal"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        # Extraer datos del callback
-        parts = call.data.split('_')
-        category = parts[2]  # desayuno, almuerzo, merienda, cena
-        recipe_id = parts[3]
-        
-        # Obtener perfil del usuario
-        user_profile = meal_bot.database.get_user_profile(telegram_id)
-        if not user_profile:
-            bot.answer_callback_query(call.id, "❌ Perfil no encontrado. Usa /perfil primero.")
-            return
-        
+    # Extraer datos del callback
+    parts = call.data.split('_')
+    category = parts[2]  # desayuno, almuerzo, merienda, cena
+    recipe_id = parts[3]
+    
+    # Obtener perfil del usuario
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile:
+        bot.answer_callback_query(call.id, "❌ Perfil no encontrado. Usa /perfil primero.")
+        return
+    
+    with meal_bot.data_lock:
         # Inicializar configuración del menú si no existe
         if "temp_menu_config" not in user_profile:
             user_profile["temp_menu_config"] = {}
@@ -5822,70 +6426,65 @@ def handle_menu_recipe_selection(call):
         
         # Agregar la receta seleccionada
         selected_recipes = user_profile["temp_menu_config"]["selected_recipes"]
-        if recipe_id not in selected_recipes[category]:
+        added = recipe_id not in selected_recipes[category]
+        if added:
             selected_recipes[category].append(recipe_id)
-            
-            # Obtener nombre de la receta para confirmación
-            available_recipes = meal_bot.weekly_menu_system.get_user_saved_recipes(user_profile)
-            recipe_name = "Receta seleccionada"
-            for recipe in available_recipes.get(category, []):
-                if recipe["id"] == recipe_id:
-                    recipe_name = recipe["name"]
-                    break
-            
-            bot.answer_callback_query(call.id, f"✅ {recipe_name} agregada a {category.title()}")
-        else:
-            bot.answer_callback_query(call.id, "⚠️ Esta receta ya está seleccionada para esta categoría")
         
         # Guardar cambios
-        meal_bot.database.save_user_profile(telegram_id, user_profile)
-        
-        # Actualizar el mensaje con la nueva selección
-        show_category_recipe_selection(call.message, telegram_id, category, edit_message=True)
+        meal_bot.save_user_profile(telegram_id, user_profile)
+    
+    if added:
+        # Obtener nombre de la receta para confirmación
+        available_recipes = meal_bot.get_user_saved_recipes(telegram_id, user_profile)
+        recipe_name = "Receta seleccionada"
+        for recipe in available_recipes.get(category, []):
+            if recipe["id"] == recipe_id:
+                recipe_name = recipe["name"]
+                break
         
-    except Exception as e:
-        logger.error(f"Error in menu recipe selection: {e}")
-        bot.answer_callback_query(call.id, "❌ Error procesando selección")
+        bot.answer_callback_query(call.id, f"✅ {recipe_name} agregada a {category.title()}")
+    else:
+        bot.answer_callback_query(call.id, "⚠️ Esta receta ya está seleccionada para esta categoría")
+    
+    # Actualizar el mensaje con la nueva selección
+    show_category_recipe_selection(call.message, telegram_id, category, edit_message=True)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('menu_next_'))
+@callback_route('menu_next_')
+@safe_callback("❌ Error avanzando categoría")
 def handle_menu_next_category(call):
     """Manejar avance a la siguiente categoría del menú"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        current_category = call.data.split('_')[2]
-        next_category = get_next_category(current_category)
-        
-        if next_category:
-            # Mostrar la siguiente categoría
-            show_category_recipe_selection(call.message, telegram_id, next_category, edit_message=True)
-            bot.answer_callback_query(call.id, f"➡️ Configurando {next_category.title()}")
-        else:
-            # Todas las categorías completadas, mostrar preview
-            generate_menu_preview_step(call.message, telegram_id, edit_message=True)
-            bot.answer_callback_query(call.id, "✅ Configuración completada")
-            
-    except Exception as e:
-        logger.error(f"Error in menu next category: {e}")
-        bot.answer_callback_query(call.id, "❌ Error avanzando categoría")
+    current_category = call.data.split('_')[2]
+    next_category = get_next_category(current_category)
+    
+    if next_category:
+        # Mostrar la siguiente categoría
+        show_category_recipe_selection(call.message, telegram_id, next_category, edit_message=True)
+        bot.answer_callback_query(call.id, f"➡️ Configurando {next_category.title()}")
+    else:
+        # Todas las categorías completadas, mostrar preview
+        generate_menu_preview_step(call.message, telegram_id, edit_message=True)
+        bot.answer_callback_query(call.id, "✅ Configuración completada")
 
-@bot.callback_query_handler(func=lambda call: call.data == 'menu_confirm')
+@callback_route('menu_confirm', exact=True)
+@safe_callback("❌ Error guardando menú")
 def handle_menu_confirm(call):
     """Confirmar y guardar el menú semanal configurado"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        # Obtener perfil del usuario
-        user_profile = meal_bot.database.get_user_profile(telegram_id)
-        if not user_profile or "temp_menu_config" not in user_profile:
-            bot.answer_callback_query(call.id, "❌ No hay configuración de menú temporal")
-            return
-        
-        selected_recipes = user_profile["temp_menu_config"]["selected_recipes"]
-        
-        # Crear distribución semanal
-        weekly_menu = meal_bot.weekly_menu_system.create_weekly_distribution(selected_recipes, user_profile)
-        
+    # Obtener perfil del usuario
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile or "temp_menu_config" not in user_profile:
+        bot.answer_callback_query(call.id, "❌ No hay configuración de menú temporal")
+        return
+    
+    selected_recipes = user_profile["temp_menu_config"]["selected_recipes"]
+    
+    # Crear distribución semanal
+    weekly_menu = meal_bot.weekly_menu_system.create_weekly_distribution(selected_recipes, user_profile)
+    
+    with meal_bot.data_lock:
         # Guardar configuración del menú
         config_id = meal_bot.weekly_menu_system.save_weekly_menu_configuration(
             telegram_id, weekly_menu, selected_recipes, user_profile
@@ -5893,64 +6492,58 @@ def handle_menu_confirm(call):
         
         # Limpiar configuración temporal
         del user_profile["temp_menu_config"]
-        meal_bot.database.save_user_profile(telegram_id, user_profile)
-        
-        # Mensaje de confirmación
-        bot.edit_message_text(
-            f"✅ **MENÚ SEMANAL GUARDADO**\n\n"
-            f"🆔 **ID de configuración:** `{config_id}`\n"
-            f"📅 **Estado:** Listo para usar\n\n"
-            f"🎯 **Próximos pasos:**\n"
-            f"• Tu menú está distribuido inteligentemente por 7 días\n"
-            f"• Recetas balanceadas según tus macros objetivo\n"
-            f"• Evita repeticiones consecutivas automáticamente\n\n"
-            f"💡 **Comandos útiles:**\n"
-            f"• `/generar` - Crear nuevas recetas específicas\n"
-            f"• `/buscar [plato]` - Encontrar recetas adicionales\n"
-            f"• `/configurar_menu` - Crear otro menú diferente\n\n"
-            f"**¡Tu meal prep semanal está listo!**",
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id,
-            parse_mode='Markdown'
-        )
-        
-        bot.answer_callback_query(call.id, "🎉 Menú guardado exitosamente")
-        
-    except Exception as e:
-        logger.error(f"Error confirming menu: {e}")
-        bot.answer_callback_query(call.id, "❌ Error guardando menú")
+        meal_bot.save_user_profile(telegram_id, user_profile)
+    
+    # Mensaje de confirmación
+    enqueue_edit(
+        call.message.chat.id,
+        call.message.message_id,
+        f"✅ **MENÚ SEMANAL GUARDADO**\n\n"
+        f"🆔 **ID de configuración:** `{config_id}`\n"
+        f"📅 **Estado:** Listo para usar\n\n"
+        f"🎯 **Próximos pasos:**\n"
+        f"• Tu menú está distribuido inteligentemente por 7 días\n"
+        f"• Recetas balanceadas según tus macros objetivo\n"
+        f"• Evita repeticiones consecutivas automáticamente\n\n"
+        f"💡 **Comandos útiles:**\n"
+        f"• `/generar` - Crear nuevas recetas específicas\n"
+        f"• `/buscar [plato]` - Encontrar recetas adicionales\n"
+        f"• `/configurar_menu` - Crear otro menú diferente\n\n"
+        f"**¡Tu meal prep semanal está listo!**",
+        priority=PRIORITY_CALLBACK,
+        parse_mode='Markdown'
+    )
+    
+    bot.answer_callback_query(call.id, "🎉 Menú guardado exitosamente")
 
-@bot.callback_query_handler(func=lambda call: call.data == 'menu_edit')
+@callback_route('menu_edit', exact=True)
+@safe_callback("❌ Error editando menú")
 def handle_menu_edit(call):
     """Volver a editar la configuración del menú"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        # Volver al primer paso de configuración
-        show_category_recipe_selection(call.message, telegram_id, "desayuno", edit_message=True)
-        bot.answer_callback_query(call.id, "✏️ Editando configuración")
-        
-    except Exception as e:
-        logger.error(f"Error editing menu: {e}")
-        bot.answer_callback_query(call.id, "❌ Error editando menú")
+    # Volver al primer paso de configuración
+    show_category_recipe_selection(call.message, telegram_id, "desayuno", edit_message=True)
+    bot.answer_callback_query(call.id, "✏️ Editando configuración")
 
-@bot.callback_query_handler(func=lambda call: call.data == 'menu_save_config')
+@callback_route('menu_save_config', exact=True)
+@safe_callback("❌ Error guardando configuración")
 def handle_menu_save_config(call):
     """Guardar configuración del menú como plantilla"""
     telegram_id = str(call.from_user.id)
     
-    try:
-        # Obtener perfil del usuario
-        user_profile = meal_bot.database.get_user_profile(telegram_id)
-        if not user_profile or "temp_menu_config" not in user_profile:
-            bot.answer_callback_query(call.id, "❌ No hay configuración para guardar")
-            return
-        
-        selected_recipes = user_profile["temp_menu_config"]["selected_recipes"]
-        
-        # Crear distribución semanal
-        weekly_menu = meal_bot.weekly_menu_system.create_weekly_distribution(selected_recipes, user_profile)
-        
+    # Obtener perfil del usuario
+    user_profile = meal_bot.get_user_profile(telegram_id)
+    if not user_profile or "temp_menu_config" not in user_profile:
+        bot.answer_callback_query(call.id, "❌ No hay configuración para guardar")
+        return
+    
+    selected_recipes = user_profile["temp_menu_config"]["selected_recipes"]
+    
+    # Crear distribución semanal
+    weekly_menu = meal_bot.weekly_menu_system.create_weekly_distribution(selected_recipes, user_profile)
+    
+    with meal_bot.data_lock:
         # Guardar como configuración guardada (no activa)
         config_id = meal_bot.weekly_menu_system.save_weekly_menu_configuration(
             telegram_id, weekly_menu, selected_recipes, user_profile
@@ -5962,30 +6555,27 @@ def handle_menu_save_config(call):
                 config["status"] = "draft"
                 break
         
-        meal_bot.database.save_user_profile(telegram_id, user_profile)
-        
-        bot.answer_callback_query(call.id, "💾 Configuración guardada como plantilla")
-        
-        # Actualizar mensaje
-        bot.edit_message_text(
-            f"💾 **CONFIGURACIÓN GUARDADA COMO PLANTILLA**\n\n"
-            f"🆔 **ID:** `{config_id}`\n"
-            f"📋 **Estado:** Plantilla guardada\n\n"
-            f"🎯 **Opciones:**\n"
-            f"• Usa `/configurar_menu` para crear otra configuración\n"
-            f"• Esta plantilla queda disponible para uso futuro\n"
-            f"• Puedes crear múltiples configuraciones diferentes\n\n"
-            f"**¡Plantilla guardada exitosamente!**",
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id,
-            parse_mode='Markdown'
-        )
-        
-    except Exception as e:
-        logger.error(f"Error saving menu config: {e}")
-        bot.answer_callback_query(call.id, "❌ Error guardando configuración")
+        meal_bot.save_user_profile(telegram_id, user_profile)
+    
+    bot.answer_callback_query(call.id, "💾 Configuración guardada como plantilla")
+    
+    # Actualizar mensaje
+    enqueue_edit(
+        call.message.chat.id,
+        call.message.message_id,
+        f"💾 **CONFIGURACIÓN GUARDADA COMO PLANTILLA**\n\n"
+        f"🆔 **ID:** `{config_id}`\n"
+        f"📋 **Estado:** Plantilla guardada\n\n"
+        f"🎯 **Opciones:**\n"
+        f"• Usa `/configurar_menu` para crear otra configuración\n"
+        f"• Esta plantilla queda disponible para uso futuro\n"
+        f"• Puedes crear múltiples configuraciones diferentes\n\n"
+        f"**¡Plantilla guardada exitosamente!**",
+        priority=PRIORITY_CALLBACK,
+        parse_mode='Markdown'
+    )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('approach_'))
+@callback_route('approach_')
 def handle_approach_callback(call):
     """Manejar la selección del enfoque dietético"""
     telegram_id = str(call.from_user.id)
@@ -6011,22 +6601,28 @@ def handle_approach_callback(call):
         bot.answer_callback_query(call.id, f"✅ Enfoque seleccionado: {approach_name}")
         
         # Continuar con el flujo normal del perfil
-        bot.send_message(
+        enqueue_send(
             call.message.chat.id,
             f"✅ **Enfoque seleccionado:** {approach_name}\n\n"
             "Perfecto, ahora continuemos con tu información física para calcular tus macros personalizados.\n\n"
             "📏 **Paso 1/9:** ¿Cuál es tu peso actual en kg?\n"
             "_(Ejemplo: 70)_",
-            parse_mode='Markdown'
+            parse_mode='Markdown',
+            priority=PRIORITY_CALLBACK
         )
         
     except Exception as e:
-        logger.error(f"Error processing approach selection: {e}")
+        logger.error("Error processing approach selection: %s", e)
         bot.answer_callback_query(call.id, "❌ Error procesando selección")
 
+def handle_sigterm(signum, frame):
+    """Convertir SIGTERM (parada de Railway) en SystemExit para que main cierre ordenadamente"""
+    raise SystemExit(0)
+
 def main():
     """Función principal"""
     logger.info("🚀 Iniciando Meal Prep Bot V2.0...")
+    signal.signal(signal.SIGTERM, handle_sigterm)
     
     try:
         # Intentar configurar webhook
@@ -6041,8 +6637,10 @@ def main():
             app.run(host='0.0.0.0', port=port, debug=False)
             
     except Exception as e:
-        logger.error(f"❌ Error al iniciar el bot: {e}")
+        logger.error("❌ Error al iniciar el bot: %s", e)
         raise
+    finally:
+        shutdown_bot()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -9,6 +9,8 @@ import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 
+from user_profile_system import recent_generated_recipes
+
 def format_menu_for_telegram(user_profile: Dict) -> str:
     """
     Formatear menú semanal personalizado para Telegram
@@ -328,7 +330,7 @@ def get_user_timing_recipes(user_profile: Dict, meal_category: str, timing_type:
     user_recipes = []
     
     # Obtener recetas recientes del usuario
-    recent_recipes = user_profile.get("recent_generated_recipes", [])
+    recent_recipes = recent_generated_recipes(user_profile)
     for recipe_data in recent_recipes:
         # Manejar tanto estructura nueva como antigua
         if isinstance(recipe_data, dict) and "recipe" in recipe_data:
@@ -667,7 +669,7 @@ def generate_personalized_recommendations(user_profile: Dict) -> str:
     # Comandos disponibles
     # Verificar si el usuario tiene recetas generadas
     has_user_recipes = False
-    recent_recipes = user_profile.get("recent_generated_recipes", [])
+    recent_recipes = recent_generated_recipes(user_profile)
     temp_options = user_profile.get("temp_recipe_options", {})
     if recent_recipes or temp_options:
         has_user_recipes = True
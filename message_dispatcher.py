@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sistema de envío asíncrono de mensajes a Telegram
+Saca las llamadas a la API del hilo del handler manteniendo el orden por chat
+y respetando el límite global de Telegram (~30 mensajes/segundo por bot)
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prioridades de envío (menor = antes)
+PRIORITY_CALLBACK = 0   # Respuestas a botones pulsados
+PRIORITY_COMMAND = 1    # Respuestas a comandos
+PRIORITY_BULK = 2       # Mensajes largos / difusiones
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Segundos de espera pedidos por Telegram en un error 429, o None si no es un 429"""
+    if getattr(error, "error_code", None) != 429:
+        return None
+    result_json = getattr(error, "result_json", None) or {}
+    return result_json.get("parameters", {}).get("retry_after", 1)
+
+class TokenBucket:
+    """Limitador token-bucket compartido; los turnos en espera se sirven por prioridad"""
+    
+    def __init__(self, rate: float = 30, per: float = 1.0):
+        self.capacity = rate
+        self.tokens = rate
+        self.fill_rate = rate / per
+        self.last_refill = time.monotonic()
+        
+        # Heap de turnos en espera: (prioridad, instante de encolado, secuencia)
+        self.waiting = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.fill_rate)
+        self.last_refill = now
+    
+    def backoff(self, seconds: float):
+        """Vaciar el bucket para que nadie envíe durante `seconds` (429 de Telegram)"""
+        with self.condition:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.fill_rate
+            self.condition.notify_all()
+    
+    def acquire(self, priority: int = PRIORITY_COMMAND):
+        """Bloquear hasta obtener un token, respetando el orden (prioridad, llegada)"""
+        ticket = (priority, time.monotonic(), next(self.counter))
+        
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            
+            while True:
+                is_next = self.waiting[0] == ticket
+                if is_next:
+                    self._refill()
+                    if self.tokens >= 1:
+                        heapq.heappop(self.waiting)
+                        self.tokens -= 1
+                        self.condition.notify_all()
+                        return
+                
+                # El primero espera al siguiente token; el resto, a que cambie el turno
+                timeout = (1 - self.tokens) / self.fill_rate if is_next else None
+                self.condition.wait(timeout)
+
+class MessageDispatcher:
+    
+    def __init__(self, max_workers: int = 8, rate_limit: float = 30, dedupe_window: float = 0.5):
+        # Pool compartido: chats distintos se atienden en paralelo
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tg-send")
+        
+        # Cola FIFO por chat; solo un worker drena cada chat a la vez
+        self.chat_queues: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+        
+        # Límite global de envíos por segundo
+        self.rate_limiter = TokenBucket(rate=rate_limit, per=1.0)
+        
+        # Envíos recientes para descartar duplicados: clave -> (instante, future)
+        self.dedupe_window = dedupe_window
+        self.recent_sends: Dict[Tuple[str, Hashable], Tuple[float, Future]] = {}
+    
+    def submit(self, chat_id: Any, func: Callable, *args, priority: int = PRIORITY_COMMAND,
+               dedupe_key: Optional[Hashable] = None, **kwargs) -> Future:
+        """
+        Encolar una llamada a la API de Telegram para un chat.
+        Las llamadas del mismo chat se ejecutan en orden de llegada.
+        Si dedupe_key coincide con un envío del mismo chat dentro de la
+        ventana de deduplicación, se devuelve el future del envío original.
+        """
+        chat_key = str(chat_id)  # telegram_id (str) y chat.id (int) son el mismo chat
+        
+        with self.lock:
+            if dedupe_key is not None:
+                now = time.monotonic()
+                recent = self.recent_sends.get((chat_key, dedupe_key))
+                if recent and now - recent[0] < self.dedupe_window:
+                    return recent[1]
+                self._prune_recent_sends(now)
+            
+            future = Future()
+            if dedupe_key is not None:
+                self.recent_sends[(chat_key, dedupe_key)] = (now, future)
+            
+            queue = self.chat_queues.get(chat_key)
+            if queue is None:
+                # No hay worker activo para este chat: crear cola y lanzarlo
+                self.chat_queues[chat_key] = deque([(func, args, kwargs, priority, future)])
+                self.executor.submit(self._drain, chat_key)
+            else:
+                queue.append((func, args, kwargs, priority, future))
+        
+        return future
+    
+    def _prune_recent_sends(self, now: float):
+        """Olvidar envíos fuera de la ventana de deduplicación"""
+        expired = [key for key, (sent_at, _) in self.recent_sends.items()
+                   if now - sent_at >= self.dedupe_window]
+        for key in expired:
+            del self.recent_sends[key]
+    
+    def _drain(self, chat_key: str):
+        """Ejecutar todas las llamadas pendientes de un chat"""
+        while True:
+            with self.lock:
+                queue = self.chat_queues[chat_key]
+                if not queue:
+                    del self.chat_queues[chat_key]
+                    return
+                func, args, kwargs, priority, future = queue.popleft()
+            
+            if not future.set_running_or_notify_cancel():
+                continue
+            
+            try:
+                future.set_result(self._call(func, args, kwargs, priority))
+            except Exception as e:
+                logger.error("Error sending Telegram request to chat %s: %s", chat_key, e)
+                future.set_exception(e)
+    
+    def call_now(self, func: Callable, *args, priority: int = PRIORITY_COMMAND, **kwargs) -> Any:
+        """
+        Hacer una llamada adicional desde una tarea que ya tiene el turno de su
+        chat (p.ej. enviar si falla una edición), sin saltarse el límite global
+        ni la espera ante 429. Encolarla la pondría detrás del resto del chat.
+        """
+        return self._call(func, args, kwargs, priority)
+    
+    def _call(self, func: Callable, args: tuple, kwargs: dict, priority: int) -> Any:
+        """
+        Ejecutar una llamada respetando el límite global. Si Telegram responde
+        429, se frena el bucket para todos los chats durante retry_after y se
+        reintenta una vez, en lugar de seguir martilleando la API.
+        """
+        self.rate_limiter.acquire(priority)
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            retry_after = retry_after_seconds(e)
+            if retry_after is None:
+                raise
+            logger.warning("Telegram rate limit hit, backing off %ss", retry_after)
+            self.rate_limiter.backoff(retry_after)
+            self.rate_limiter.acquire(priority)
+            return func(*args, **kwargs)
+    
+    def shutdown(self):
+        """Esperar a que se envíen los mensajes pendientes"""
+        self.executor.shutdown(wait=True)
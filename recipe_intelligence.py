@@ -40,6 +40,11 @@ class RecipeIntelligence:
             4: 1.0,   # Bueno - bonus moderado
             5: 2.0    # Excelente - bonus fuerte
         }
+        
+        # Puntuaciones ya calculadas, solo en memoria del proceso:
+        # id(perfil de inteligencia) -> (perfil, clave de instantánea, puntuación).
+        # No se guardan en el perfil, que se serializa desde otro hilo
+        self.score_snapshots = {}
     
     def learn_from_rating(self, user_profile: Dict, recipe_data: Dict, rating: int, feedback: str = "") -> Dict:
         """
@@ -102,7 +107,7 @@ class RecipeIntelligence:
                     "complexity_insights": complexity_learning
                 },
                 "updated_recommendations": updated_recommendations,
-                "intelligence_score": self._calculate_intelligence_score(intelligence_profile)
+                "intelligence_score": self.get_intelligence_score(intelligence_profile)
             }
             
         except Exception as e:
@@ -422,6 +427,9 @@ class RecipeIntelligence:
             user_profile["preferences"]["cooking_methods"] = list(set(
                 user_profile["preferences"].get("cooking_methods", []) + positive_methods
             ))
+        
+        # Las preferencias cambiaron: descartar textos precalculados del perfil
+        user_profile.pop("preferences_display", None)
     
     def _generate_intelligent_recommendations(self, intelligence_profile: Dict) -> Dict:
         """
@@ -464,6 +472,30 @@ class RecipeIntelligence:
             "complexity_preference": "complex" if learned_prefs["complexity_preference"] > 0.2 else "simple" if learned_prefs["complexity_preference"] < -0.2 else "moderate"
         }
     
+    def get_intelligence_score(self, intelligence_profile: Dict) -> float:
+        """
+        Puntuación de inteligencia, memorizada por perfil en memoria del proceso.
+        Solo se recalcula con valoraciones nuevas o al cambiar de día (recencia)
+        """
+        if not intelligence_profile:
+            return 0.0
+        
+        ratings_history = intelligence_profile["ratings_history"]
+        snapshot_key = [
+            intelligence_profile["basic_statistics"]["total_ratings"],
+            ratings_history[-1]["timestamp"] if ratings_history else None,
+            datetime.now().date().isoformat()
+        ]
+        
+        # Guardar la referencia al perfil evita confundirlo con otro que reutilice su id
+        snapshot = self.score_snapshots.get(id(intelligence_profile))
+        if snapshot and snapshot[0] is intelligence_profile and snapshot[1] == snapshot_key:
+            return snapshot[2]
+        
+        score = self._calculate_intelligence_score(intelligence_profile)
+        self.score_snapshots[id(intelligence_profile)] = (intelligence_profile, snapshot_key, score)
+        return score
+    
     def _calculate_intelligence_score(self, intelligence_profile: Dict) -> float:
         """
         Calcular puntuación de inteligencia del sistema (0-100)
@@ -678,7 +710,7 @@ class RecipeIntelligence:
         return {
             "insights_available": True,
             "total_data_points": stats.get("total_ratings", 0),
-            "confidence_level": self._calculate_intelligence_score(intelligence_profile),
+            "confidence_level": self.get_intelligence_score(intelligence_profile),
             "ingredient_insights": ingredient_insights,
             "method_insights": method_insights,
             "nutrition_insights": nutrition_insights,
@@ -788,7 +820,7 @@ class RecipeIntelligence:
     
     def _calculate_recommendation_strength(self, intelligence_profile: Dict) -> str:
         """Calcular fuerza de las recomendaciones"""
-        score = self._calculate_intelligence_score(intelligence_profile)
+        score = self.get_intelligence_score(intelligence_profile)
         
         if score > 75:
             return "very_strong"
@@ -809,7 +841,7 @@ class RecipeIntelligence:
         stats = intelligence_profile["basic_statistics"]
         learned_prefs = intelligence_profile["learned_preferences"]
         recommendations = self._generate_intelligent_recommendations(intelligence_profile)
-        intelligence_score = self._calculate_intelligence_score(intelligence_profile)
+        intelligence_score = self.get_intelligence_score(intelligence_profile)
         
         # Encabezado
         text = f"""
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests del guardado diferido, las cachés por usuario, las recetas generadas,
+el enrutado de callbacks, los botones de favoritos y la deduplicación de envíos
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import meal_bot as meal_bot_module
+from meal_bot import (
+    CALLBACK_ROUTES, MealPrepBotV2, callback_route, create_favorite_buttons, dispatch_callback,
+    enqueue_send, handle_favorite_callback
+)
+
+class MealBotTestCase(unittest.TestCase):
+    """Bot con una base de datos propia en un directorio temporal (ahí van también los backups)"""
+
+    def setUp(self):
+        # El constructor lee recipes_new.json del repositorio: crear el bot antes de cambiar de directorio
+        self.meal_bot = MealPrepBotV2()
+        self.meal_bot.data = {"users": {"1": {"name": "uno"}, "2": {"name": "dos"}}}
+        self.meal_bot.save_delay = 0.05
+
+        self.previous_cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        self.meal_bot.database_file = "database.json"
+
+    def tearDown(self):
+        with self.meal_bot.save_lock:
+            timer = self.meal_bot.save_timer
+            self.meal_bot.save_timer = None
+        if timer is not None:
+            timer.cancel()
+
+        os.chdir(self.previous_cwd)
+        self.tmp_dir.cleanup()
+
+class ScheduleSaveTest(MealBotTestCase):
+
+    def test_burst_of_saves_is_written_once(self):
+        with mock.patch.object(self.meal_bot, "save_data", return_value=True) as save_data:
+            for _ in range(5):
+                self.meal_bot.schedule_save()
+            time.sleep(0.3)
+
+        self.assertEqual(save_data.call_count, 1)
+        self.assertIsNone(self.meal_bot.save_timer)
+
+    def test_flush_writes_pending_save_now(self):
+        with mock.patch.object(self.meal_bot, "save_data", return_value=True) as save_data:
+            self.meal_bot.schedule_save()
+            self.assertTrue(self.meal_bot.flush_pending_save())
+            time.sleep(0.1)
+
+        self.assertEqual(save_data.call_count, 1)
+
+    def test_flush_without_pending_save_does_nothing(self):
+        with mock.patch.object(self.meal_bot, "save_data") as save_data:
+            self.assertTrue(self.meal_bot.flush_pending_save())
+        save_data.assert_not_called()
+
+    def test_failed_save_is_rescheduled(self):
+        with mock.patch.object(self.meal_bot, "save_data", return_value=False):
+            self.meal_bot.schedule_save()
+            self.assertFalse(self.meal_bot.flush_pending_save())
+
+        self.assertIsNotNone(self.meal_bot.save_timer)
+
+class WriteDataTest(MealBotTestCase):
+
+    def read_database(self):
+        with open("database.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_writes_database_without_leaving_temp_file(self):
+        self.assertTrue(self.meal_bot.save_data())
+
+        self.assertEqual(self.read_database(), self.meal_bot.data)
+        self.assertFalse(os.path.exists("database.json.tmp"))
+
+    def test_previous_database_is_backed_up(self):
+        self.assertTrue(self.meal_bot.save_data())
+        self.meal_bot.data["users"]["3"] = {"name": "tres"}
+        self.assertTrue(self.meal_bot.save_data())
+
+        backups = [name for name in os.listdir(".") if name.startswith("backup_v2_")]
+        self.assertEqual(len(backups), 1)
+        self.assertEqual(len(self.read_database()["users"]), 3)
+
+    def test_serialization_error_keeps_previous_database(self):
+        self.assertTrue(self.meal_bot.save_data())
+        previous = self.read_database()
+
+        self.meal_bot.data["users"]["3"] = {"name": object()}
+        self.assertFalse(self.meal_bot.save_data())
+
+        self.assertEqual(self.read_database(), previous)
+
+    def test_failed_replace_keeps_previous_database(self):
+        self.assertTrue(self.meal_bot.save_data())
+        previous = self.read_database()
+
+        self.meal_bot.data["users"]["3"] = {"name": "tres"}
+        with mock.patch("meal_bot.os.replace", side_effect=OSError("disk full")):
+            self.assertFalse(self.meal_bot.save_data())
+
+        self.assertEqual(self.read_database(), previous)
+
+class UserCacheTest(MealBotTestCase):
+
+    def test_result_is_cached_until_profile_changes(self):
+        version = self.meal_bot.get_cache_version("1")
+        self.meal_bot.store_cached_result("1", "schedule", "p", {"success": True}, version)
+        self.assertEqual(self.meal_bot.get_cached_result("1", "schedule", "p", 60), {"success": True})
+
+        self.meal_bot.invalidate_user_caches("1")
+        self.assertIsNone(self.meal_bot.get_cached_result("1", "schedule", "p", 60))
+
+    def test_result_computed_across_invalidation_is_dropped(self):
+        version = self.meal_bot.get_cache_version("1")
+        self.meal_bot.invalidate_user_caches("1")  # el perfil se guarda mientras se calcula
+        self.meal_bot.store_cached_result("1", "schedule", "p", {"success": True}, version)
+
+        self.assertIsNone(self.meal_bot.get_cached_result("1", "schedule", "p", 60))
+
+    def test_invalidation_only_affects_that_user(self):
+        for telegram_id in ("1", "2"):
+            version = self.meal_bot.get_cache_version(telegram_id)
+            self.meal_bot.store_cached_result(telegram_id, "schedule", "p", {"success": True}, version)
+
+        with mock.patch.object(self.meal_bot, "schedule_save"):
+            self.meal_bot.save_user_profile("1", {"name": "uno"})
+
+        self.assertIsNone(self.meal_bot.get_cached_result("1", "schedule", "p", 60))
+        self.assertEqual(self.meal_bot.get_cached_result("2", "schedule", "p", 60), {"success": True})
+
+    def test_expired_result_is_not_returned(self):
+        version = self.meal_bot.get_cache_version("1")
+        self.meal_bot.store_cached_result("1", "schedule", "p", {"success": True}, version)
+        self.assertIsNone(self.meal_bot.get_cached_result("1", "schedule", "p", 0))
+
+    def test_failed_results_are_not_cached(self):
+        version = self.meal_bot.get_cache_version("1")
+        self.meal_bot.store_cached_result("1", "schedule", "p", {"success": False}, version)
+        self.assertIsNone(self.meal_bot.get_cached_result("1", "schedule", "p", 60))
+
+    def test_rendered_text_is_not_stored_across_invalidation(self):
+        def render():
+            self.meal_bot.invalidate_user_caches("1")
+            return "texto"
+
+        self.assertEqual(self.meal_bot.get_rendered_text("1", "vista", render), "texto")
+        self.assertEqual(self.meal_bot.get_rendered_text("1", "vista", lambda: "nuevo"), "nuevo")
+        self.assertEqual(self.meal_bot.get_rendered_text("1", "vista", lambda: "otro"), "nuevo")
+
+class SaveGeneratedRecipeTest(MealBotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(self.meal_bot, "schedule_save")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recipes_saved_in_the_same_second_get_distinct_ids(self):
+        for i in range(3):
+            self.meal_bot.save_generated_recipe("1", {"nombre": f"Receta {i}"}, "almuerzo", {"score": 80})
+
+        profile = self.meal_bot.data["users"]["1"]
+        ids = [entry["id"] for entry in profile["generated_recipes"]]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(profile["recent_ids"], ids[::-1])
+
+    def test_callback_data_fits_telegram_limit(self):
+        telegram_id = "9" * 16
+        self.meal_bot.data["users"][telegram_id] = {}
+        self.meal_bot.save_generated_recipe(telegram_id, {"nombre": "Receta"}, "cena", {})
+
+        recipe_id = self.meal_bot.data["users"][telegram_id]["recent_ids"][-1]
+        for callback_data in (f"rate_recipe_{recipe_id}", f"fav_remove_{recipe_id}", f"rating_{recipe_id}_5"):
+            self.assertLessEqual(len(callback_data.encode()), 64)
+
+    def test_recent_ids_keep_last_ten(self):
+        for i in range(12):
+            self.meal_bot.save_generated_recipe("1", {"nombre": f"Receta {i}"}, "almuerzo", {})
+
+        profile = self.meal_bot.data["users"]["1"]
+        self.assertEqual(len(profile["recent_ids"]), 10)
+        self.assertEqual(profile["recent_ids"][-1], profile["generated_recipes"][0]["id"])
+
+    def test_legacy_recent_list_is_migrated_to_ids(self):
+        self.meal_bot.data["users"]["1"]["recent_generated_recipes"] = [
+            {"recipe": {"recipe_id": "1_20261001_090000", "nombre": "Antigua"}}
+        ]
+        self.meal_bot.save_generated_recipe("1", {"nombre": "Nueva"}, "almuerzo", {})
+
+        profile = self.meal_bot.data["users"]["1"]
+        self.assertNotIn("recent_generated_recipes", profile)
+        self.assertEqual(profile["recent_ids"][0], "1_20261001_090000")
+
+class CallbackRoutesTest(unittest.TestCase):
+    """Rutas de prueba bajo el segmento 'zztest', que no usa ningún handler real"""
+
+    def setUp(self):
+        self.calls = []
+
+    def tearDown(self):
+        CALLBACK_ROUTES.pop("zztest", None)
+
+    def route(self, prefix, exact=False):
+        def handler(call):
+            self.calls.append((prefix, call.data))
+            return prefix
+        return callback_route(prefix, exact=exact)(handler)
+
+    def dispatch(self, data):
+        return dispatch_callback(SimpleNamespace(data=data))
+
+    def test_prefix_route_matches_longer_data(self):
+        self.route("zztest_item_")
+        self.assertEqual(self.dispatch("zztest_item_42"), "zztest_item_")
+        self.assertEqual(self.calls, [("zztest_item_", "zztest_item_42")])
+
+    def test_exact_route_only_matches_same_data(self):
+        self.route("zztest_view", exact=True)
+        self.route("zztest_")
+
+        self.assertEqual(self.dispatch("zztest_view"), "zztest_view")
+        self.assertEqual(self.dispatch("zztest_view_all"), "zztest_")
+
+    def test_first_registered_route_wins(self):
+        self.route("zztest_more_")
+        self.route("zztest_")
+
+        self.assertEqual(self.dispatch("zztest_more_1"), "zztest_more_")
+        self.assertEqual(self.dispatch("zztest_other"), "zztest_")
+
+    def test_unknown_data_is_ignored(self):
+        self.route("zztest_item_")
+
+        self.assertIsNone(self.dispatch("zztest_other"))
+        self.assertIsNone(self.dispatch("zzunknown_item_1"))
+        self.assertIsNone(self.dispatch(None))
+        self.assertEqual(self.calls, [])
+
+    def test_routes_are_indexed_by_first_segment(self):
+        self.route("zztest_item_")
+        self.assertEqual([prefix for prefix, _, _ in CALLBACK_ROUTES["zztest"]], ["zztest_item_"])
+
+class FavoriteCallbackTest(unittest.TestCase):
+    """handle_favorite_callback sobre el bot global, sin llamadas a Telegram"""
+
+    telegram_id = "424242"
+
+    def setUp(self):
+        self.profile = {"favorites": {"recipe_ids": [], "last_updated": None}}
+        users = meal_bot_module.meal_bot.data["users"]
+        patches = [
+            mock.patch.dict(users, {self.telegram_id: self.profile}),
+            mock.patch.object(meal_bot_module.meal_bot, "schedule_save"),
+            mock.patch.object(meal_bot_module.bot, "answer_callback_query"),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        submit = mock.patch.object(meal_bot_module.dispatcher, "submit")
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+
+    def tap(self, data, reply_markup):
+        call = SimpleNamespace(
+            id="1", data=data,
+            from_user=SimpleNamespace(id=int(self.telegram_id)),
+            message=SimpleNamespace(chat=SimpleNamespace(id=1), message_id=10, reply_markup=reply_markup)
+        )
+        handle_favorite_callback(call)
+
+    def test_add_updates_profile_and_keyboard(self):
+        self.tap("fav_add_r1", create_favorite_buttons(self.profile, "r1"))
+
+        self.assertEqual(self.profile["favorites"]["recipe_ids"], ["r1"])
+        self.assertEqual(self.submit.call_count, 1)
+
+    def test_double_tap_does_not_edit_up_to_date_keyboard(self):
+        self.profile["favorites"]["recipe_ids"].append("r1")
+        with mock.patch.object(meal_bot_module.meal_bot, "save_user_profile") as save_user_profile:
+            self.tap("fav_add_r1", create_favorite_buttons(self.profile, "r1"))
+
+        save_user_profile.assert_not_called()
+        self.submit.assert_not_called()
+
+    def test_stale_keyboard_is_corrected_without_saving(self):
+        # Añadida desde otro mensaje: este aún muestra "Añadir a favoritos"
+        stale_markup = create_favorite_buttons(self.profile, "r1")
+        self.profile["favorites"]["recipe_ids"].append("r1")
+
+        with mock.patch.object(meal_bot_module.meal_bot, "save_user_profile") as save_user_profile:
+            self.tap("fav_add_r1", stale_markup)
+
+        save_user_profile.assert_not_called()
+        self.assertEqual(self.submit.call_count, 1)
+        new_markup = self.submit.call_args.kwargs["reply_markup"]
+        self.assertEqual(new_markup.to_dict(), create_favorite_buttons(self.profile, "r1").to_dict())
+
+class EnqueueSendDedupeTest(unittest.TestCase):
+
+    def setUp(self):
+        submit = mock.patch.object(meal_bot_module.dispatcher, "submit")
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+
+    def dedupe_key(self):
+        return self.submit.call_args.kwargs["dedupe_key"]
+
+    def test_key_includes_text_and_options(self):
+        enqueue_send(1, "hola", parse_mode='Markdown')
+        plain = self.dedupe_key()
+        enqueue_send(1, "hola", parse_mode='Markdown', reply_markup=create_favorite_buttons({}, "r1"))
+        with_keyboard = self.dedupe_key()
+
+        self.assertEqual(plain[0], "hola")
+        self.assertNotEqual(plain, with_keyboard)
+
+    def test_same_keyboard_gives_same_key(self):
+        enqueue_send(1, "hola", reply_markup=create_favorite_buttons({}, "r1"))
+        first = self.dedupe_key()
+        enqueue_send(1, "hola", reply_markup=create_favorite_buttons({}, "r1"))
+        self.assertEqual(self.dedupe_key(), first)
+
+    def test_placeholder_sends_are_not_deduplicated(self):
+        enqueue_send(1, "procesando...", dedupe=False)
+        self.assertIsNone(self.dedupe_key())
+        self.assertNotIn("dedupe", self.submit.call_args.kwargs)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests del dispatcher de mensajes (sin Telegram: las llamadas son funciones locales)
+"""
+
+import threading
+import time
+import unittest
+
+from message_dispatcher import MessageDispatcher, TokenBucket, retry_after_seconds
+
+class FakeApiError(Exception):
+    """Error con la forma de ApiTelegramException (error_code y result_json)"""
+
+    def __init__(self, error_code: int, retry_after: float = None):
+        super().__init__(f"Error code: {error_code}")
+        self.error_code = error_code
+        self.result_json = {"parameters": {"retry_after": retry_after}} if retry_after is not None else {}
+
+class RetryAfterSecondsTest(unittest.TestCase):
+
+    def test_429_returns_retry_after(self):
+        self.assertEqual(retry_after_seconds(FakeApiError(429, retry_after=3)), 3)
+
+    def test_429_without_parameters_defaults_to_one_second(self):
+        self.assertEqual(retry_after_seconds(FakeApiError(429)), 1)
+
+    def test_other_errors_return_none(self):
+        self.assertIsNone(retry_after_seconds(FakeApiError(400)))
+        self.assertIsNone(retry_after_seconds(ValueError("boom")))
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_backoff_delays_acquire(self):
+        bucket = TokenBucket(rate=100, per=1.0)
+        bucket.backoff(0.2)
+
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_acquire_is_immediate_with_tokens(self):
+        bucket = TokenBucket(rate=100, per=1.0)
+
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+class MessageDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = MessageDispatcher(max_workers=4, rate_limit=1000, dedupe_window=0.1)
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+
+    def test_calls_for_one_chat_run_in_order(self):
+        calls = []
+        lock = threading.Lock()
+
+        def record(value):
+            time.sleep(0.001)
+            with lock:
+                calls.append(value)
+            return value
+
+        futures = [self.dispatcher.submit(42, record, i) for i in range(50)]
+        self.assertEqual([future.result(timeout=5) for future in futures], list(range(50)))
+        self.assertEqual(calls, list(range(50)))
+
+    def test_int_and_str_chat_ids_share_a_queue(self):
+        calls = []
+        futures = [
+            self.dispatcher.submit(7 if i % 2 else "7", calls.append, i)
+            for i in range(20)
+        ]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(calls, list(range(20)))
+
+    def test_same_dedupe_key_within_window_returns_same_future(self):
+        calls = []
+        first = self.dispatcher.submit(1, calls.append, "hola", dedupe_key="hola")
+        second = self.dispatcher.submit(1, calls.append, "hola", dedupe_key="hola")
+
+        self.assertIs(first, second)
+        first.result(timeout=5)
+        self.assertEqual(calls, ["hola"])
+
+    def test_same_dedupe_key_after_window_is_sent_again(self):
+        calls = []
+        first = self.dispatcher.submit(1, calls.append, "hola", dedupe_key="hola")
+        first.result(timeout=5)
+        time.sleep(0.15)
+        second = self.dispatcher.submit(1, calls.append, "hola", dedupe_key="hola")
+
+        self.assertIsNot(first, second)
+        second.result(timeout=5)
+        self.assertEqual(calls, ["hola", "hola"])
+
+    def test_dedupe_is_per_chat(self):
+        first = self.dispatcher.submit(1, lambda: None, dedupe_key="hola")
+        second = self.dispatcher.submit(2, lambda: None, dedupe_key="hola")
+        self.assertIsNot(first, second)
+
+    def test_429_is_retried_once(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise FakeApiError(429, retry_after=0.1)
+            return "ok"
+
+        self.assertEqual(self.dispatcher.submit(1, flaky).result(timeout=5), "ok")
+        self.assertEqual(len(attempts), 2)
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.05)
+
+    def test_second_429_is_raised(self):
+        attempts = []
+
+        def always_limited():
+            attempts.append(1)
+            raise FakeApiError(429, retry_after=0.01)
+
+        with self.assertRaises(FakeApiError):
+            self.dispatcher.submit(1, always_limited).result(timeout=5)
+        self.assertEqual(len(attempts), 2)
+
+    def test_other_errors_are_not_retried(self):
+        attempts = []
+
+        def broken():
+            attempts.append(1)
+            raise FakeApiError(400)
+
+        with self.assertRaises(FakeApiError):
+            self.dispatcher.submit(1, broken).result(timeout=5)
+        self.assertEqual(len(attempts), 1)
+
+    def test_call_now_keeps_the_chat_turn(self):
+        calls = []
+
+        def first():
+            calls.append("first")
+            self.dispatcher.call_now(calls.append, "fallback")
+
+        futures = [
+            self.dispatcher.submit(1, first),
+            self.dispatcher.submit(1, calls.append, "second")
+        ]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(calls, ["first", "fallback", "second"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests de la reconstrucción de recetas recientes para valoración
+"""
+
+import unittest
+
+from user_profile_system import find_recent_generated_recipe, recent_generated_recipes
+
+def generated_entry(recipe_id: str, name: str, timing: str = "almuerzo") -> dict:
+    return {
+        "id": recipe_id,
+        "generated_date": "2026-10-17T12:00:00",
+        "timing_category": timing,
+        "recipe_data": {"nombre": name},
+        "validation_score": 80,
+        "validation": {"score": 80},
+        "user_rating": None
+    }
+
+class RecentGeneratedRecipesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = {
+            "generated_recipes": [
+                generated_entry("1_20261017_120000_000002", "Lentejas", "cena"),
+                generated_entry("1_20261017_120000_000001", "Arroz")
+            ],
+            "recent_ids": ["1_20261017_120000_000001", "1_20261017_120000_000002"]
+        }
+
+    def test_rebuilds_recipes_in_recent_ids_order(self):
+        recent = recent_generated_recipes(self.profile)
+
+        self.assertEqual([item["recipe"]["nombre"] for item in recent], ["Arroz", "Lentejas"])
+        self.assertEqual(recent[1]["timing_category"], "cena")
+        self.assertEqual(recent[1]["recipe"]["recipe_id"], "1_20261017_120000_000002")
+        self.assertEqual(recent[1]["recipe"]["categoria_timing"], "cena")
+        self.assertEqual(recent[1]["validation"], {"score": 80})
+
+    def test_does_not_modify_stored_recipe_data(self):
+        recent_generated_recipes(self.profile)
+        self.assertEqual(self.profile["generated_recipes"][0]["recipe_data"], {"nombre": "Lentejas"})
+
+    def test_skips_ids_no_longer_in_generated_recipes(self):
+        self.profile["recent_ids"].insert(0, "1_20261001_090000_000000")
+        recent = recent_generated_recipes(self.profile)
+        self.assertEqual(len(recent), 2)
+
+    def test_legacy_profile_keeps_its_stored_list(self):
+        legacy = [{"recipe": {"recipe_id": "viejo", "nombre": "Antigua"}}]
+        profile = {"recent_generated_recipes": legacy}
+        self.assertIs(recent_generated_recipes(profile), legacy)
+
+    def test_profile_without_recipes(self):
+        self.assertEqual(recent_generated_recipes({}), [])
+        self.assertEqual(recent_generated_recipes({"recent_ids": []}), [])
+
+    def test_find_recipes_generated_in_the_same_second(self):
+        first = find_recent_generated_recipe(self.profile, "1_20261017_120000_000001")
+        second = find_recent_generated_recipe(self.profile, "1_20261017_120000_000002")
+
+        self.assertEqual(first["recipe"]["nombre"], "Arroz")
+        self.assertEqual(second["recipe"]["nombre"], "Lentejas")
+        self.assertIsNone(find_recent_generated_recipe(self.profile, "1_20261017_120000"))
+
+if __name__ == "__main__":
+    unittest.main()
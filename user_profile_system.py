@@ -402,6 +402,46 @@ class UserProfileSystem:
         favorites = self.get_user_favorites(user_profile)
         return recipe_id in favorites
 
+def recent_generated_recipes(user_profile: Dict) -> List[Dict]:
+    """
+    Reconstruir las recetas recientes para valoración (más antigua primero)
+    a partir de generated_recipes + recent_ids, sin duplicar datos en el perfil.
+    Los perfiles antiguos sin recent_ids conservan su lista recent_generated_recipes.
+    """
+    recent_ids = user_profile.get("recent_ids")
+    if recent_ids is None:
+        return user_profile.get("recent_generated_recipes", [])
+    
+    entries_by_id = {entry["id"]: entry for entry in user_profile.get("generated_recipes", [])}
+    
+    recent_recipes = []
+    for recipe_id in recent_ids:
+        entry = entries_by_id.get(recipe_id)
+        if not entry:
+            continue
+        
+        recipe = dict(entry["recipe_data"])
+        recipe["recipe_id"] = entry["id"]
+        recipe["generated_at"] = entry["generated_date"]
+        recipe["categoria_timing"] = entry["timing_category"]
+        
+        recent_recipes.append({
+            "recipe": recipe,
+            "timing_category": entry["timing_category"],
+            "validation": entry.get("validation", {"score": entry.get("validation_score", 0)}),
+            "generated_date": entry["generated_date"]
+        })
+    
+    return recent_recipes
+
+def find_recent_generated_recipe(user_profile: Dict, recipe_id: str) -> Optional[Dict]:
+    """Buscar una receta reciente (con su timing y validación) por su recipe_id"""
+    return next(
+        (item for item in recent_generated_recipes(user_profile)
+         if item["recipe"].get("recipe_id") == recipe_id),
+        None
+    )
+
 # Ejemplo de uso para testing
 if __name__ == "__main__":
     profile_system = UserProfileSystem("recipes_new.json")
@@ -11,6 +11,8 @@ import random
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 
+from user_profile_system import recent_generated_recipes
+
 class WeeklyMenuSystem:
     
     def __init__(self, database_file: str):
@@ -28,7 +30,7 @@ class WeeklyMenuSystem:
         """
         # Buscar recetas en favoritos y recetas generadas recientemente
         favorites = user_profile.get("favorites", {}).get("recipe_ids", [])
-        recent_recipes = user_profile.get("recent_generated_recipes", [])
+        recent_recipes = recent_generated_recipes(user_profile)
         temp_options = user_profile.get("temp_recipe_options", {})
         
         # Organizar por categoría